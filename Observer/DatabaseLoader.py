@@ -0,0 +1,218 @@
+"""
+This program has been created as part of the MST lab lecture of the institute
+of micromechanics TU Wien.
+This script contains a loader, that reads many database files written by
+Sentinel.py in parallel. Each file is read by a worker of a process pool, and
+the results of the files are merged per table in time order. Optionally the
+workers reduce the values to a min/max envelope (see Decimation) before they
+are sent back, so only few values have to be transferred between the
+processes. Files that can not be read are counted, and their data is left out.
+
+Author: David FREISMUTH
+Date: DEC 2019
+License:
+"""
+
+# Python imports
+import multiprocessing
+import sqlite3
+
+# Third party imports
+import numpy as np
+
+# Project imports
+import DatabaseReader
+import Decimation
+
+# CLASSES ----------------------------------------------------------------------
+
+class DatabaseLoader:
+    """
+    Reads database files in parallel. The process pool is kept until close()
+    is called, so it can be reused for repeated loads, e.g. when zooming.
+    """
+
+    def __init__(self, processes = None):
+        """
+        Parameters:
+        processes (int): The count of worker processes. None uses the count of
+        CPUs.
+        """
+
+        self.__pool = multiprocessing.Pool(processes = processes)
+
+    def scan(self, dbFileList):
+        """
+        Determines the tables of the database files and the time span of each
+        table, without reading any values.
+
+        Parameters:
+        dbFileList (list<string>): The database files.
+
+        Returns:
+        A (segments, tables, corruptFileCounter) tuple. segments is a list of
+        (dbFile, spans) tuples in the order of dbFileList, where spans maps
+        from table name to the (firstTimestamp, lastTimestamp) tuple of the
+        table. tables is the list of tables of the first readable file.
+        """
+
+        segments = []
+        tables = None
+        corruptFileCounter = 0
+        for dbFile, result in zip(
+            dbFileList, self.__pool.map(_scanFile, dbFileList)):
+            if result is None:
+                corruptFileCounter += 1
+                continue
+            fileTables, spans = result
+            if tables is None:
+                tables = fileTables
+            segments.append((dbFile, spans))
+        return (segments, tables or [], corruptFileCounter)
+
+    def load(
+        self,
+        segments,
+        tables,
+        startTime = None,
+        endTime = None,
+        bucketCount = None):
+        """
+        Reads the values of tables from all database files. Only files, whose
+        values overlap the time window, are read.
+
+        Parameters:
+        segments (list): The segments as returned by scan().
+
+        tables (list<string>): The tables to read.
+
+        startTime (float): Begin of the time window. None reads from the first
+        value on.
+
+        endTime (float): End of the time window. None reads up to the last
+        value.
+
+        bucketCount (int): If given, the values are reduced to a min/max
+        envelope with this count of buckets. Requires startTime and endTime.
+
+        Returns:
+        A (data, corruptFileCounter) tuple. data maps from table name to a
+        (timestamps, values) tuple of float64 arrays.
+        """
+
+        edges = None
+        if bucketCount is not None:
+            edges = Decimation.bucketEdges(startTime, endTime, bucketCount)
+
+        # Only hand out files, that contain values of the window.
+        taskList = []
+        for dbFile, spans in segments:
+            fileTables = [
+                table for table in tables
+                if DatabaseLoader.__overlaps(
+                    spans.get(table, (None, None)), startTime, endTime)]
+            if fileTables:
+                taskList.append((dbFile, fileTables, startTime, endTime, edges))
+
+        parts = {table : [] for table in tables}
+        corruptFileCounter = 0
+        for result in self.__pool.imap(_loadFile, taskList):
+            if result is None:
+                corruptFileCounter += 1
+                continue
+            for table, part in result.items():
+                if len(part[0]):
+                    parts[table].append(part)
+
+        data = {
+            table : DatabaseLoader.__merge(parts[table]) for table in tables }
+        return (data, corruptFileCounter)
+
+    def close(self):
+        """
+        Terminates the worker processes.
+        """
+
+        self.__pool.close()
+        self.__pool.join()
+
+    @staticmethod
+    def __overlaps(span, startTime, endTime):
+        """
+        Checks, if the (firstTimestamp, lastTimestamp) span of a table
+        overlaps the time window.
+        """
+
+        firstTimestamp, lastTimestamp = span
+        if firstTimestamp is None:
+            return False
+        if startTime is not None and lastTimestamp < startTime:
+            return False
+        if endTime is not None and firstTimestamp > endTime:
+            return False
+        return True
+
+    @staticmethod
+    def __merge(parts):
+        """
+        Merges the (timestamps, values) parts of several files in time order.
+        The parts are ordered by their first timestamp. Only if they overlap,
+        the merged values are sorted.
+        """
+
+        if not parts:
+            return (np.empty(0), np.empty(0))
+        parts = sorted(parts, key = lambda part: part[0][0])
+        timestamps = np.concatenate([part[0] for part in parts])
+        values = np.concatenate([part[1] for part in parts])
+        if np.any(np.diff(timestamps) < 0):
+            order = np.argsort(timestamps, kind = "stable")
+            timestamps = timestamps[order]
+            values = values[order]
+        return (timestamps, values)
+
+# FUNCTIONS --------------------------------------------------------------------
+
+def _scanFile(dbFile):
+    """
+    Worker function of DatabaseLoader.scan(). Returns a (tables, spans) tuple,
+    or None if the file could not be read.
+    """
+
+    try:
+        dbConnection = sqlite3.connect(dbFile)
+        try:
+            tables = DatabaseReader.getTables(dbConnection)
+            spans = {
+                table : DatabaseReader.getTimeSpan(dbConnection, table)
+                for table in tables }
+        finally:
+            dbConnection.close()
+    except sqlite3.Error:
+        return None
+    return (tables, spans)
+
+def _loadFile(task):
+    """
+    Worker function of DatabaseLoader.load(). Returns a dict, that maps from
+    table name to a (timestamps, values) tuple, or None if the file could not
+    be read.
+    """
+
+    dbFile, tables, startTime, endTime, edges = task
+    result = {}
+    try:
+        dbConnection = sqlite3.connect(dbFile)
+        try:
+            for table in tables:
+                timestamps, values = DatabaseReader.readTable(
+                    dbConnection, table, startTime, endTime)
+                if edges is not None:
+                    timestamps, values = Decimation.minMaxEnvelope(
+                        timestamps, values, edges)
+                result[table] = (timestamps, values)
+        finally:
+            dbConnection.close()
+    except sqlite3.Error:
+        return None
+    return result
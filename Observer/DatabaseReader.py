@@ -0,0 +1,399 @@
+"""
+This program has been created as part of the MST lab lecture of the institute
+of micromechanics TU Wien.
+This script contains functions for reading the database files, that have been
+written by Sentinel.py. Two layouts of measurement tables are understood. The
+row layout stores one (timestamp, value) row per sample. The block layout
+stores one (t0, rate, first_index, count, samples) row per processed block,
+with the samples packed into a binary blob. Timestamps of the block layout are
+materialized on read from the sample clock: Sample i of a block has the
+timestamp t0 + (first_index + i) / rate. Tables can be read as a whole or
+within a time window. Window reads use the time index of a table, if Sentinel
+has been configured to create one. Also the rollup database, which holds the
+minimum, maximum, mean and count of the values per time bucket, can be read.
+
+Author: David FREISMUTH
+Date: DEC 2019
+License:
+"""
+
+# Python imports
+import os
+import sqlite3
+
+# Third party imports
+import numpy as np
+
+# CONSTANTS --------------------------------------------------------------------
+
+# Layout of tables with one (timestamp, value) row per sample.
+LAYOUT_ROWS = "Rows"
+
+# Layout of tables with one (t0, rate, first_index, count, samples) row per
+# block.
+LAYOUT_BLOCKS = "Blocks"
+
+# Data type of the samples in the blob of the block layout.
+BLOCK_SAMPLE_DTYPE = "<f8"
+
+# Timestamp of the first sample of a block. Has to match the expression of the
+# time index of the block layout, for the index to be used.
+BLOCK_START_EXPRESSION = "t0 + first_index / rate"
+
+# Suffix of the rollup database file, that is appended to the database name.
+ROLLUP_FILE_SUFFIX = ".rollup.sl3"
+
+# Suffix of the segment catalog file, that is appended to the database name.
+CATALOG_FILE_SUFFIX = ".catalog.sl3"
+
+# Prefix of the names of rollup tables. The bucket size in seconds follows.
+ROLLUP_TABLE_PREFIX = "Rollup_"
+
+# Count of rows, that are fetched at once, when reading tables of the row
+# layout.
+FETCH_SIZE = 65536
+
+# FUNCTIONS --------------------------------------------------------------------
+
+def getTables(dbConnection):
+    """
+    Returns the names of all tables in the database.
+
+    Parameters:
+    dbConnection (sqlite3.Connection): Connection to the database.
+    """
+
+    cursor = dbConnection.execute(
+        "SELECT name FROM sqlite_master WHERE type='table' ORDER BY rowid;")
+    return [row[0] for row in cursor]
+
+def getTableLayout(dbConnection, table):
+    """
+    Determines the layout of a measurement table from its columns.
+
+    Parameters:
+    dbConnection (sqlite3.Connection): Connection to the database.
+
+    table (string): The name of the table.
+
+    Returns:
+    LAYOUT_ROWS or LAYOUT_BLOCKS.
+    """
+
+    columns = [
+        row[1] for row in
+        dbConnection.execute("PRAGMA table_info(" + table + ")")]
+    if "samples" in columns:
+        return LAYOUT_BLOCKS
+    return LAYOUT_ROWS
+
+def getTimeSpan(dbConnection, table):
+    """
+    Returns the timestamps of the first and the last value of a measurement 
+    table, without reading the values.
+
+    Parameters:
+    dbConnection (sqlite3.Connection): Connection to the database.
+
+    table (string): The name of the table.
+
+    Returns:
+    A (firstTimestamp, lastTimestamp) tuple, or (None, None) if the table is
+    empty.
+    """
+
+    if getTableLayout(dbConnection, table) == LAYOUT_BLOCKS:
+        query = \
+            "SELECT MIN(" + BLOCK_START_EXPRESSION + "), " \
+            "MAX(t0 + (first_index + count - 1) / rate) FROM " + table
+    else:
+        query = "SELECT MIN(timestamp), MAX(timestamp) FROM " + table
+    return tuple(dbConnection.execute(query).fetchone())
+
+def readTable(dbConnection, table, startTime = None, endTime = None):
+    """
+    Reads the values of a measurement table, ordered by time. Optionally only
+    the values within a time window are read. If the table has been created
+    with a time index, only the rows of the window are visited. The values are
+    fetched directly into preallocated arrays. All queries run in one read
+    transaction, so values written concurrently by Sentinel do not change the
+    result in between.
+
+    Parameters:
+    dbConnection (sqlite3.Connection): Connection to the database.
+
+    table (string): The name of the table.
+
+    startTime (float): Timestamp of the begin of the window. None reads from
+    the first value on.
+
+    endTime (float): Timestamp of the end of the window. None reads up to the
+    last value.
+
+    Returns:
+    A (timestamps, values) tuple of float64 arrays.
+    """
+
+    ownTransaction = not dbConnection.in_transaction
+    if ownTransaction:
+        dbConnection.execute("BEGIN")
+    try:
+        if getTableLayout(dbConnection, table) == LAYOUT_BLOCKS:
+            return _readBlockTable(dbConnection, table, startTime, endTime)
+        else:
+            return _readRowTable(dbConnection, table, startTime, endTime)
+    finally:
+        if ownTransaction:
+            dbConnection.rollback()
+
+def _readRowTable(dbConnection, table, startTime, endTime):
+    """
+    Reads a table of the row layout. See readTable().
+    """
+
+    conditions, parameters = _windowConditions(
+        "timestamp", startTime, endTime)
+    rowCount = dbConnection.execute(
+        "SELECT COUNT(*) FROM " + table + conditions,
+        parameters).fetchone()[0]
+    rows = np.empty((rowCount, 2), dtype = np.float64)
+
+    cursor = dbConnection.execute(
+        "SELECT timestamp, value FROM " + table + conditions +
+        " ORDER BY timestamp ASC",
+        parameters)
+    position = 0
+    while position < rowCount:
+        chunk = cursor.fetchmany(FETCH_SIZE)
+        if not chunk:
+            break
+        rows[position:position + len(chunk)] = chunk
+        position += len(chunk)
+    return (rows[:position, 0], rows[:position, 1])
+
+def _readBlockTable(dbConnection, table, startTime, endTime):
+    """
+    Reads a table of the block layout. See readTable(). Blocks are selected
+    by the timestamp of their first sample, which is indexed. A block, that
+    starts before the window, may still reach into it. So the lower bound is
+    extended by the duration of the longest block, and the samples outside of
+    the window are cut off afterwards.
+    """
+
+    if startTime is not None:
+        maxDuration = dbConnection.execute(
+            "SELECT MAX(count / rate) FROM " + table).fetchone()[0]
+        if maxDuration is None:
+            return (np.empty(0), np.empty(0))
+        blockStartTime = startTime - maxDuration
+    else:
+        blockStartTime = None
+
+    conditions, parameters = _windowConditions(
+        BLOCK_START_EXPRESSION, blockStartTime, endTime)
+    sampleCount = dbConnection.execute(
+        "SELECT SUM(count) FROM " + table + conditions,
+        parameters).fetchone()[0] or 0
+    timestamps = np.empty(sampleCount, dtype = np.float64)
+    values = np.empty(sampleCount, dtype = np.float64)
+
+    cursor = dbConnection.execute(
+        "SELECT t0, rate, first_index, count, samples FROM " + table +
+        conditions + " ORDER BY " + BLOCK_START_EXPRESSION + " ASC",
+        parameters)
+    position = 0
+    for t0, rate, firstIndex, count, samples in cursor:
+        count = min(count, sampleCount - position)
+        end = position + count
+        timestamps[position:end] = \
+            t0 + (np.arange(count, dtype = np.float64) + firstIndex) / rate
+        values[position:end] = np.frombuffer(
+            samples, dtype = BLOCK_SAMPLE_DTYPE, count = count)
+        position = end
+    timestamps = timestamps[:position]
+    values = values[:position]
+
+    if startTime is not None or endTime is not None:
+        first = 0 if startTime is None else \
+            np.searchsorted(timestamps, startTime, "left")
+        last = len(timestamps) if endTime is None else \
+            np.searchsorted(timestamps, endTime, "right")
+        timestamps = timestamps[first:last]
+        values = values[first:last]
+    return (timestamps, values)
+
+def getRollupSizes(dbConnection):
+    """
+    Returns the bucket sizes of the rollup tables of a rollup database in
+    ascending order.
+
+    Parameters:
+    dbConnection (sqlite3.Connection): Connection to the rollup database.
+    """
+
+    sizes = []
+    for table in getTables(dbConnection):
+        if table.startswith(ROLLUP_TABLE_PREFIX):
+            sizes.append(int(table[len(ROLLUP_TABLE_PREFIX):]))
+    return sorted(sizes)
+
+def getRollupMeasurements(dbConnection, size):
+    """
+    Returns the names of the measurements, that have buckets in a rollup
+    table.
+
+    Parameters:
+    dbConnection (sqlite3.Connection): Connection to the rollup database.
+
+    size (int): The bucket size of the rollup table in seconds.
+    """
+
+    cursor = dbConnection.execute(
+        "SELECT DISTINCT measurement FROM " + ROLLUP_TABLE_PREFIX + str(size) +
+        " ORDER BY measurement")
+    return [row[0] for row in cursor]
+
+def readRollup(dbConnection, measurement, size, startTime = None,
+    endTime = None):
+    """
+    Reads the buckets of a measurement from a rollup table, ordered by time.
+
+    Parameters:
+    dbConnection (sqlite3.Connection): Connection to the rollup database.
+
+    measurement (string): The name of the measurement, i.e. the name of its
+    table in the database files.
+
+    size (int): The bucket size of the rollup table in seconds.
+
+    startTime (float): Only buckets, that end after this timestamp are read.
+    None reads from the first bucket on.
+
+    endTime (float): Only buckets, that start before this timestamp are read.
+    None reads up to the last bucket.
+
+    Returns:
+    A (bucketStart, minimum, maximum, mean, count) tuple of arrays. 
+    bucketStart is the timestamp of the begin of each bucket.
+    """
+
+    conditions = ["measurement = ?"]
+    parameters = [measurement]
+    if startTime is not None:
+        conditions.append("bucket >= ?")
+        parameters.append(int(np.floor(startTime / size)))
+    if endTime is not None:
+        conditions.append("bucket <= ?")
+        parameters.append(int(np.floor(endTime / size)))
+    cursor = dbConnection.execute(
+        "SELECT bucket, minimum, maximum, total, count FROM " +
+        ROLLUP_TABLE_PREFIX + str(size) + " WHERE " + 
+        " AND ".join(conditions) + " ORDER BY bucket ASC",
+        parameters)
+    rows = np.array(cursor.fetchall(), dtype = np.float64).reshape(-1, 5)
+    return (
+        rows[:, 0] * size,
+        rows[:, 1],
+        rows[:, 2],
+        rows[:, 3] / rows[:, 4],
+        rows[:, 4].astype(np.int64))
+
+def readCatalog(catalogFile, startTime = None, endTime = None):
+    """
+    Reads the segment catalog, that Sentinel maintains for its database 
+    files. Only the catalog is opened, not the database files. Segments whose
+    file does not exist anymore are skipped.
+
+    Parameters:
+    catalogFile (string): Path of the catalog database.
+
+    startTime (float): Only segments with values after this timestamp are
+    returned. None returns all segments.
+
+    endTime (float): Only segments with values before this timestamp are
+    returned. None returns all segments.
+
+    Returns:
+    A (segments, tables, missingFileCounter, openSegmentCounter) tuple. 
+    segments is a list of (dbFile, spans) tuples in the order the files have 
+    been created, where spans maps from table name to the (firstTimestamp, 
+    lastTimestamp) tuple of the table. tables is the list of tables of the 
+    first segment. openSegmentCounter is the count of returned segments, that
+    have not been closed cleanly. These are either being written, or have 
+    been left by a crash.
+    """
+
+    conditions = []
+    parameters = []
+    if startTime is not None:
+        conditions.append("last_timestamp >= ?")
+        parameters.append(float(startTime))
+    if endTime is not None:
+        conditions.append("first_timestamp <= ?")
+        parameters.append(float(endTime))
+    whereClause = ""
+    if conditions:
+        whereClause = " WHERE " + " AND ".join(conditions)
+
+    catalogDir = os.path.dirname(os.path.abspath(catalogFile))
+    dbConnection = sqlite3.connect(catalogFile)
+    try:
+        segmentRows = dbConnection.execute(
+            "SELECT segment, path, closed FROM Segments" + whereClause +
+            " ORDER BY created ASC, segment ASC",
+            parameters).fetchall()
+        tableRows = dbConnection.execute(
+            "SELECT segment, table_name, first_timestamp, last_timestamp "
+            "FROM SegmentTables ORDER BY rowid ASC").fetchall()
+    finally:
+        dbConnection.close()
+
+    spansOfSegment = {}
+    for segment, table, firstTimestamp, lastTimestamp in tableRows:
+        spansOfSegment.setdefault(segment, {})[table] = \
+            (firstTimestamp, lastTimestamp)
+
+    segments = []
+    tables = None
+    missingFileCounter = 0
+    openSegmentCounter = 0
+    for segment, path, closed in segmentRows:
+        dbFile = os.path.join(catalogDir, path)
+        if not os.path.isfile(dbFile):
+            missingFileCounter += 1
+            continue
+        spans = spansOfSegment.get(segment, {})
+        if tables is None:
+            tables = list(spans.keys())
+        if not closed:
+            openSegmentCounter += 1
+        segments.append((dbFile, spans))
+    return (segments, tables or [], missingFileCounter, openSegmentCounter)
+
+def _windowConditions(column, startTime, endTime):
+    """
+    Builds the WHERE clause of a window query.
+
+    Parameters:
+    column (string): The column or expression, that is compared to the
+    window.
+
+    startTime (float): Begin of the window or None.
+
+    endTime (float): End of the window or None.
+
+    Returns:
+    A (clause, parameters) tuple.
+    """
+
+    conditions = []
+    parameters = []
+    if startTime is not None:
+        conditions.append(column + " >= ?")
+        parameters.append(float(startTime))
+    if endTime is not None:
+        conditions.append(column + " <= ?")
+        parameters.append(float(endTime))
+    if not conditions:
+        return ("", parameters)
+    return (" WHERE " + " AND ".join(conditions), parameters)
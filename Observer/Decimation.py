@@ -0,0 +1,94 @@
+"""
+This program has been created as part of the MST lab lecture of the institute
+of micromechanics TU Wien.
+This script contains functions for decimating measurement values before they
+are plotted. A plot can not show more details than it has pixels. So the
+values are split into one bucket per pixel column, and only the minimum and
+the maximum of each bucket are kept. The resulting envelope looks the same as
+a plot of all values, but contains at most two points per pixel column.
+
+Author: David FREISMUTH
+Date: DEC 2019
+License:
+"""
+
+# Third party imports
+import numpy as np
+
+# FUNCTIONS --------------------------------------------------------------------
+
+def bucketEdges(startTime, endTime, bucketCount):
+    """
+    Splits a time window into buckets of equal duration.
+
+    Parameters:
+    startTime (float): Begin of the window.
+
+    endTime (float): End of the window.
+
+    bucketCount (int): The count of buckets. Usually the width of the plot in
+    pixels.
+
+    Returns:
+    A float64 array of bucketCount + 1 bucket edges.
+    """
+
+    return np.linspace(startTime, endTime, max(int(bucketCount), 1) + 1)
+
+def minMaxEnvelope(timestamps, values, edges):
+    """
+    Reduces values to their minimum and maximum per bucket. The minimum and
+    the maximum keep their original timestamps and are returned in time order,
+    so the envelope can be plotted as a single line. Values outside of the
+    edges are dropped. If there are no more than two values per bucket on
+    average, the values are returned unchanged.
+
+    Parameters:
+    timestamps (ndarray): Timestamps of the values in ascending order.
+
+    values (ndarray): The values.
+
+    edges (ndarray): Bucket edges in ascending order, as returned by
+    bucketEdges().
+
+    Returns:
+    A (timestamps, values) tuple of float64 arrays.
+    """
+
+    timestamps = np.asarray(timestamps, dtype = np.float64)
+    values = np.asarray(values, dtype = np.float64)
+
+    # Drop values outside of the edges.
+    first = np.searchsorted(timestamps, edges[0], "left")
+    last = np.searchsorted(timestamps, edges[-1], "right")
+    timestamps = timestamps[first:last]
+    values = values[first:last]
+    if len(values) <= 2 * (len(edges) - 1):
+        return (timestamps, values)
+
+    # Index of the first value of each non empty bucket. The last edge is part
+    # of the last bucket.
+    starts = np.searchsorted(timestamps, edges[:-1], "left")
+    starts = np.unique(starts[starts < len(values)])
+    counts = np.diff(np.append(starts, len(values)))
+    bucketIds = np.repeat(np.arange(len(starts)), counts)
+
+    # Positions of the first minimum and the first maximum of each bucket.
+    minimums = np.minimum.reduceat(values, starts)
+    maximums = np.maximum.reduceat(values, starts)
+    minIndices = _firstMatch(values == minimums[bucketIds], bucketIds)
+    maxIndices = _firstMatch(values == maximums[bucketIds], bucketIds)
+
+    # Keep both in time order. If minimum and maximum are the same value, it is
+    # kept only once.
+    indices = np.unique(np.concatenate((minIndices, maxIndices)))
+    return (timestamps[indices], values[indices])
+
+def _firstMatch(matches, bucketIds):
+    """
+    Returns the index of the first True element of matches per bucket.
+    """
+
+    candidates = np.flatnonzero(matches)
+    _, firstCandidates = np.unique(bucketIds[candidates], return_index = True)
+    return candidates[firstCandidates]
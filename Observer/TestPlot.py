@@ -2,7 +2,16 @@
 This program has been created as part of the MST lab lecture of the institute
 of micromechanics TU Wien.
 This script shows the data that has been acquired by Sentinel.py. It is assumed,
-that all analyzed database, have the same scheme.
+that all analyzed database, have the same scheme. Tables in row layout and in
+block layout are understood (see DatabaseReader). Long recordings are not
+plotted value by value. Each table is reduced to a min/max envelope with one
+bucket per pixel column of the plot (see Decimation). When zooming into a time
+window, the values of that window are read again from the database files and
+decimated to the plot width, so details become visible down to full
+resolution. The database files are read in parallel (see DatabaseLoader). If
+Sentinel has written a segment catalog, the database files and their time
+spans are taken from it. Otherwise the files are found by their name and
+ordered by their creation time.
 
 Parameter:
 
@@ -10,6 +19,16 @@ Parameter:
 enter file ending. Defaults to the following:
 \\\\raspberrypi.local\\daqpi\\MstLab\\Sentinel\\sentinelDb
 
+-p, --processes: The count of processes, that read database files in
+parallel. Defaults to the count of CPUs.
+
+-r, --rollup: Shows the minimum, maximum and mean per bucket from the rollup
+database, instead of the values of the database files. The bucket size in
+seconds has to be given.
+
+-w, --width: The count of buckets, the values are reduced to. Defaults to the
+width of the plot in pixels.
+
 Author: David FREISMUTH
 Date: DEC 2019
 License: 
@@ -23,6 +42,10 @@ import matplotlib.pyplot as plt
 import glob
 import os
 
+# Project imports
+import DatabaseReader
+from DatabaseLoader import DatabaseLoader
+
 # CONSTANTS --------------------------------------------------------------------
 
 # File ending of sqlite database files.
@@ -33,112 +56,215 @@ SQLITE_FILE_ENDING = ".sl3"
 DEFAULT_FILE_BASE_NAME = \
     "\\\\raspberrypi.local\\daqpi\\MstLab\\Sentinel\\sentinelDb"
 
-# The column index of the timestamp in the databases.
-IDX_DB_TIMESTAMP = 0
+# FUNCTIONS --------------------------------------------------------------------
+
+def showRollup(fileBaseName, size):
+    """
+    Shows the minimum, maximum and mean of all measurements from the rollup
+    database, without reading the database files.
+
+    Parameters:
+    fileBaseName (string): The base name of the database files.
+
+    size (int): The bucket size in seconds. Has to be one of the bucket sizes,
+    Sentinel has been configured with.
+    """
 
-# The column index of the value in the databases.
-IDX_DB_VALUE = 1
+    rollupFile = fileBaseName + DatabaseReader.ROLLUP_FILE_SUFFIX
+    if not os.path.isfile(rollupFile):
+        print("Rollup database " + rollupFile + " not found.")
+        return
+    dbConnection = sqlite3.connect(rollupFile)
+    sizes = DatabaseReader.getRollupSizes(dbConnection)
+    if size not in sizes:
+        print(
+            "No rollup with bucket size " + str(size) + " s. Available: " +
+            str(sizes))
+        dbConnection.close()
+        return
+
+    measurements = DatabaseReader.getRollupMeasurements(dbConnection, size)
+    if not measurements:
+        print("No data found.")
+        dbConnection.close()
+        return
+    rollups = [
+        DatabaseReader.readRollup(dbConnection, measurement, size)
+        for measurement in measurements]
+    dbConnection.close()
+
+    # All timestamps are shown relative to the first bucket.
+    startTimestamp = min(
+        rollup[0][0] for rollup in rollups if len(rollup[0]))
+    startTimestampStr = \
+        datetime.datetime.fromtimestamp(startTimestamp).isoformat()
+
+    fig, axs = plt.subplots(
+        len(measurements), sharex = True, sharey = True, squeeze = False)
+    axs = axs[:, 0]
+    for i, measurement in enumerate(measurements):
+        bucketStart, minimum, maximum, mean, count = rollups[i]
+        x = bucketStart - startTimestamp + size / 2.0
+        axs[i].fill_between(x, minimum, maximum, color = 'b', alpha = 0.3)
+        axs[i].plot(x, mean, 'b')
+        axs[i].set_title(measurement)
+        axs[i].set_ylabel('Voltage (V)')
+
+    print(
+        "Showing " + str(sum(len(rollup[0]) for rollup in rollups)) + 
+        " buckets of " + str(size) + " s.")
+    fig.suptitle(
+        'Energy Harvesting measurement started at ' + startTimestampStr,
+        fontsize=16)
+    axs[-1].set_xlabel('Time (s)')
+    plt.show()
 
 # MAIN -------------------------------------------------------------------------
 
-# Set up argparse.
-parser = argparse.ArgumentParser(
-    description="Shows data that has been acquired by Sentinel.")
-parser.add_argument(
-    '--fileBaseName', '-f',
-    dest='fileBaseName',
-    action='store',
-    nargs = '?',
-    default=DEFAULT_FILE_BASE_NAME,
-    help=
-    'The base name of the file, that shall be analyzed. Do not enter file ending')
-args = parser.parse_args()
-
-# Get a list of all database file that match to the specified database file 
-# base name
-fileNamePattern = args.fileBaseName + "_*" + SQLITE_FILE_ENDING
-dbFileList = glob.glob(fileNamePattern)
-
-# Sort the dbFileList after modification time.
-dbFileListSorted = \
-    sorted(
-        dbFileList,
-        key = lambda dbFile: os.path.getctime(dbFile))
-
-# Iterate over detected database files.
-corruptFileCounter = 0
-firstIteration = True
-startTimestamp = 0.0
-startTimestampStr = ""
-fig = None
-axs = None
-for dbFile in dbFileListSorted:
-    try:
-        dbConnection = sqlite3.connect(dbFile)
-    except:
-        # Database file seems to be corrupted. Skip this one.
-        corruptFileCounter += 1
-        continue
-    
-    # Get all tables from the database
-    cursor = \
-        dbConnection.execute(
-            "SELECT name FROM sqlite_master WHERE type='table';")
-    tables = []
-    for table in cursor:
-        tables.append(table[0])
-
-    # If this is the first file, set up the plots according to the discovered
-    # tables in the database.
-    if firstIteration:
-        fig,axs = plt.subplots(len(tables), sharex = True, sharey=True)
-        for i, table in enumerate(tables):
-            axs[i].set_title(table)
-            axs[i].set_ylabel('Voltage (V)')
-
-    # Iterate over the tables in the current database.
+if __name__ == '__main__':
+    # Set up argparse.
+    parser = argparse.ArgumentParser(
+        description="Shows data that has been acquired by Sentinel.")
+    parser.add_argument(
+        '--fileBaseName', '-f',
+        dest='fileBaseName',
+        action='store',
+        nargs = '?',
+        default=DEFAULT_FILE_BASE_NAME,
+        help=
+        'The base name of the file, that shall be analyzed. Do not enter file '
+        'ending')
+    parser.add_argument(
+        '--processes', '-p',
+        dest='processes',
+        type=int,
+        default=None,
+        help='The count of processes, that read database files in parallel.')
+    parser.add_argument(
+        '--rollup', '-r',
+        dest='rollup',
+        type=int,
+        default=None,
+        help='Shows the rollup with the given bucket size in seconds instead '
+        'of the values.')
+    parser.add_argument(
+        '--width', '-w',
+        dest='width',
+        type=int,
+        default=None,
+        help='The count of buckets, the values are reduced to. Defaults to the '
+        'width of the plot in pixels.')
+    args = parser.parse_args()
+
+    if args.rollup is not None:
+        showRollup(args.fileBaseName, args.rollup)
+        raise SystemExit(0)
+
+    loader = DatabaseLoader(args.processes)
+    catalogFile = args.fileBaseName + DatabaseReader.CATALOG_FILE_SUFFIX
+    if os.path.isfile(catalogFile):
+        # The catalog contains the tables and time spans of all database 
+        # files, so the files do not have to be opened to find them.
+        segments, tables, corruptFileCounter, openSegmentCounter = \
+            DatabaseReader.readCatalog(catalogFile)
+        fileCount = len(segments) + corruptFileCounter
+        if openSegmentCounter:
+            print(
+                str(openSegmentCounter) + " database files have not been " +
+                "closed cleanly. Their values may be incomplete.")
+    else:
+        # Get a list of all database file that match to the specified 
+        # database file base name
+        fileNamePattern = args.fileBaseName + "_*" + SQLITE_FILE_ENDING
+        dbFileList = glob.glob(fileNamePattern)
+        fileCount = len(dbFileList)
+
+        # Sort the dbFileList after modification time.
+        dbFileListSorted = \
+            sorted(
+                dbFileList,
+                key = lambda dbFile: os.path.getctime(dbFile))
+
+        # Determine the tables and the time span of the recording.
+        segments, tables, corruptFileCounter = loader.scan(dbFileListSorted)
+
+    spanList = [
+        span for dbFile, spans in segments for span in spans.values()
+        if span[0] is not None]
+    if not tables or not spanList:
+        loader.close()
+        print("No data found.")
+        raise SystemExit(1)
+    firstTimestamp = min(span[0] for span in spanList)
+    lastTimestamp = max(span[1] for span in spanList)
+
+    # All timestamps are shown relative to the first one.
+    startTimestamp = firstTimestamp
+    startTimestampStr = \
+        datetime.datetime.fromtimestamp(startTimestamp).isoformat()
+
+    # Set up the plots according to the discovered tables.
+    fig, axs = plt.subplots(
+        len(tables), sharex = True, sharey = True, squeeze = False)
+    axs = axs[:, 0]
     for i, table in enumerate(tables):
-        c = dbConnection.cursor()
-        result = \
-            dbConnection.cursor().execute(
-                "SELECT * FROM " + table + " ORDER BY timestamp ASC")
-        x = [] 
-        y = []
-
-        # Iterate over rows in the table.
-        for row in result:
-            # If this is the first row of the first table of the first file, 
-            # save the timestamp, to be able to subract it from all future
-            # timestamps.
-            if firstIteration:
-                startTimestamp = row[IDX_DB_TIMESTAMP]
-                startTimestampStr = \
-                    datetime.datetime.fromtimestamp(
-                        row[IDX_DB_TIMESTAMP]).isoformat()
-                firstIteration = False
-
-            curTimestamp = row[IDX_DB_TIMESTAMP] - startTimestamp
-            x.append(curTimestamp)
-            y.append(row[IDX_DB_VALUE])
-        
-        # plotting the points  
-        axs[i].plot(x, y, 'b') 
-    
-    # Close connection to currently analyzed database.
-    dbConnection.close()
+        axs[i].set_title(table)
+        axs[i].set_ylabel('Voltage (V)')
 
-# Print some information.
-if corruptFileCounter > 1:
+    bucketCount = args.width
+    if bucketCount is None:
+        bucketCount = int(axs[0].get_window_extent().width)
+
+    # Plot the envelope of the whole recording. It is kept, so it can be 
+    # restored when zooming out again.
+    data, failedFileCounter = loader.load(
+        segments, tables, firstTimestamp, lastTimestamp, bucketCount)
+    corruptFileCounter += failedFileCounter
+    lines = []
+    overview = []
+    for i, table in enumerate(tables):
+        timestamps, y = data[table]
+        x = timestamps - startTimestamp
+        overview.append((x, y))
+        lines.append(axs[i].plot(x, y, 'b')[0])
+
+    def onXlimChanged(ax):
+        """
+        Reads the values of the shown time window at the resolution of the 
+        plot.
+        """
+
+        windowStart, windowEnd = ax.get_xlim()
+        windowStart += startTimestamp
+        windowEnd += startTimestamp
+        if windowStart <= firstTimestamp and windowEnd >= lastTimestamp:
+            for i, table in enumerate(tables):
+                lines[i].set_data(*overview[i])
+        else:
+            data, _ = loader.load(
+                segments, tables, windowStart, windowEnd, bucketCount)
+            for i, table in enumerate(tables):
+                timestamps, y = data[table]
+                lines[i].set_data(timestamps - startTimestamp, y)
+        ax.figure.canvas.draw_idle()
+
+    # The x axes are shared, so it is sufficient to listen to one of them.
+    axs[0].callbacks.connect('xlim_changed', onXlimChanged)
+
+    # Print some information.
+    if corruptFileCounter > 1:
+        print(
+            str(corruptFileCounter) + " of " + str(fileCount) + 
+            " database files where corrupted. Data of those will not be " +
+            "shown.")
     print(
-        str(corruptFileCounter) + " of " + str(len(dbFileList)) + " database " +
-        "files where corrupted. Data of those will not be shown.")
-print(
-    "Showing data of " + str(len(dbFileList) - corruptFileCounter) + " " +
-    "files.")
-
-# Do some final configurations on the figure and then show it.
-fig.suptitle(
-    'Energy Harvesting measurement started at ' + startTimestampStr,
-    fontsize=16)
-axs[-1].set_xlabel('Time (s)')
-plt.show() 
\ No newline at end of file
+        "Showing data of " + str(fileCount - corruptFileCounter) + " " +
+        "files.")
+
+    # Do some final configurations on the figure and then show it.
+    fig.suptitle(
+        'Energy Harvesting measurement started at ' + startTimestampStr,
+        fontsize=16)
+    axs[-1].set_xlabel('Time (s)')
+    plt.show()
+    loader.close()
@@ -0,0 +1,285 @@
+"""
+This program has been created as part of the "Mikrosystemtechnik Labor" lecture
+at the "Institut für Sensor und Aktuator Systeme" TU Wien.
+This class runs the sentinel in a single asyncio event loop, as alternative to
+the thread per module runtime. The reads of the DAQ boards, the switches of the
+measurement configuration, the GPIO state machine, the hand over of the
+processed blocks to the database interface and the writeback timer are
+coroutines. The evaluation of the measurement expressions runs in a process
+pool, and the writes to the database in a single database thread, so the event
+loop is never blocked by them. The blocks are handed over from the processing
+results to the value cache directly, without a transport and its listener
+thread. Shutdown cancels the coroutines in a fixed order: Acquisition,
+processing of the blocks in flight, writeback and GPIO handling.
+
+Author: David FREISMUTH
+Date: DEC 2019
+License:
+"""
+
+# Python imports
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import signal
+import sys
+
+# Project imports
+from SentinelConfig import SentinelConfig
+from DatabaseInterface import DatabaseInterface
+from DataAquisition import DataAquisition
+from GpioHandler import GpioHandler
+from MeasurementTransport import BlockTrace
+
+class AsyncRuntime:
+    """
+    Runs the modules of the sentinel as coroutines of one event loop.
+    """
+
+    # Signals, that stop the sentinel.
+    STOP_SIGNALS = (signal.SIGINT, signal.SIGTERM)
+
+    def __init__(self, configObject, metrics):
+        """
+        Parameters:
+        configObject (SentinelConfig): The validated configuration.
+
+        metrics (MetricsRegistry): The registry, the metrics of all modules are
+        registered in.
+        """
+
+        self.__configObject = configObject
+        self.__metrics = metrics
+
+        # Modules and executors. Created in the event loop by run().
+        self.__databaseInterface = None
+        self.__dataAquisition = None
+        self.__gpioHandler = None
+        self.__databaseExecutor = None
+
+        # Set, when the sentinel shall stop.
+        self.__stopEvent = None
+
+        # Set to request a writeback before the write intervall has elapsed.
+        self.__writebackRequested = None
+
+        # Set after each writeback, and replaced by a new event.
+        self.__writebackDone = None
+
+        self.__writebackTask = None
+
+    def run(self):
+        """
+        Starts all modules and runs the event loop, until the sentinel is
+        stopped by STRG + C or a line on the standard input.
+
+        Returns:
+        True if all modules have been started and stopped. False otherwise.
+        """
+
+        return asyncio.run(self.__main())
+
+    def stop(self):
+        """
+        Requests the stop of the sentinel. Has to be called from the thread of
+        the event loop.
+        """
+
+        if self.__stopEvent is not None:
+            self.__stopEvent.set()
+
+    async def __main(self):
+        """
+        Coroutine, that starts the modules, waits for the stop request and
+        stops the modules again.
+        """
+
+        loop = asyncio.get_event_loop()
+        self.__stopEvent = asyncio.Event()
+        self.__writebackRequested = asyncio.Event()
+        self.__writebackDone = asyncio.Event()
+
+        # The queue to the GPIO handler is an asyncio.Queue. It has to be
+        # created in the event loop.
+        gpioQueue = asyncio.Queue()
+
+        # All database functions are called from the same thread, as the
+        # connection must not be shared between threads.
+        self.__databaseInterface = DatabaseInterface(
+            self.__configObject,
+            None,
+            self.__metrics)
+        if not self.__databaseInterface.start(startThreads = False):
+            print("Could not start database interface. Aborting.")
+            return False
+        self.__databaseExecutor = ThreadPoolExecutor(
+            max_workers = 1,
+            thread_name_prefix = "DatabaseWriteback")
+        await loop.run_in_executor(
+            self.__databaseExecutor,
+            self.__databaseInterface.openDatabase)
+
+        self.__gpioHandler = GpioHandler(
+            self.__configObject,
+            gpioQueue,
+            self.__metrics)
+        self.__dataAquisition = DataAquisition(
+            self.__configObject,
+            None,
+            gpioQueue,
+            self.__metrics,
+            runtime = SentinelConfig.RUNTIME_ASYNCIO)
+
+        self.__installStopHandlers(loop)
+
+        gpioTask = asyncio.ensure_future(self.__gpioHandler.runAsync())
+        self.__writebackTask = asyncio.ensure_future(self.__writebackLoop())
+        acquisitionTask = asyncio.ensure_future(
+            self.__dataAquisition.runAsync(self.__store))
+
+        print("Sentinel started. Press STRG + C to stop.")
+        stopTask = asyncio.ensure_future(self.__stopEvent.wait())
+        await asyncio.wait(
+            [stopTask, acquisitionTask, self.__writebackTask],
+            return_when = asyncio.FIRST_COMPLETED)
+        print("Sentinel stop issued.")
+        stopTask.cancel()
+
+        # A second STRG + C must not interrupt the shutdown, as the shared
+        # memory and the database would not be released then. Stop signals
+        # are ignored, until the shutdown has finished.
+        self.__ignoreStopSignals(loop)
+        try:
+            # Stop the acquisition first, and let the blocks in flight reach
+            # the value cache. Then write back what is left and close the
+            # database.
+            await AsyncRuntime.__cancel(acquisitionTask)
+            await self.__dataAquisition.stopAsync()
+            await self.__offer(self.__databaseInterface.flushReductions())
+            await AsyncRuntime.__cancel(self.__writebackTask)
+            await loop.run_in_executor(
+                self.__databaseExecutor,
+                self.__databaseInterface.closeDatabase)
+            self.__databaseExecutor.shutdown()
+            await AsyncRuntime.__cancel(gpioTask)
+        finally:
+            self.__removeStopHandlers(loop)
+        return True
+
+    async def __store(self, blocks):
+        """
+        Coroutine, that hands a batch of processed blocks over to the
+        database interface. If the batch does not fit into the value cache, a
+        writeback is requested and the batch is offered again after it.
+        """
+
+        trace = blocks[0].trace if blocks else None
+        if trace is not None:
+            trace.stamp(BlockTrace.RECEIVED)
+        await self.__offer(self.__databaseInterface.reduce(blocks))
+
+    async def __offer(self, blocks):
+        """
+        Coroutine, that offers a reduced batch to the database interface,
+        until it fits into the value cache or is dropped.
+        """
+
+        while not self.__databaseInterface.offer(blocks):
+            if self.__writebackTask.done():
+                print("Database writeback stopped. Dropped " +
+                    str(len(blocks)) + " blocks.")
+                return
+            writebackDone = self.__writebackDone
+            self.__writebackRequested.set()
+            try:
+                await asyncio.wait_for(
+                    writebackDone.wait(),
+                    DatabaseInterface.CACHE_WAIT_TIMEOUT)
+            except asyncio.TimeoutError:
+                pass
+
+    async def __writebackLoop(self):
+        """
+        Coroutine, that writes the value cache back to database every write
+        intervall, or earlier if requested by __store(). The writeback runs
+        in the database thread.
+        """
+
+        loop = asyncio.get_event_loop()
+        intervall = self.__databaseInterface.writebackIntervall()
+        while True:
+            try:
+                await asyncio.wait_for(
+                    self.__writebackRequested.wait(),
+                    intervall)
+            except asyncio.TimeoutError:
+                pass
+            self.__writebackRequested.clear()
+
+            await loop.run_in_executor(
+                self.__databaseExecutor,
+                self.__databaseInterface.writebackCycle)
+            self.__writebackDone.set()
+            self.__writebackDone = asyncio.Event()
+
+    def __installStopHandlers(self, loop):
+        """
+        Stops the sentinel on SIGINT, SIGTERM and on a line on the standard
+        input, like the thread runtime.
+        """
+
+        for signalNumber in AsyncRuntime.STOP_SIGNALS:
+            loop.add_signal_handler(signalNumber, self.stop)
+        try:
+            loop.add_reader(sys.stdin.fileno(), self.__onInput)
+        except (OSError, ValueError):
+            # The standard input can not be watched, i.e. if it is a regular
+            # file. Only SIGINT stops the sentinel then.
+            pass
+
+    def __ignoreStopSignals(self, loop):
+        """
+        Replaces the stop handlers by a handler, that only reports, that the
+        sentinel is already stopping. The standard input is not watched
+        anymore.
+        """
+
+        for signalNumber in AsyncRuntime.STOP_SIGNALS:
+            loop.add_signal_handler(signalNumber, AsyncRuntime.__onStopping)
+        try:
+            loop.remove_reader(sys.stdin.fileno())
+        except (OSError, ValueError):
+            pass
+
+    def __removeStopHandlers(self, loop):
+        for signalNumber in AsyncRuntime.STOP_SIGNALS:
+            loop.remove_signal_handler(signalNumber)
+        try:
+            loop.remove_reader(sys.stdin.fileno())
+        except (OSError, ValueError):
+            pass
+
+    @staticmethod
+    def __onStopping():
+        print("Sentinel is already stopping. Please wait.")
+
+    def __onInput(self):
+        # At the end of the standard input, only SIGINT stops the sentinel.
+        if not sys.stdin.readline():
+            asyncio.get_event_loop().remove_reader(sys.stdin.fileno())
+            return
+        self.stop()
+
+    @staticmethod
+    async def __cancel(task):
+        """
+        Cancels a task and waits until it has finished. Exceptions of the task
+        are printed.
+        """
+
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        except Exception as error:
+            print("Task " + str(task) + " failed: " + repr(error))
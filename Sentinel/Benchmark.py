@@ -0,0 +1,333 @@
+"""
+This program has been created as part of the "Mikrosystemtechnik Labor" lecture
+at the "Institut für Sensor und Aktuator Systeme" TU Wien.
+This script measures the throughput of the sentinel pipeline. It runs the real
+Sentinel modules against the simulated DAQ backend, for every combination of
+the given scan rates and channel counts, and writes the results to a JSON file,
+so runs can be compared across changes. Reported are samples/s acquired,
+ingested by the database interface and committed to SQLite, the end to end
+latency from sample timestamp to commit, the depth of the database interface
+queue over time, the CPU time per process and the peak RSS per process. Only
+runs on Linux, as process statistics are read from /proc.
+
+Parameter:
+
+-r, --scanRate: One or more scan rates per channel. Defaults to 10000.
+
+-n, --channels: One or more channel counts. Defaults to 1.
+
+-d, --duration: Duration of a single run in seconds. Defaults to 30.
+
+-w, --writeIntervall: Write intervall of the database interface in
+milliseconds. Defaults to 1000.
+
+-o, --output: Path of the JSON result file. Defaults to benchmark.json.
+
+--workDir: Directory for the database files of the runs. Defaults to a
+temporary directory, that is deleted afterwards.
+
+Author: David FREISMUTH
+Date: DEC 2019
+License:
+"""
+
+# Python imports
+import argparse
+import datetime
+import json
+import os
+import platform
+import resource
+import shutil
+import tempfile
+import time
+
+# Project imports
+from Sentinel import Sentinel
+from SentinelConfig import SentinelConfig
+from DaqBackend import DaqBackend
+
+class Benchmark:
+    """
+    Runs the sentinel against the simulated DAQ backend and collects
+    throughput statistics.
+    """
+
+    # Intervall in seconds, in which queue depth and process statistics are
+    # sampled.
+    SAMPLE_INTERVALL = 0.5
+
+    # The base name of the database files of a run.
+    DATABASE_NAME = "benchmarkDb"
+
+    def __init__(self, workDir, duration, writeIntervall):
+        """
+        Parameters:
+        workDir (string): The directory, the database and config files are
+        created in.
+
+        duration (float): Duration of a single run in seconds.
+
+        writeIntervall (int): Write intervall of the database interface in
+        milliseconds.
+        """
+
+        self.__workDir = workDir
+        self.__duration = duration
+        self.__writeIntervall = writeIntervall
+        self.__clockTicks = os.sysconf("SC_CLK_TCK")
+
+    def run(self, scanRate, channelCount):
+        """
+        Executes a single benchmark run.
+
+        Parameters:
+        scanRate (int): The scan rate per channel.
+
+        channelCount (int): The count of channels, that are scanned. For each
+        channel a measurement is configured.
+
+        Returns:
+        A dict containing the results of the run.
+        """
+
+        runDir = os.path.join(
+            self.__workDir,
+            "run_" + str(scanRate) + "_" + str(channelCount))
+        os.makedirs(runDir, exist_ok = True)
+        configFile = os.path.join(runDir, "benchmarkConfig.json")
+        with open(configFile, "w") as configFilePtr:
+            json.dump(
+                self.__createConfig(runDir, scanRate, channelCount),
+                configFilePtr,
+                indent = 4)
+
+        sentinel = Sentinel(configFile)
+        if not sentinel.start():
+            raise Exception("Could not start sentinel.")
+
+        # Sample queue depth and process statistics while the pipeline runs.
+        queueDepth = []
+        processStats = {}
+        startTime = time.time()
+        selfCpuStart = resource.getrusage(resource.RUSAGE_SELF)
+        while time.time() - startTime < self.__duration:
+            time.sleep(Benchmark.SAMPLE_INTERVALL)
+            queueDepth.append((
+                round(time.time() - startTime, 3),
+                sentinel.dbIfQueue.qsize()))
+            self.__sampleChildProcesses(processStats)
+
+        acquired = sentinel.metrics.value("sentinel_samples_acquired_total")
+        received = sentinel.metrics.value("sentinel_samples_received_total")
+        committed = sentinel.metrics.value("sentinel_samples_committed_total")
+        elapsed = time.time() - startTime
+        selfCpuEnd = resource.getrusage(resource.RUSAGE_SELF)
+
+        sentinel.stop()
+
+        # Include the final writeback in the committed samples, but not in
+        # the rates, as it happens after the measured duration.
+        statistics = sentinel.databaseInterface.writebackStatistics
+        latencies = [entry[4] for entry in statistics]
+        maxLatencies = [entry[5] for entry in statistics]
+        writebackDurations = [entry[2] for entry in statistics]
+
+        processStats["main"] = {
+            "pid" : os.getpid(),
+            "cpuSeconds" : round(
+                (selfCpuEnd.ru_utime - selfCpuStart.ru_utime) +
+                (selfCpuEnd.ru_stime - selfCpuStart.ru_stime), 3),
+            "peakRssKiB" : selfCpuEnd.ru_maxrss }
+
+        return {
+            "scanRate" : scanRate,
+            "channels" : channelCount,
+            "duration" : round(elapsed, 3),
+            "samplesAcquired" : acquired * channelCount,
+            "samplesIngested" : received,
+            "samplesCommitted" : committed,
+            "samplesCommittedTotal" :
+                sentinel.metrics.value("sentinel_samples_committed_total"),
+            "acquiredPerSecond" : round(acquired * channelCount / elapsed, 1),
+            "ingestedPerSecond" : round(received / elapsed, 1),
+            "committedPerSecond" : round(committed / elapsed, 1),
+            "overruns" : sum(
+                value for name, value in sentinel.metrics.snapshot().items()
+                if name.startswith("sentinel_overruns_total")),
+            "samplesDropped" :
+                sentinel.metrics.value("sentinel_samples_dropped_total"),
+            "metrics" : sentinel.metrics.snapshot(),
+            "latency" : {
+                "meanSeconds" : Benchmark.__mean(latencies),
+                "maxSeconds" : max(maxLatencies) if maxLatencies else None },
+            "writebackSeconds" : {
+                "mean" : Benchmark.__mean(writebackDurations),
+                "max" : max(writebackDurations) \
+                    if writebackDurations else None },
+            "queueDepth" : queueDepth,
+            "processes" : processStats }
+
+    def __createConfig(self, runDir, scanRate, channelCount):
+        """
+        Creates a configuration with a single measurement configuration, that
+        scans channelCount channels of the simulated backend.
+        """
+
+        channels = {}
+        measurements = {}
+        waveforms = {}
+        for channel in range(channelCount):
+            tag = "U" + str(channel)
+            channels[str(channel)] = tag
+            measurements["M" + str(channel)] = tag
+            waveforms[str(channel)] = {
+                "Type" : "Sine",
+                "Amplitude" : 1.0,
+                "Frequency" : 1.0 + channel,
+                "Noise" : 0.01 }
+
+        return {
+            SentinelConfig.JSON_DATABASE_CONFIG : {
+                SentinelConfig.JSON_DATABASE_NAME :
+                    os.path.join(runDir, Benchmark.DATABASE_NAME),
+                SentinelConfig.JSON_DATABASE_CHANGE_INT : 0,
+                SentinelConfig.JSON_WRITE_INTERVALL : self.__writeIntervall },
+            SentinelConfig.JSON_DAQ_CONFIG : {
+                SentinelConfig.JSON_DAQ_BACKEND :
+                    DaqBackend.BACKEND_SIMULATED,
+                SentinelConfig.JSON_DAQ_WAVEFORMS : waveforms },
+            SentinelConfig.JSON_MEASUREMENT_CONFIG : [{
+                SentinelConfig.JSON_MEASUREMENT_NAME : "Benchmark",
+                SentinelConfig.JSON_MEASUREMENT_CHANNELS : channels,
+                SentinelConfig.JSON_MEASUREMENT_SCANRATE : scanRate,
+                SentinelConfig.JSON_MEASUREMENTS : measurements,
+                SentinelConfig.JSON_MEASUREMENT_OUT_STATE : False }],
+            SentinelConfig.JSON_MEAS_CONTROL : {
+                SentinelConfig.JSON_MEAS_CONTROL_SWITCH_INT : 3600,
+                SentinelConfig.JSON_MEAS_CONTROL_OUTPUT : [29, 31, 36, 38] } }
+
+    def __sampleChildProcesses(self, processStats):
+        """
+        Reads CPU time and peak RSS of all child processes (manager and worker
+        pool) from /proc, and stores the latest values in processStats.
+        """
+
+        ownPid = os.getpid()
+        for entry in os.listdir("/proc"):
+            if not entry.isdigit():
+                continue
+            try:
+                with open("/proc/" + entry + "/stat") as statFile:
+                    stat = statFile.read()
+                # The command name may contain spaces, so split after it.
+                fields = stat[stat.rindex(")") + 2:].split()
+                if int(fields[1]) != ownPid:
+                    continue
+                cpuSeconds = \
+                    (int(fields[11]) + int(fields[12])) / self.__clockTicks
+                peakRss = 0
+                with open("/proc/" + entry + "/status") as statusFile:
+                    for line in statusFile:
+                        if line.startswith("VmHWM:"):
+                            peakRss = int(line.split()[1])
+                with open("/proc/" + entry + "/cmdline", "rb") as cmdFile:
+                    cmdline = cmdFile.read().replace(b"\0", b" ").decode(
+                        errors = "replace").strip()
+            except (OSError, ValueError, IndexError):
+                # Process terminated in the meantime.
+                continue
+
+            processStats["pid_" + entry] = {
+                "pid" : int(entry),
+                "cmdline" : cmdline,
+                "cpuSeconds" : round(cpuSeconds, 3),
+                "peakRssKiB" : peakRss }
+
+    @staticmethod
+    def __mean(values):
+        if not values:
+            return None
+        return sum(values) / len(values)
+
+if __name__ == '__main__':
+    # Set up argparse.
+    parser = argparse.ArgumentParser(
+        description="Measures the throughput of the Sentinel pipeline.")
+    parser.add_argument(
+        '--scanRate', '-r',
+        dest='scanRates',
+        type=int,
+        nargs='+',
+        default=[10000],
+        help='One or more scan rates per channel.')
+    parser.add_argument(
+        '--channels', '-n',
+        dest='channels',
+        type=int,
+        nargs='+',
+        default=[1],
+        help='One or more channel counts.')
+    parser.add_argument(
+        '--duration', '-d',
+        dest='duration',
+        type=float,
+        default=30.0,
+        help='Duration of a single run in seconds.')
+    parser.add_argument(
+        '--writeIntervall', '-w',
+        dest='writeIntervall',
+        type=int,
+        default=1000,
+        help='Write intervall of the database interface in milliseconds.')
+    parser.add_argument(
+        '--output', '-o',
+        dest='output',
+        default='benchmark.json',
+        help='Path of the JSON result file.')
+    parser.add_argument(
+        '--workDir',
+        dest='workDir',
+        default=None,
+        help='Directory for the database files. Defaults to a temporary '
+        'directory, that is deleted afterwards.')
+    args = parser.parse_args()
+
+    workDir = args.workDir
+    if workDir is None:
+        workDir = tempfile.mkdtemp(prefix = "sentinelBenchmark_")
+
+    benchmark = Benchmark(workDir, args.duration, args.writeIntervall)
+    results = []
+    try:
+        for scanRate in args.scanRates:
+            for channelCount in args.channels:
+                if scanRate * channelCount > DaqBackend.MAX_SAMPLE_RATE:
+                    print(
+                        "Skipping " + str(channelCount) + " channels at " +
+                        str(scanRate) + " S/s. Exceeds maximum sample rate.")
+                    continue
+                print(
+                    "Running " + str(channelCount) + " channels at " +
+                    str(scanRate) + " S/s.")
+                result = benchmark.run(scanRate, channelCount)
+                print(
+                    "Committed " + str(result["committedPerSecond"]) +
+                    " samples/s.")
+                results.append(result)
+    finally:
+        if args.workDir is None:
+            shutil.rmtree(workDir, ignore_errors = True)
+
+    with open(args.output, "w") as outputFile:
+        json.dump({
+            "created" : datetime.datetime.now().isoformat(),
+            "host" : platform.node(),
+            "platform" : platform.platform(),
+            "python" : platform.python_version(),
+            "duration" : args.duration,
+            "writeIntervall" : args.writeIntervall,
+            "runs" : results },
+            outputFile,
+            indent = 4)
+    print("Results written to " + args.output)
@@ -0,0 +1,155 @@
+"""
+This program has been created as part of the "Mikrosystemtechnik Labor" lecture
+at the "Institut für Sensor und Aktuator Systeme" TU Wien.
+This class puts blocks back into the order of the scan. The processing workers
+finish the acquired blocks in any order, but stages of the database interface,
+that keep state from block to block, like reductions and triggers, need them
+in order. The blocks of every scan are passed to a stream object in the order
+of their first index. Missing blocks are waited for, until too many blocks are
+held back. Then the block is considered lost, and the stream is restarted
+after the gap.
+
+Author: David FREISMUTH
+Date: DEC 2019
+License:
+"""
+
+class BlockSequencer:
+    """
+    Passes items, that are identified by the start time of their scan and
+    their first index, to a stream object per scan, in the order of the scan.
+    A stream object provides restart(index), which starts the stream at the
+    given index and discards its state, and process(item), which returns a
+    list of results.
+    """
+
+    # Count of items, that are held back waiting for a missing item. If it is
+    # exceeded, the missing item is considered lost, i.e. because of an
+    # overrun of the ring buffer, and the stream restarts after the gap.
+    REORDER_WINDOW = 16
+
+    # Count of scans, whose items are still accepted. Items of older scans are
+    # dropped.
+    SCAN_COUNT = 2
+
+    def __init__(self, createStream, gapCounter = None, lateCounter = None):
+        """
+        Parameters:
+        createStream (function): Called with the first item of a scan. Returns
+        the stream object of the scan.
+
+        gapCounter (Counter): Optional counter of skipped gaps.
+
+        lateCounter (Counter): Optional counter of dropped items, that
+        arrived after their stream has moved on.
+        """
+
+        self.__createStream = createStream
+        self.__gapCounter = gapCounter
+        self.__lateCounter = lateCounter
+
+        # Sequences by scan start time.
+        self.__sequences = {}
+
+    def push(self, scanStartTime, firstIndex, length, item, ordered = False):
+        """
+        Adds an item.
+
+        Parameters:
+        scanStartTime (float): The start time of the scan of the item.
+
+        firstIndex (int): The index of the first sample of the item.
+
+        length (int): The count of samples of the item.
+
+        item (object): The item, that is passed to the stream.
+
+        ordered (bool): If True, the items of the scan are pushed in order,
+        and a gap before the item is intended. The stream is restarted at the
+        item without waiting.
+
+        Returns:
+        The list of results of the stream. May be empty.
+        """
+
+        results = []
+        sequence = self.__sequences.get(scanStartTime)
+        if sequence is None:
+            if self.__sequences and scanStartTime < min(self.__sequences):
+                self.__countLate()
+                return results
+            sequence = _Sequence(self.__createStream(item))
+            self.__sequences[scanStartTime] = sequence
+            while len(self.__sequences) > BlockSequencer.SCAN_COUNT:
+                oldest = self.__sequences.pop(min(self.__sequences))
+                results.extend(self.__drain(oldest))
+
+        if firstIndex < sequence.nextIndex:
+            self.__countLate()
+            return results
+        if ordered and firstIndex > sequence.nextIndex:
+            sequence.restart(firstIndex)
+        sequence.pending[firstIndex] = (length, item)
+        while True:
+            if sequence.nextIndex in sequence.pending:
+                results.extend(sequence.process())
+            elif len(sequence.pending) > BlockSequencer.REORDER_WINDOW:
+                self.__skipGap(sequence)
+            else:
+                return results
+
+    def flush(self):
+        """
+        Passes the items, that are held back, to their streams, as if the
+        missing items have been lost, and ends all streams.
+
+        Returns:
+        The list of results of the streams.
+        """
+
+        results = []
+        for scanStartTime in sorted(self.__sequences):
+            results.extend(self.__drain(self.__sequences[scanStartTime]))
+        self.__sequences = {}
+        return results
+
+    def __drain(self, sequence):
+        results = []
+        while sequence.pending:
+            if sequence.nextIndex not in sequence.pending:
+                self.__skipGap(sequence)
+            results.extend(sequence.process())
+        return results
+
+    def __skipGap(self, sequence):
+        sequence.restart(min(sequence.pending))
+        if self.__gapCounter is not None:
+            self.__gapCounter.inc()
+
+    def __countLate(self):
+        if self.__lateCounter is not None:
+            self.__lateCounter.inc()
+
+class _Sequence:
+    """
+    The items of one scan, that wait for their predecessor, and the stream
+    object of the scan.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.pending = {}
+        self.restart(0)
+
+    def restart(self, index):
+        self.nextIndex = index
+        self.stream.restart(index)
+
+    def process(self):
+        """
+        Passes the next pending item to the stream.
+        """
+
+        length, item = self.pending.pop(self.nextIndex)
+        self.nextIndex += length
+        return self.stream.process(item)
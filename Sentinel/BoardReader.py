@@ -0,0 +1,320 @@
+"""
+This program has been created as part of the "Mikrosystemtechnik Labor" lecture
+at the "Institut für Sensor und Aktuator Systeme" TU Wien.
+This class reads the scan buffer of a single DAQ board in its own thread, or
+from a coroutine of the asyncio runtime, that calls poll(). If
+several stacked boards are scanned, one reader per board runs in parallel. The
+read samples are staged per board, until the acquisition thread merges the
+staged samples of all boards into one time aligned block. The reader schedules
+its reads from the fill level of the scan buffer, so the read target is reached
+after the configured latency, but at the latest when the scan buffer is filled
+to the configured fraction.
+
+Author: David FREISMUTH
+Date: DEC 2019
+License:
+"""
+
+# Python imports
+from collections import deque
+import threading
+import time
+
+# Third party imports
+import numpy as np
+
+# Project imports
+from DaqBackend import DaqBackend
+
+class BoardReader:
+    """
+    Reads the samples of one DAQ board into a staging queue.
+    """
+
+    # Contant that specifies, that all available data shall be read.
+    READ_ALL_AVAILABLE = -1
+
+    # Values of overrun, that tell which overrun has stopped the reader.
+    OVERRUN_HARDWARE = "hardware"
+    OVERRUN_BUFFER = "buffer"
+
+    # Upper limit of a single wait for samples. Keeps the reader responsive to
+    # stop requests. In seconds.
+    __MAX_READ_WAIT = 0.5
+
+    def __init__(
+        self,
+        hat,
+        condition,
+        bufferTime,
+        readLatency,
+        readFillFraction,
+        fillGauge = None):
+        """
+        Creates the reader. The scan is not started before start() is called.
+
+        Parameters:
+        hat (DaqBackend): The DAQ board.
+
+        condition (threading.Condition): Condition of the acquisition thread.
+        It is notified, when samples have been staged or the reader stopped
+        because of an overrun. The staging queue is guarded by it.
+
+        bufferTime (float): Size of the scan buffer in seconds.
+
+        readLatency (float): Target latency of the reads in seconds.
+
+        readFillFraction (float): Fill level of the scan buffer as fraction of
+        its size, at which it is read at the latest.
+
+        fillGauge (Gauge): Optional gauge, that is set to the fill level of
+        the scan buffer at every read.
+        """
+
+        self.__hat = hat
+        self.__condition = condition
+        self.__bufferTime = bufferTime
+        self.__readLatency = readLatency
+        self.__readFillFraction = readFillFraction
+        self.__fillGauge = fillGauge
+
+        # Staged blocks as (samples x channels array, readStart, readEnd)
+        # tuples, and the count of staged samples per channel.
+        self.__staged = deque()
+        self.__stagedCount = 0
+
+        # Count of samples per channel, that are dropped before staging. Used
+        # to align the start of the scans of several boards.
+        self.__skipCount = 0
+
+        self.__thread = None
+        self.__runThread = False
+        self.__channelCount = 0
+        self.__scanRate = 0.0
+        self.__bufferSize = 0
+        self.__readTarget = 1
+
+        # The time of the start of the scan. Sample i of the scan has been
+        # acquired at scanStartTime + i / scan rate.
+        self.scanStartTime = None
+
+        # Set to OVERRUN_HARDWARE or OVERRUN_BUFFER, if the reader stopped
+        # because of an overrun. None otherwise.
+        self.overrun = None
+
+    def start(self, channelMask, channelCount, scanRate):
+        """
+        Starts a continuous scan. The samples are not read before 
+        startReading() is called.
+
+        Parameters:
+        channelMask (int): The channel mask of the scan.
+
+        channelCount (int): The count of channels in channelMask.
+
+        scanRate (float): The scan rate per channel.
+
+        Returns:
+        The time of the start of the scan as float timestamp.
+        """
+
+        self.__channelCount = channelCount
+        self.__scanRate = scanRate
+        self.overrun = None
+
+        # samples_per_channel sets the size of the scan buffer. The library
+        # allocates at least its default size.
+        self.__hat.a_in_scan_cleanup()
+        self.__hat.a_in_scan_start(
+            channel_mask = channelMask,
+            samples_per_channel = max(1, int(self.__bufferTime * scanRate)),
+            sample_rate_per_channel = scanRate,
+            options = DaqBackend.OPTION_CONTINUOUS)
+        self.scanStartTime = time.time()
+        return self.scanStartTime
+
+    def startReading(self, skipCount = 0, startThread = True):
+        """
+        Starts the reader thread.
+
+        Parameters:
+        skipCount (int): Count of samples per channel at the start of the 
+        scan, that are dropped. Used to align the scans of several boards.
+
+        startThread (bool): If False, no thread is started. The caller has to
+        call poll() repeatedly then, i.e. from a coroutine.
+        """
+
+        self.__skipCount = int(skipCount)
+        self.__bufferSize = int(self.__bufferTime * self.__scanRate)
+        self.__readTarget = max(1, int(min(
+            self.__readLatency * self.__scanRate,
+            self.__readFillFraction * self.__bufferSize)))
+        self.__runThread = True
+        if startThread:
+            self.__thread = threading.Thread(
+                target = self.__readingFunction,
+                name = "BoardReader" + str(self.__hat.address()))
+            self.__thread.start()
+
+    @staticmethod
+    def startAligned(readers, plan, startThreads = True):
+        """
+        Starts the scans of all boards of an execution plan, and aligns them
+        to the start of the scan, that started last. The scans are started 
+        one after the other, so the first samples of the boards, that started
+        earlier, are skipped.
+
+        Parameters:
+        readers (list<BoardReader>): One reader per entry of plan.boards.
+
+        plan (ExecutionPlan): The plan.
+
+        startThreads (bool): Passed to startReading().
+
+        Returns:
+        The common start time of the scans as float timestamp.
+        """
+
+        scanStartTimes = [
+            reader.start(channelMask, len(channelNumbers), plan.scanRate)
+            for reader, (boardIndex, channelNumbers, channelMask)
+            in zip(readers, plan.boards)]
+        scanStartTime = max(scanStartTimes)
+        for reader, readerStartTime in zip(readers, scanStartTimes):
+            reader.startReading(
+                round((scanStartTime - readerStartTime) * plan.scanRate),
+                startThreads)
+        return scanStartTime
+
+    def stop(self):
+        """
+        Stops the reader thread and the scan. Staged samples are discarded.
+        """
+
+        self.__runThread = False
+        if self.__thread is not None:
+            self.__thread.join()
+            self.__thread = None
+        self.__hat.a_in_scan_stop()
+        self.__hat.a_in_scan_cleanup()
+        with self.__condition:
+            self.__staged.clear()
+            self.__stagedCount = 0
+            self.__skipCount = 0
+
+    def available(self):
+        """
+        Returns the count of staged samples per channel. Has to be called
+        with the condition acquired.
+        """
+
+        return self.__stagedCount
+
+    def take(self, count):
+        """
+        Removes the oldest count samples per channel from the staging queue.
+        Has to be called with the condition acquired.
+
+        Parameters:
+        count (int): The count of samples per channel. Must not exceed
+        available().
+
+        Returns:
+        A (samples, readStart, readEnd) tuple. samples is a (count x channels)
+        array. readStart is the start of the read of the oldest sample,
+        readEnd the end of the read of the newest sample.
+        """
+
+        parts = []
+        readStart = None
+        readEnd = None
+        remaining = count
+        while remaining > 0:
+            samples, blockReadStart, blockReadEnd = self.__staged[0]
+            if readStart is None:
+                readStart = blockReadStart
+            readEnd = blockReadEnd
+            if len(samples) <= remaining:
+                self.__staged.popleft()
+                parts.append(samples)
+                remaining -= len(samples)
+            else:
+                parts.append(samples[:remaining])
+                self.__staged[0] = (
+                    samples[remaining:], blockReadStart, blockReadEnd)
+                remaining = 0
+        self.__stagedCount -= count
+
+        if len(parts) == 1:
+            return parts[0], readStart, readEnd
+        return np.concatenate(parts), readStart, readEnd
+
+    def poll(self):
+        """
+        Reads the scan buffer, if the read target has been reached. Read
+        samples are staged and the condition is notified.
+
+        Returns:
+        The time in seconds, until the read target will be reached, or 0, if
+        the scan buffer has been read. None, if the reader stopped because of
+        an overrun.
+        """
+
+        # Wait only for the samples, that are missing to the read target. If
+        # the last read has been delayed, the backlog is read without waiting,
+        # so the fill level of the scan buffer stays low.
+        status = self.__hat.a_in_scan_status()
+        if self.__fillGauge is not None:
+            self.__fillGauge.set(
+                status.samples_available / max(self.__bufferSize, 1))
+        missing = self.__readTarget - status.samples_available
+        if missing > 0 and status.running:
+            return min(missing / self.__scanRate, BoardReader.__MAX_READ_WAIT)
+
+        # Read all available samples from all channels. Timeout is ignored.
+        readStart = time.monotonic()
+        acquiredData = self.__hat.a_in_scan_read_numpy(
+            samples_per_channel = BoardReader.READ_ALL_AVAILABLE,
+            timeout = 0)
+        readEnd = time.monotonic()
+
+        # Samples have been lost, so the sample counter does not correspond to
+        # the time since the start of the scan anymore. The acquisition has to
+        # restart the scan.
+        if acquiredData.hardware_overrun or acquiredData.buffer_overrun:
+            with self.__condition:
+                if acquiredData.hardware_overrun:
+                    self.overrun = BoardReader.OVERRUN_HARDWARE
+                else:
+                    self.overrun = BoardReader.OVERRUN_BUFFER
+                self.__condition.notify_all()
+            return None
+
+        if acquiredData.data.size == 0:
+            return 0
+
+        samples = acquiredData.data.reshape(-1, self.__channelCount)
+        with self.__condition:
+            if self.__skipCount > 0:
+                skipped = min(self.__skipCount, len(samples))
+                self.__skipCount -= skipped
+                samples = samples[skipped:]
+            if len(samples) > 0:
+                self.__staged.append((samples, readStart, readEnd))
+                self.__stagedCount += len(samples)
+                self.__condition.notify_all()
+        return 0
+
+    def __readingFunction(self):
+        """
+        Thread function, that reads the scan buffer, until the reader is
+        stopped or an overrun occurs.
+        """
+
+        while self.__runThread:
+            wait = self.poll()
+            if wait is None:
+                return
+            if wait > 0:
+                time.sleep(wait)
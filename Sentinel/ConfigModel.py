@@ -0,0 +1,360 @@
+"""
+This program has been created as part of the "Mikrosystemtechnik Labor" lecture
+at the "Institut für Sensor und Aktuator Systeme" TU Wien.
+This module contains the building blocks of the configuration model: Immutable,
+slotted sections, that are validated once, when the configuration file is
+loaded, and the parsers of their values. Problems are reported with the path of
+the offending key, and unknown keys with the most similar known key, so typos
+are found at startup and not later in a worker thread. Sections can be shared
+between threads without copying and are cheap to pickle.
+
+Author: David FREISMUTH
+Date: DEC 2019
+License:
+"""
+
+# Python imports
+import difflib
+
+class ConfigError(ValueError):
+    """
+    Raised, when a configuration is invalid. Holds all problems, that have been
+    found, as (path, message) tuples.
+    """
+
+    def __init__(self, problems):
+        """
+        Parameters:
+        problems (list<tuple<string,string>>): The problems of the
+        configuration. The path points to the offending key, i.e.
+        "DatabaseConfig.WriteIntervall".
+        """
+
+        self.problems = list(problems)
+        super().__init__("\n".join(
+            (path + ": " if path else "") + message
+            for path, message in self.problems))
+
+    def prefixed(self, prefix):
+        """
+        Returns a ConfigError with the same problems, whose paths are relative
+        to prefix.
+
+        Parameters:
+        prefix (string): The path of the element, the problems have been found
+        in.
+        """
+
+        return ConfigError(
+            (joinPath(prefix, path), message)
+            for path, message in self.problems)
+
+def joinPath(prefix, path):
+    """
+    Joins two configuration paths. List indices are appended without dot.
+    """
+
+    if not prefix:
+        return path
+    if not path:
+        return prefix
+    if path.startswith("["):
+        return prefix + path
+    return prefix + "." + path
+
+def describe(value):
+    """
+    Returns a short description of a JSON value for error messages.
+    """
+
+    if isinstance(value, dict):
+        return "an object"
+    if isinstance(value, list):
+        return "a list"
+    return repr(value)
+
+def suggestion(key, knownKeys):
+    """
+    Returns a hint pointing to the known key, that is most similar to key, or
+    an empty string, if there is none.
+    """
+
+    matches = difflib.get_close_matches(str(key), list(knownKeys), n = 1)
+    if not matches:
+        return ""
+    return " Did you mean '" + matches[0] + "'?"
+
+# PARSERS
+# Parsers take a JSON value and return the value, that is stored in the model.
+# They raise ValueError with a message, that does not contain the path. The
+# path is added by the enclosing section. Parsers of nested elements raise
+# ConfigError with paths relative to the element.
+
+def string(value):
+    if not isinstance(value, str) or not value:
+        raise ValueError("Expected a non empty string, got " +
+            describe(value) + ".")
+    return value
+
+def boolean(value):
+    if not isinstance(value, bool):
+        raise ValueError("Expected true or false, got " + describe(value) +
+            ".")
+    return value
+
+def integer(minimum = None, maximum = None):
+    """
+    Returns a parser for integers in [minimum, maximum]. None leaves the
+    corresponding side open.
+    """
+
+    def parse(value):
+        if isinstance(value, bool) or not isinstance(value, int) or \
+            (minimum is not None and value < minimum) or \
+            (maximum is not None and value > maximum):
+            raise ValueError("Expected an integer" +
+                _rangeText(minimum, maximum) + ", got " + describe(value) +
+                ".")
+        return value
+    return parse
+
+def number(minimum = None, maximum = None, exclusiveMinimum = False):
+    """
+    Returns a parser for numbers in [minimum, maximum], or (minimum, maximum],
+    if exclusiveMinimum is set. The values are converted to float.
+    """
+
+    def parse(value):
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or \
+            (minimum is not None and value < minimum) or \
+            (exclusiveMinimum and value == minimum) or \
+            (maximum is not None and value > maximum):
+            if exclusiveMinimum and maximum is None:
+                rangeText = " larger than " + str(minimum)
+            else:
+                rangeText = _rangeText(minimum, maximum)
+            raise ValueError("Expected a number" + rangeText + ", got " +
+                describe(value) + ".")
+        return float(value)
+    return parse
+
+def oneOf(*choices, ignoreCase = False):
+    """
+    Returns a parser, that accepts one of choices. If ignoreCase is set, the
+    value is compared case insensitively and returned as in choices.
+    """
+
+    def parse(value):
+        if isinstance(value, str):
+            for choice in choices:
+                if value == choice or \
+                    (ignoreCase and value.upper() == choice.upper()):
+                    return choice
+        raise ValueError(
+            "Expected one of " + ", ".join(repr(c) for c in choices) +
+            ", got " + describe(value) + "." +
+            (suggestion(str(value).upper(), choices) if ignoreCase else
+            suggestion(value, choices)))
+    return parse
+
+def listOf(parser, minimumLength = 0, length = None, unique = False):
+    """
+    Returns a parser for lists, whose entries are parsed with parser. The list
+    is returned as a tuple.
+    """
+
+    def parse(value):
+        if not isinstance(value, list):
+            raise ValueError("Expected a list, got " + describe(value) + ".")
+        if length is not None and len(value) != length:
+            raise ValueError("Expected a list of " + str(length) +
+                " entries, got " + str(len(value)) + ".")
+        if len(value) < minimumLength:
+            raise ValueError("Expected at least " + str(minimumLength) +
+                " entries, got " + str(len(value)) + ".")
+        entries = []
+        problems = []
+        for index, entry in enumerate(value):
+            entries.append(_parseElement(
+                parser, entry, "[" + str(index) + "]", problems))
+        if problems:
+            raise ConfigError(problems)
+        if unique and len(set(entries)) != len(entries):
+            raise ValueError("Entries have to be unique, got " +
+                str(value) + ".")
+        return tuple(entries)
+    return parse
+
+def mappingOf(keyParser, valueParser, minimumLength = 0):
+    """
+    Returns a parser for JSON objects. Keys are parsed with keyParser, values
+    with valueParser. The object is returned as tuple of (key, value) tuples in
+    the order of the configuration file, so it stays immutable. dict() turns
+    it back into a dictionary.
+    """
+
+    def parse(value):
+        if not isinstance(value, dict):
+            raise ValueError("Expected an object, got " + describe(value) +
+                ".")
+        if len(value) < minimumLength:
+            raise ValueError("Expected at least " + str(minimumLength) +
+                " entries, got " + str(len(value)) + ".")
+        entries = []
+        problems = []
+        for key, entry in value.items():
+            entries.append((
+                _parseElement(keyParser, key, str(key), problems),
+                _parseElement(valueParser, entry, str(key), problems)))
+        if problems:
+            raise ConfigError(problems)
+        keys = [key for key, entry in entries]
+        if len(set(keys)) != len(keys):
+            raise ValueError("Keys have to be unique, got " +
+                ", ".join(value) + ".")
+        return tuple(entries)
+    return parse
+
+def _parseElement(parser, value, path, problems):
+    """
+    Parses value with parser. Problems are appended to problems, with paths
+    relative to the enclosing element.
+
+    Returns:
+    The parsed value, or None, if it is invalid.
+    """
+
+    try:
+        return parser(value)
+    except ConfigError as error:
+        problems.extend(error.prefixed(path).problems)
+    except ValueError as error:
+        problems.append((path, str(error)))
+    return None
+
+def _rangeText(minimum, maximum):
+    if minimum is not None and maximum is not None:
+        return " between " + str(minimum) + " and " + str(maximum)
+    if minimum is not None:
+        return " of at least " + str(minimum)
+    if maximum is not None:
+        return " of at most " + str(maximum)
+    return ""
+
+# SECTIONS
+
+class ConfigField:
+    """
+    Describes a key of a configuration section.
+    """
+
+    __slots__ = ("key", "attribute", "parser", "default", "required")
+
+    def __init__(self, key, attribute, parser, default = None,
+        required = False):
+        """
+        Parameters:
+        key (string): The JSON key.
+
+        attribute (string): The attribute of the section, the parsed value is
+        stored in.
+
+        parser (function): Parses the JSON value. See PARSERS.
+
+        default (object): The value of the attribute, if the key is omitted.
+
+        required (bool): Wether the key has to be given.
+        """
+
+        self.key = key
+        self.attribute = attribute
+        self.parser = parser
+        self.default = default
+        self.required = required
+
+class ConfigSection:
+    """
+    Base of the immutable configuration sections. Subclasses list their keys in
+    FIELDS and derive __slots__ from it. Alternative spellings of keys can be
+    given in ALIASES, which maps from the alternative to the actual key.
+    """
+
+    __slots__ = ()
+
+    FIELDS = ()
+    ALIASES = {}
+
+    def __init__(self, values):
+        """
+        Parses and validates a JSON object.
+
+        Parameters:
+        values (dict): The JSON object.
+
+        Throws:
+        ConfigError: With all problems of the section. Paths are relative to
+        the section.
+        """
+
+        problems = []
+        if not isinstance(values, dict):
+            raise ConfigError([("", "Expected an object, got " +
+                describe(values) + ".")])
+
+        knownKeys = [field.key for field in self.FIELDS]
+        given = {}
+        for key, value in values.items():
+            actualKey = self.ALIASES.get(key, key)
+            if actualKey not in knownKeys:
+                problems.append((str(key), "Unknown key." +
+                    suggestion(key, knownKeys)))
+            elif actualKey in given:
+                problems.append((str(key), "Duplicate of key '" +
+                    actualKey + "'."))
+            else:
+                given[actualKey] = value
+
+        for field in self.FIELDS:
+            if field.key in given:
+                parsed = _parseElement(
+                    field.parser, given[field.key], field.key, problems)
+            else:
+                if field.required:
+                    problems.append(
+                        (field.key, "Missing required key."))
+                parsed = field.default
+            object.__setattr__(self, field.attribute, parsed)
+
+        if not problems:
+            problems.extend(self._check())
+        if problems:
+            raise ConfigError(problems)
+
+    def _check(self):
+        """
+        Checks the parsed values of the section as a whole. Called, if all
+        values are valid on their own.
+
+        Returns:
+        A list of (path, message) tuples.
+        """
+
+        return []
+
+    def __setattr__(self, name, value):
+        raise AttributeError(type(self).__name__ + " objects are immutable.")
+
+    def __delattr__(self, name):
+        raise AttributeError(type(self).__name__ + " objects are immutable.")
+
+    def __getstate__(self):
+        return tuple(getattr(self, slot) for slot in self.__slots__)
+
+    def __setstate__(self, state):
+        for slot, value in zip(self.__slots__, state):
+            object.__setattr__(self, slot, value)
+
+    def __repr__(self):
+        return type(self).__name__ + "(" + ", ".join(
+            slot + " = " + repr(getattr(self, slot))
+            for slot in self.__slots__) + ")"
@@ -0,0 +1,403 @@
+"""
+This program has been created as part of the "Mikrosystemtechnik Labor" lecture
+at the "Institut für Sensor und Aktuator Systeme" TU Wien.
+This module defines the interface of the DAQ backends, that can be used by the
+data acquisition module. The interface is the subset of the daqhats.mcc118
+class, that is used for continuous scanning. Besides the MCC118 hardware, a
+simulated MCC118 is provided. It produces configurable waveforms at the real
+wall clock rate and mimics the buffer handling and overrun flags of the
+hardware, so the sentinel can be run on machines without a DAQ HAT.
+
+Author: David FREISMUTH
+Date: DEC 2019
+License:
+"""
+
+# Python imports
+from abc import ABC, abstractmethod
+from collections import namedtuple
+import threading
+import time
+
+# Third party imports
+import numpy as np
+
+# Result of a_in_scan_read(). Same fields as the result of
+# daqhats.mcc118.a_in_scan_read().
+ScanReadResult = namedtuple(
+    "ScanReadResult",
+    ["running", "hardware_overrun", "buffer_overrun", "triggered", "timeout",
+    "data"])
+
+# Result of a_in_scan_status(). Same fields as the result of
+# daqhats.mcc118.a_in_scan_status().
+ScanStatus = namedtuple(
+    "ScanStatus",
+    ["running", "hardware_overrun", "buffer_overrun", "triggered",
+    "samples_available"])
+
+class DaqBackend(ABC):
+    """
+    Interface of a DAQ backend. Method names and parameters follow the
+    daqhats.mcc118 class, so the hardware object can be used as backend
+    directly. Subclasses have to implement all abstract methods, otherwise
+    they can not be instantiated.
+    """
+
+    # Backend identifiers, as used in the configuration file.
+    BACKEND_MCC118 = "MCC118"
+    BACKEND_SIMULATED = "Simulated"
+
+    # Value of daqhats.OptionFlags.CONTINUOUS.
+    OPTION_CONTINUOUS = 0x0008
+
+    # The count of analog input channels of the MCC118.
+    CHANNEL_COUNT = 8
+
+    # The maximum aggregated sample rate of the MCC118 in samples per second.
+    MAX_SAMPLE_RATE = 100000.0
+
+    @staticmethod
+    def create(daqConfig, boardIndex = 0):
+        """
+        Creates the backend of a board, that is specified by the DAQ 
+        configuration.
+
+        Parameters:
+        daqConfig (DaqConfig): The DAQ configuration, as returned by
+        SentinelConfig.getConfig(SentinelConfig.JSON_DAQ_CONFIG).
+
+        boardIndex (int): The index of the board in daqConfig.boards.
+
+        Returns:
+        An object, that implements the DaqBackend interface.
+
+        Throws:
+        ValueError: When an unknown backend is configured.
+        """
+
+        backend = daqConfig.backend
+        board = daqConfig.boards[boardIndex]
+        address = board.address
+
+        if backend == DaqBackend.BACKEND_MCC118:
+            # Import daqhats only, when the hardware is actually used.
+            from daqhats import mcc118, HatIDs
+            from daqhats_utils import select_hat_device
+            if address is None:
+                address = select_hat_device(HatIDs.MCC_118)
+            return mcc118(int(address))
+        elif backend == DaqBackend.BACKEND_SIMULATED:
+            return SimulatedMcc118(
+                address = 0 if address is None else int(address),
+                waveforms = dict(board.waveforms))
+        else:
+            raise ValueError("Unknown DAQ backend " + str(backend) + ".")
+
+    @abstractmethod
+    def address(self):
+        """
+        Returns the address of the board.
+        """
+
+    @abstractmethod
+    def a_in_scan_start(
+        self,
+        channel_mask,
+        samples_per_channel,
+        sample_rate_per_channel,
+        options):
+        """
+        Starts a hardware paced scan of the channels in channel_mask.
+        """
+
+    @abstractmethod
+    def a_in_scan_status(self):
+        """
+        Returns a ScanStatus of the current scan.
+        """
+
+    @abstractmethod
+    def a_in_scan_read(self, samples_per_channel, timeout):
+        """
+        Reads samples from the scan buffer. Returns a ScanReadResult, whose
+        data field is a list of interleaved floats.
+        """
+
+    @abstractmethod
+    def a_in_scan_read_numpy(self, samples_per_channel, timeout):
+        """
+        Like a_in_scan_read(), but the data field is a numpy array.
+        """
+
+    @abstractmethod
+    def a_in_scan_stop(self):
+        """
+        Stops the scan. Already acquired samples can still be read.
+        """
+
+    @abstractmethod
+    def a_in_scan_cleanup(self):
+        """
+        Frees the resources of the scan.
+        """
+
+class SimulatedMcc118(DaqBackend):
+    """
+    Software simulation of a MCC118 in continuous scan mode. Samples are
+    produced at the wall clock rate, from the moment a_in_scan_start() has been
+    called. If they are not read fast enough, the scan buffer overruns and the
+    scan stops, like it would on the hardware.
+    """
+
+    # Waveform types and their parameters, as used in the configuration file.
+    WAVEFORM_TYPE = "Type"
+    WAVEFORM_AMPLITUDE = "Amplitude"
+    WAVEFORM_FREQUENCY = "Frequency"
+    WAVEFORM_OFFSET = "Offset"
+    WAVEFORM_NOISE = "Noise"
+
+    WAVEFORM_SINE = "Sine"
+    WAVEFORM_SQUARE = "Square"
+    WAVEFORM_SAWTOOTH = "Sawtooth"
+    WAVEFORM_CONSTANT = "Constant"
+    WAVEFORM_TYPES = (
+        WAVEFORM_SINE,
+        WAVEFORM_SQUARE,
+        WAVEFORM_SAWTOOTH,
+        WAVEFORM_CONSTANT)
+
+    # The input range of the MCC118 in volts.
+    INPUT_RANGE = 10.0
+
+    # The waveforms are a function of the wall clock time since this 
+    # reference, so simulated boards, that are scanned in parallel, see the
+    # same signal at the same time.
+    __TIME_REFERENCE = time.time()
+
+    def __init__(self, address = 0, waveforms = None):
+        """
+        Creates the simulated board.
+
+        Parameters:
+        address (int): The address the simulated board reports.
+
+        waveforms (dict<int,WaveformConfig>): Maps from channel number to a
+        waveform description. Channels without a description produce a 1 V,
+        1 Hz sine.
+        """
+
+        self.__address = address
+        self.__waveforms = dict(waveforms or {})
+
+        # Random generator for the noise of the waveforms.
+        self.__random = np.random.default_rng()
+
+        # The state of the scan.
+        self.__lock = threading.Lock()
+        self.__channels = []
+        self.__sampleRate = 0.0
+        self.__bufferSize = 0
+        self.__startTime = 0.0
+        self.__phaseTime = 0.0
+        self.__stopTime = None
+        self.__readIndex = 0
+        self.__bufferOverrun = False
+
+    def address(self):
+        return self.__address
+
+    def a_in_scan_start(
+        self,
+        channel_mask,
+        samples_per_channel,
+        sample_rate_per_channel,
+        options):
+        """
+        Starts the simulated scan. Like on the hardware, the scan buffer holds
+        at least samples_per_channel samples, but never less than the default
+        size for the requested sample rate.
+        """
+
+        with self.__lock:
+            if self.__channels:
+                raise Exception("A scan is already active.")
+
+            channels = [
+                channel for channel in range(DaqBackend.CHANNEL_COUNT)
+                if channel_mask & (0x01 << channel)]
+            if not channels:
+                raise ValueError("Invalid channel_mask.")
+
+            if sample_rate_per_channel <= 0 or \
+                sample_rate_per_channel * len(channels) > \
+                DaqBackend.MAX_SAMPLE_RATE:
+                raise ValueError("Invalid sample_rate_per_channel.")
+
+            # Default buffer sizes of the daqhats library.
+            if sample_rate_per_channel <= 1024.0:
+                defaultSize = 1000
+            elif sample_rate_per_channel <= 10240.0:
+                defaultSize = 10000
+            else:
+                defaultSize = 100000
+
+            self.__channels = channels
+            self.__sampleRate = float(sample_rate_per_channel)
+            self.__bufferSize = max(int(samples_per_channel), defaultSize)
+            self.__startTime = time.monotonic()
+            self.__phaseTime = \
+                time.time() - SimulatedMcc118.__TIME_REFERENCE
+            self.__stopTime = None
+            self.__readIndex = 0
+            self.__bufferOverrun = False
+
+    def a_in_scan_status(self):
+        with self.__lock:
+            available = self.__samplesAvailable()
+            return ScanStatus(
+                running = self.__isRunning(),
+                hardware_overrun = False,
+                buffer_overrun = self.__bufferOverrun,
+                triggered = bool(self.__channels),
+                samples_available = available)
+
+    def a_in_scan_read(self, samples_per_channel, timeout):
+        result = self.a_in_scan_read_numpy(samples_per_channel, timeout)
+        return result._replace(data = result.data.tolist())
+
+    def a_in_scan_read_numpy(self, samples_per_channel, timeout):
+        """
+        Reads samples from the simulated scan buffer. If samples_per_channel
+        is -1, all available samples are read. Otherwise it is waited up to
+        timeout seconds until the requested count of samples is available. A
+        negative timeout waits forever.
+        """
+
+        if not self.__channels:
+            raise Exception("No scan is active.")
+
+        # Wait for the requested samples.
+        if samples_per_channel > 0:
+            deadline = time.monotonic() + timeout
+            while True:
+                with self.__lock:
+                    available = self.__samplesAvailable()
+                    running = self.__isRunning()
+                if available >= samples_per_channel or not running:
+                    break
+                remaining = deadline - time.monotonic()
+                if timeout >= 0 and remaining <= 0:
+                    break
+                missing = samples_per_channel - available
+                waitTime = missing / self.__sampleRate
+                if timeout >= 0:
+                    waitTime = min(waitTime, remaining)
+                time.sleep(waitTime)
+
+        with self.__lock:
+            available = self.__samplesAvailable()
+            if samples_per_channel < 0:
+                count = available
+            else:
+                count = min(samples_per_channel, available)
+            data = self.__generate(self.__readIndex, count)
+            self.__readIndex += count
+
+            return ScanReadResult(
+                running = self.__isRunning(),
+                hardware_overrun = False,
+                buffer_overrun = self.__bufferOverrun,
+                triggered = True,
+                timeout = \
+                    samples_per_channel > 0 and count < samples_per_channel,
+                data = data)
+
+    def a_in_scan_stop(self):
+        with self.__lock:
+            if self.__channels and self.__isRunning():
+                self.__stopTime = time.monotonic()
+
+    def a_in_scan_cleanup(self):
+        with self.__lock:
+            self.__channels = []
+            self.__stopTime = None
+            self.__bufferOverrun = False
+
+    def __producedSamples(self):
+        """
+        Returns the count of samples per channel, that have been produced since
+        the start of the scan.
+        """
+
+        if not self.__channels:
+            return 0
+        endTime = time.monotonic() if self.__stopTime is None \
+            else self.__stopTime
+        return int((endTime - self.__startTime) * self.__sampleRate)
+
+    def __samplesAvailable(self):
+        """
+        Returns the count of samples per channel in the scan buffer. Stops the
+        scan and sets the buffer overrun flag, if the buffer overflowed.
+        """
+
+        available = self.__producedSamples() - self.__readIndex
+        if available > self.__bufferSize:
+            # Samples that did not fit into the buffer are lost. Like on the
+            # hardware, the scan stops with the buffer full.
+            self.__bufferOverrun = True
+            self.__stopTime = self.__startTime + \
+                (self.__readIndex + self.__bufferSize) / self.__sampleRate
+            available = self.__bufferSize
+        return available
+
+    def __isRunning(self):
+        return bool(self.__channels) and self.__stopTime is None
+
+    def __generate(self, firstIndex, count):
+        """
+        Generates count samples per channel, starting with sample index
+        firstIndex.
+
+        Returns:
+        A numpy array of interleaved samples.
+        """
+
+        t = self.__phaseTime + \
+            (np.arange(count, dtype = np.float64) + firstIndex) / \
+            self.__sampleRate
+        data = np.empty((count, len(self.__channels)), dtype = np.float64)
+        for column, channel in enumerate(self.__channels):
+            waveform = self.__waveforms.get(channel)
+            if waveform is None:
+                waveType = SimulatedMcc118.WAVEFORM_SINE
+                amplitude, frequency, offset, noise = 1.0, 1.0, 0.0, 0.0
+            else:
+                waveType = waveform.type
+                amplitude = waveform.amplitude
+                frequency = waveform.frequency
+                offset = waveform.offset
+                noise = waveform.noise
+
+            phase = t * frequency
+            if waveType == SimulatedMcc118.WAVEFORM_SINE:
+                values = np.sin(2.0 * np.pi * phase)
+            elif waveType == SimulatedMcc118.WAVEFORM_SQUARE:
+                values = np.where(phase % 1.0 < 0.5, 1.0, -1.0)
+            elif waveType == SimulatedMcc118.WAVEFORM_SAWTOOTH:
+                values = 2.0 * (phase % 1.0) - 1.0
+            else:
+                values = np.ones(count)
+
+            values = offset + amplitude * values
+            if noise > 0.0:
+                values = values + self.__random.normal(0.0, noise, count)
+            data[:, column] = values
+
+        np.clip(
+            data,
+            -SimulatedMcc118.INPUT_RANGE,
+            SimulatedMcc118.INPUT_RANGE,
+            out = data)
+        return data.reshape(-1)
@@ -1,14 +1,20 @@
 """
 This program has been created as part of the "Mikrosystemtechnik Labor" lecture 
 at the "Institut für Sensor und Aktuator Systeme" TU Wien.
-This class handles the data acquistion via the MCC118 DAQ card. The DAQ card is
-run in continuous measurement mode. A Thread, that is spawned by this class on
-start(), clears the buffer of the DAQ card, and pushes the acquired values to
-a multiprocessing.Pool for further processing. The processed value are then 
+This class handles the data acquistion via one or more stacked MCC118 DAQ 
+cards, or a simulation of them (see DaqBackend). The DAQ cards are run in 
+continuous measurement mode and read by one BoardReader thread each. A Thread, 
+that is spawned by this class on start(), merges the samples of the cards into
+time aligned blocks, and pushes them to a multiprocessing.Pool for further 
+processing. The processed value are then 
 pushed to the database interface for storage. Also, the measurement 
 configuration is handled in this module. After a specified time span has elapsed
 the measurement configuration switches. A corresponding message is sent to the
 GPIO handler module, that sets up the ouput accordingly.
+With the asyncio runtime, the same steps run as coroutines in the event loop of
+the sentinel (see runAsync()), and the blocks are processed in a
+ProcessPoolExecutor, whose results are handed over to the database interface
+directly.
 
 Author: David FREISMUTH
 Date: DEC 2019
@@ -17,33 +23,53 @@ License:
 
 # Python imports
 from __future__ import print_function
-from time import sleep
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
 import threading
-from multiprocessing import Process, Pool
-from datetime import datetime, timedelta
-import parser
+from multiprocessing import Pool
 import signal
 
-# MC118 imports
-from daqhats import mcc118, OptionFlags, HatIDs, HatError
-from daqhats_utils import select_hat_device, enum_mask_to_string,\
-     chan_list_to_mask
+# Third party imports
+import numpy as np
 
 # Project imports
 from SentinelConfig import SentinelConfig
+from DaqBackend import DaqBackend
+from BoardReader import BoardReader
+from SampleRingBuffer import SampleRingBuffer
+from MeasurementTransport import MeasurementBlock, BlockTrace
+from Metrics import MetricsRegistry
 
 class DataAquisition:
     """
     Encapsulates the data aquisition functions.
     """
 
-    # Contant that specifies, that all available data shall be read.
-    READ_ALL_AVAILABLE = -1
-    
-    # Time the scan buffer is popped. In seconds.
-    __SCAN_SLEEP_TIME = 0.8
-
-    def __init__(self, configObject, dbIfQueue, gpioQueue):
+    # Upper limit of a single wait for samples of the boards. Keeps the 
+    # acquisition thread responsive to stop requests. In seconds.
+    __MAX_MERGE_WAIT = 0.5
+
+    # Size of the shared memory ring buffer between the acquisition thread
+    # and the processing workers, in seconds of the most demanding 
+    # measurement configuration.
+    __RING_BUFFER_TIME = 4.0
+
+    # Maximum time a processing worker waits for free capacity in the
+    # transport to the database interface. In seconds.
+    __TRANSPORT_PUT_TIMEOUT = 5.0
+
+    # Context of a processing worker process. Set by initProcessingWorker().
+    __workerRingBuffer = None
+    __workerQueue = None
+    __workerExecutionPlans = None
+
+    def __init__(
+        self, 
+        configObject, 
+        dbIfQueue, 
+        gpioQueue, 
+        metrics = None,
+        runtime = SentinelConfig.RUNTIME_THREADS):
         """
         Constructor, that copies the contents of configObject into the 
         DataAquisition object and registers the storage function that is used
@@ -53,20 +79,35 @@ class DataAquisition:
             configObject (SentinelConfig): Contains the configuration for 
             creation of this object.
 
-            dbIfQueue (Manager.Queue): Managed queue object, that is used to 
-            communicate with the database interface.
+            dbIfQueue (MeasurementTransport): Transport, that is used to 
+            pass the processed values to the database interface. Not used 
+            with the asyncio runtime.
 
             gpioQueue (Manager.Queue):  Managed queue object, that is used to 
-            communicate with the GPIO module.
+            communicate with the GPIO module. An asyncio.Queue with the 
+            asyncio runtime.
+
+            metrics (MetricsRegistry): The registry, the metrics of the 
+            acquisition are registered in. If None, a private registry is 
+            used.
+
+            runtime (string): One of SentinelConfig.RUNTIMES. With 
+            RUNTIME_ASYNCIO, the acquisition has to be run with runAsync()
+            instead of start().
         """
         # Load configuration objects.
         self.__configObject = configObject
-        self.__measurementConfig = \
-            self.__configObject.getConfig(
-                SentinelConfig.JSON_MEASUREMENT_CONFIG)
         self.__measurementControl = \
             self.__configObject.getConfig(
                 SentinelConfig.JSON_MEAS_CONTROL)
+        self.__executionPlans = self.__configObject.getExecutionPlans()
+        self.__daqConfig = \
+            self.__configObject.getConfig(
+                SentinelConfig.JSON_DAQ_CONFIG)
+
+        # Condition, that is notified by the board readers, when they have 
+        # staged samples.
+        self.__readerCondition = threading.Condition()
 
         # Register worker function as Thread.
         self.__workerThread = threading.Thread(
@@ -74,15 +115,48 @@ class DataAquisition:
             target = self.__scanningFunction,
             name = "AcquisitionThread")
 
+        # Init the ring buffer, that passes the acquired samples to the 
+        # processing workers. It has to hold some seconds of samples of the 
+        # measurement configuration with the highest sample rate.
+        maxSampleRate = 1
+        for plan in self.__executionPlans:
+            maxSampleRate = max(
+                maxSampleRate,
+                plan.scanRate * plan.channelCount())
+        self.__ringBuffer = SampleRingBuffer(
+            int(maxSampleRate * DataAquisition.__RING_BUFFER_TIME))
+
         # Init Threading pool. As much processes will be spawned, as the machine
-        # has CPU cores.
-        self.__processingWorkerPool = Pool()
+        # has CPU cores. The workers attach to the ring buffer and get the 
+        # execution plans once, so only offsets, sequence numbers and the index
+        # of the plan have to be passed per block. With the asyncio runtime,
+        # the processed blocks are returned to the event loop instead of being
+        # put into the transport.
+        if runtime == SentinelConfig.RUNTIME_ASYNCIO:
+            self.__processingWorkerPool = ProcessPoolExecutor(
+                initializer = DataAquisition.initProcessingWorker,
+                initargs = (
+                    self.__ringBuffer.name,
+                    self.__ringBuffer.capacity,
+                    None,
+                    self.__executionPlans))
+        else:
+            self.__processingWorkerPool = Pool(
+                initializer = DataAquisition.initProcessingWorker,
+                initargs = (
+                    self.__ringBuffer.name,
+                    self.__ringBuffer.capacity,
+                    dbIfQueue,
+                    self.__executionPlans))
+
+        # Tasks of the asyncio runtime, that process a block and hand it over 
+        # to the database interface.
+        self.__inFlight = set()
 
         # The time a single measurment configuration is active. After that, 
         # It gets changed to the next measurment configuration.
         self.__measConfSwitchTimerIntervall = \
-            self.__measurementControl \
-                [SentinelConfig.JSON_MEAS_CONTROL_SWITCH_INT] 
+            self.__measurementControl.switchIntervall
 
         # Register timer that is responsible for periodic changing of 
         # measurement configuration.
@@ -96,35 +170,59 @@ class DataAquisition:
         # The active measurement configuration index.
         self.__activeMeasConfigIdx = 0
 
-        # Stores active measurement configuration.
-        self.__activeMeasConfig = []
-            
-        # Stores current active set of calucaltions.
-        self._currCalculations = {}
-
-        # Stores the current active measurement configuraiton name.
-        self._currMeasurementConfigName = ""
+        # The execution plan of the active measurement configuration.
+        self.__activePlan = self.__executionPlans[0]
 
         # A semaphore is needed on confugration change, so only one one call 
         # to self.changeMeasConfig() at a time is possible
         self.__changeMeasConfSem = threading.Semaphore(value = 1)
 
-        # Storage dict for acquired data. Maps from timestamps to a namedtuple
-        # object that contains the acquired data.
-        self.__acquiredData = {}
-    
-        # Current scan rate.
-        self.__currScanRate = 0
-
-        # Dictionary that maps Channel number to tag name.
-        self.__currChannelDict = {}
-
-        # The queue to the dbInterface.
+        # The transport to the dbInterface.
         self.__dbIfQueue = dbIfQueue
 
         # The queue to the gpio module.
         self.__gpioQueue = gpioQueue
 
+        # The time of the last sample of the previous scan. Used to measure
+        # the gap in the data caused by a configuration switch.
+        self.__lastSampleTime = None
+
+        # Metrics of the acquisition.
+        self.metrics = metrics if metrics is not None else MetricsRegistry()
+        self.__samplesAcquired = self.metrics.counter(
+            "sentinel_samples_acquired_total",
+            "Samples per channel, that have been read from the DAQ card.")
+        self.__overruns = {
+            kind : self.metrics.counter(
+                "sentinel_overruns_total",
+                "Overruns of the scan buffer or the ring buffer.",
+                labels = {"kind" : kind})
+            for kind in ("hardware", "buffer", "ring_buffer") }
+        self.__blocksProcessed = self.metrics.counter(
+            "sentinel_blocks_processed_total",
+            "Blocks, that have been processed and handed over to the "
+            "database interface.")
+        self.__blocksDropped = self.metrics.counter(
+            "sentinel_blocks_dropped_total",
+            "Blocks, that have been dropped by the processing workers.")
+        self.__configSwitches = self.metrics.counter(
+            "sentinel_config_switches_total",
+            "Switches of the measurement configuration.")
+        self.__configSwitchGaps = self.metrics.counter(
+            "sentinel_config_switch_gap_seconds_total",
+            "Time without samples caused by configuration switches.")
+        self.__configSwitchGap = self.metrics.gauge(
+            "sentinel_config_switch_gap_seconds",
+            "Time without samples caused by the last configuration switch.")
+        self.metrics.gauge(
+            "sentinel_active_config",
+            "Index of the active measurement configuration.",
+            function = lambda: self.__activeMeasConfigIdx)
+        self.metrics.gauge(
+            "sentinel_blocks_in_flight",
+            "Blocks in the ring buffer, that are queued or being processed.",
+            function = self.__ringBuffer.reservedBlockCount)
+
     def start(self):
         """
         Starts the worker thread
@@ -138,186 +236,551 @@ class DataAquisition:
         
         # Only start config change time, if there are more than one 
         # configurations.
-        if(len(self.__measurementConfig) > 1):
+        if(len(self.__executionPlans) > 1):
             self.__confChangeTimer.start()
 
     def __scanningFunction(self):
         """
         Worker function, that is called as thread. Initializes continuous 
-        measurement, and triggers data processing and storage functions.
-        """
-
-        # Get current measurement configuration and some values out of it.
-        self.__activeMeasConfig = \
-            self.__measurementConfig[self.__activeMeasConfigIdx]
-        self.__currScanRate = \
-            self.__activeMeasConfig[SentinelConfig.JSON_MEASUREMENT_SCANRATE]
-        self.__currCalculations = \
-            self.__activeMeasConfig[SentinelConfig.JSON_MEASUREMENTS]
-        self.__currMeasurementConfigName = \
-            self.__activeMeasConfig[SentinelConfig.JSON_MEASUREMENT_NAME]
-
-        # Write configured channel numbers from configuration into 
-        # channelNums and create a mask from it.
-        channelNums = []
-        self.__currChannelDict = \
-            self.__activeMeasConfig[SentinelConfig.JSON_MEASUREMENT_CHANNELS]
-        for channel in self.__currChannelDict.keys():
-            channelNums.append(int(channel))
-        channel_mask = chan_list_to_mask(channelNums)
-
-        # Get an instance of the selected hat device object.
-        address = select_hat_device(HatIDs.MCC_118)
-        hat = mcc118(address)
-
-        # Cleanup scanning ressources.
-        hat.a_in_scan_cleanup()
-
-        # Trigger scanning. samples_per_channel is set to the scan rate, so 
-        # buffer size is big enough to caputre one second worth of samples.
-        hat.a_in_scan_start(
-            channel_mask  = channel_mask,
-            samples_per_channel = int(self.__currScanRate),
-            sample_rate_per_channel = float(self.__currScanRate),
-            options = OptionFlags.CONTINUOUS)
+        measurement on every board of the active measurement configuration,
+        merges the samples of the boards into time aligned blocks and triggers
+        data processing and storage functions.
+        """
+
+        # Select the execution plan of the active measurement configuration.
+        # Channel masks, scan rate and measurements have been compiled, when
+        # the configuration has been loaded.
+        plan = self.__executionPlans[self.__activeMeasConfigIdx]
+        self.__activePlan = plan
+
+        # Get an instance of the configured DAQ backend for every scanned 
+        # board. Each board is read by its own reader thread.
+        readers = self.__createReaders(plan)
+
+        # Trigger scanning. The start of the scan is the time base of all 
+        # samples of the scan.
+        scanStartTime = self.__startScan(readers, plan)
+        sampleCounter = 0
+        self.__recordSwitchGap(scanStartTime)
 
         # Measurement loop.
-        asyncResult = None
         while self.__runThread:
-            # MCC118 library automatically creates a buffer for at least a 
-            # second worth of samples. To leave some margin for error, the 
-            # buffer is popped every 0.8 seconds.
-            sleep(DataAquisition.__SCAN_SLEEP_TIME)
-
-            # Read all available samples from all channels. Timeout is ignored.
-            acquiredData = hat.a_in_scan_read(
-                samples_per_channel = DataAquisition.READ_ALL_AVAILABLE,
-                timeout = 0)
-
-            # Check for an overrun error.
-            if acquiredData.hardware_overrun:
-                print('\n\nHardware overrun\n')
-                continue
-            elif acquiredData.buffer_overrun:
-                print('\n\nBuffer overrun\n')
+            # Wait until every board has staged samples. The readers notify 
+            # the condition, when they have staged samples or stopped.
+            with self.__readerCondition:
+                sampleCount, overrun, parts = self.__takeStaged(readers)
+                if sampleCount == 0 and overrun is None:
+                    self.__readerCondition.wait(
+                        DataAquisition.__MAX_MERGE_WAIT)
+                    continue
+
+            # Check for an overrun error. Samples have been lost, so the 
+            # sample counter does not correspond to the time since the start
+            # of the scan anymore. The scans of all boards are restarted, to 
+            # get a new, common time base.
+            if overrun is not None:
+                self.__reportOverrun(overrun)
+                for reader in readers:
+                    reader.stop()
+                scanStartTime = self.__startScan(readers, plan)
+                sampleCounter = 0
                 continue
 
-            # Get current timestamp.
-            timestamp = datetime.now()
-
-            args = (
-                timestamp,
-                acquiredData.data,
-                self.__dbIfQueue,
-                self.__currCalculations,
-                self.__currMeasurementConfigName,
-                self.__currChannelDict,
-                self.__currScanRate) 
+            args = self.__prepareBlock(
+                parts, 
+                sampleCount, 
+                scanStartTime, 
+                sampleCounter)
+            sampleCounter += sampleCount
+            if args is None:
+                continue
+            sequenceNumber = args[3]
 
-            # Push workload to worker pool.
-            asyncResult = self.__processingWorkerPool.apply_async(
+            # Push workload to worker pool. The block is released from the
+            # ring buffer, as soon as the worker has finished.
+            self.__processingWorkerPool.apply_async(
                 func = DataAquisition.processingFunction,
-                args = args)
+                args = args,
+                callback = \
+                    lambda handedOver, sequenceNumber = sequenceNumber: \
+                        self.__onBlockProcessed(sequenceNumber, handedOver),
+                error_callback = \
+                    lambda error, sequenceNumber = sequenceNumber: \
+                        self.__onBlockProcessed(sequenceNumber, False))
        
+        # The data of the next scan starts after the last read sample.
+        self.__lastSampleTime = \
+            scanStartTime + sampleCounter / plan.scanRate
+
         # Stop scanning.
-        hat.a_in_scan_stop()
-        hat.a_in_scan_cleanup()
+        for reader in readers:
+            reader.stop()
+
+    def __createReaders(self, plan):
+        """
+        Returns a BoardReader for every board of plan. The DAQ backend is 
+        either the selected hat device object, or a simulated one.
+        """
+
+        readers = []
+        for boardIndex, channelNumbers, channelMask in plan.boards:
+            hat = DaqBackend.create(self.__daqConfig, boardIndex)
+            readers.append(BoardReader(
+                hat,
+                self.__readerCondition,
+                self.__daqConfig.bufferTime,
+                self.__daqConfig.readLatency,
+                self.__daqConfig.readFillFraction,
+                self.metrics.gauge(
+                    "sentinel_scan_buffer_fill_ratio",
+                    "Fill level of the scan buffer at the last read.",
+                    labels = {"board" : str(hat.address())})))
+        return readers
+
+    def __recordSwitchGap(self, scanStartTime):
+        """
+        Records the time without samples between the previous scan and the 
+        scan, that started at scanStartTime.
+        """
+
+        if self.__lastSampleTime is not None:
+            gap = scanStartTime - self.__lastSampleTime
+            self.__configSwitchGaps.inc(max(gap, 0.0))
+            self.__configSwitchGap.set(gap)
+
+    def __takeStaged(self, readers):
+        """
+        Takes the samples, that every reader has staged. Has to be called with
+        __readerCondition acquired.
+
+        Returns:
+        A (sample count, overrun, parts) tuple. parts holds the result of 
+        BoardReader.take() per reader. If a reader stopped because of an 
+        overrun, overrun is set and nothing is taken.
+        """
+
+        overrun = next(
+            (reader.overrun for reader in readers if reader.overrun),
+            None)
+        if overrun is not None:
+            return 0, overrun, None
+        sampleCount = min(reader.available() for reader in readers)
+        if sampleCount == 0:
+            return 0, None, None
+        return \
+            sampleCount, None, [reader.take(sampleCount) for reader in readers]
+
+    def __reportOverrun(self, overrun):
+        """
+        Prints and counts an overrun of a reader.
+        """
+
+        if overrun == BoardReader.OVERRUN_HARDWARE:
+            print('\n\nHardware overrun\n')
+        else:
+            print('\n\nBuffer overrun\n')
+        self.__overruns[overrun].inc()
+
+    def __prepareBlock(self, parts, sampleCount, scanStartTime, firstIndex):
+        """
+        Merges the samples, that have been taken from the readers, and copies
+        them into the ring buffer.
+
+        Parameters:
+        parts (list<tuple>): The result of BoardReader.take() per board.
+
+        sampleCount (int): The count of samples per channel in parts.
+
+        scanStartTime (float): Timestamp of the start of the scan.
+
+        firstIndex (int): The index of the first sample of the block, counted
+        from the start of the scan.
+
+        Returns:
+        The arguments of processingFunction(), or None, if the block has been
+        dropped because the ring buffer is full.
+        """
+
+        # Merge the boards column wise. Row i holds the values of all 
+        # channels of sample i. A single board is passed on as it is.
+        if len(parts) == 1:
+            samples = parts[0][0]
+        else:
+            samples = np.concatenate(
+                [part[0] for part in parts], 
+                axis = 1)
+        readStart = min(part[1] for part in parts)
+        readEnd = max(part[2] for part in parts)
+        self.__samplesAcquired.inc(sampleCount)
+
+        # Copy the block into the ring buffer. If the workers fall behind too
+        # far, there is no space left and the block is dropped. The sample 
+        # counter is advanced by the caller anyway, so following blocks keep 
+        # their correct time.
+        block = self.__ringBuffer.write(samples.reshape(-1))
+        if block is None:
+            print('\n\nRing buffer overrun\n')
+            self.__overruns["ring_buffer"].inc()
+            return None
+        sequenceNumber, offset, count = block
+
+        # The trace follows the block through the pipeline.
+        trace = BlockTrace(sequenceNumber)
+        trace.stamp(BlockTrace.READ_START, readStart)
+        trace.stamp(BlockTrace.READ_END, readEnd)
+        trace.stamp(BlockTrace.DISPATCHED)
+
+        return (
+            scanStartTime,
+            firstIndex,
+            self.__activeMeasConfigIdx,
+            sequenceNumber,
+            offset,
+            count,
+            trace)
+
+    async def runAsync(self, storeFunction):
+        """
+        Coroutine, that runs the acquisition in the event loop of the asyncio
+        runtime, until it is cancelled. Replaces start(). Every switch 
+        intervall, the scan of the active measurement configuration is 
+        cancelled and the next one is started.
+
+        Parameters:
+        storeFunction (coroutine function): Called with every batch of 
+        processed blocks. Hands the batch over to the database interface.
+        """
+
+        self.__runThread = True
+        self.__gpioQueue.put_nowait(self.__activeMeasConfigIdx)
+        switchIntervall = None
+        if len(self.__executionPlans) > 1:
+            switchIntervall = self.__measConfSwitchTimerIntervall
+
+        while True:
+            plan = self.__executionPlans[self.__activeMeasConfigIdx]
+            self.__activePlan = plan
+            try:
+                await asyncio.wait_for(
+                    self.__scanAsync(plan, storeFunction), 
+                    switchIntervall)
+            except asyncio.TimeoutError:
+                pass
+
+            self.__activeMeasConfigIdx = \
+                (self.__activeMeasConfigIdx + 1) % len(self.__executionPlans)
+            self.__configSwitches.inc()
+            print("Changed measurement configuration to " + 
+                str(self.__activeMeasConfigIdx))
+            self.__gpioQueue.put_nowait(self.__activeMeasConfigIdx)
+
+    async def __scanAsync(self, plan, storeFunction):
+        """
+        Coroutine, that scans the boards of plan until it is cancelled. Every
+        board is polled by its own coroutine. The merged blocks are processed
+        in the worker pool, without waiting for the result.
+        """
+
+        readers = self.__createReaders(plan)
+        dataReady = asyncio.Event()
+        scanStartTime = BoardReader.startAligned(
+            readers, 
+            plan, 
+            startThreads = False)
+        sampleCounter = 0
+        self.__recordSwitchGap(scanStartTime)
+        pollTasks = [
+            asyncio.ensure_future(self.__pollAsync(reader, dataReady))
+            for reader in readers]
+
+        try:
+            while True:
+                await dataReady.wait()
+                dataReady.clear()
+                with self.__readerCondition:
+                    sampleCount, overrun, parts = self.__takeStaged(readers)
+
+                # Restart the scans of all boards, like __scanningFunction().
+                if overrun is not None:
+                    self.__reportOverrun(overrun)
+                    for task in pollTasks:
+                        task.cancel()
+                    for reader in readers:
+                        reader.stop()
+                    scanStartTime = BoardReader.startAligned(
+                        readers, 
+                        plan, 
+                        startThreads = False)
+                    sampleCounter = 0
+                    pollTasks = [
+                        asyncio.ensure_future(
+                            self.__pollAsync(reader, dataReady))
+                        for reader in readers]
+                    continue
+                if sampleCount == 0:
+                    continue
+
+                args = self.__prepareBlock(
+                    parts, 
+                    sampleCount, 
+                    scanStartTime, 
+                    sampleCounter)
+                sampleCounter += sampleCount
+                if args is None:
+                    continue
+                task = asyncio.ensure_future(
+                    self.__processAsync(args, storeFunction))
+                self.__inFlight.add(task)
+                task.add_done_callback(self.__inFlight.discard)
+        finally:
+            # The data of the next scan starts after the last read sample.
+            self.__lastSampleTime = \
+                scanStartTime + sampleCounter / plan.scanRate
+            for task in pollTasks:
+                task.cancel()
+            for reader in readers:
+                reader.stop()
 
     @staticmethod
-    def processingFunction(
-        timestamp,
-        data,
+    async def __pollAsync(reader, dataReady):
+        """
+        Coroutine, that polls a board reader until it is cancelled or stops
+        because of an overrun. Sets dataReady, when samples have been staged.
+        """
+
+        while True:
+            wait = reader.poll()
+            if wait is None or wait == 0:
+                dataReady.set()
+            if wait is None:
+                return
+            await asyncio.sleep(wait)
+
+    async def __processAsync(self, args, storeFunction):
+        """
+        Coroutine, that processes a block in the worker pool and hands the 
+        result over to storeFunction. The block is released from the ring 
+        buffer afterwards.
+        """
+
+        sequenceNumber = args[3]
+        try:
+            blocks = await asyncio.get_event_loop().run_in_executor(
+                self.__processingWorkerPool,
+                DataAquisition.processBlock,
+                *args)
+        except Exception as error:
+            print("Processing of block failed: " + str(error))
+            self.__onBlockProcessed(sequenceNumber, False)
+            return
+
+        await storeFunction(blocks)
+        self.__onBlockProcessed(sequenceNumber, True)
+
+    async def stopAsync(self):
+        """
+        Coroutine, that waits until the blocks in flight have been handed over
+        and shuts down the worker pool. Has to be awaited, after the task of 
+        runAsync() has been cancelled.
+        """
+
+        self.__runThread = False
+        if self.__inFlight:
+            await asyncio.gather(*self.__inFlight, return_exceptions = True)
+        self.__processingWorkerPool.shutdown()
+        self.__ringBuffer.close()
+        print("Stopped acquisition module")
+
+    def __onBlockProcessed(self, sequenceNumber, handedOver):
+        """
+        Called in the result handler thread of the worker pool, when a block
+        has been processed. Releases the block from the ring buffer.
+
+        Parameters:
+        sequenceNumber (int): The sequence number of the block in the ring 
+        buffer.
+
+        handedOver (bool): True if the processed block has been handed over to
+        the database interface. False if it has been dropped.
+        """
+
+        self.__ringBuffer.release(sequenceNumber)
+        if handedOver:
+            self.__blocksProcessed.inc()
+        else:
+            self.__blocksDropped.inc()
+
+    def __startScan(self, readers, plan):
+        """
+        Starts the aligned scans of the boards. See BoardReader.startAligned.
+        """
+
+        return BoardReader.startAligned(readers, plan)
+
+    @staticmethod
+    def initProcessingWorker(
+        ringBufferName,
+        ringBufferCapacity,
         queue,
-        currCalculations,
-        currMeasurementConfigName,
-        currChannelDict,
-        currScanRate):
-        """
-        Worker function, that is called by __scanningFunction() as a thread, to
-        trigger data processing and storage of acquired data. Data and 
-        additional information is taken from the __acquiredData and
-        __currScanRate instance variables. The timestamps of the single acquired
-        values is reproduced by taking __currTimestamp and tracing back 
-        1/__currScanRate seconds for each acquired value.
+        executionPlans):
+        """
+        Initializer of the processing worker processes. Attaches to the ring 
+        buffer and stores the configuration, that is needed by 
+        processingFunction().
 
         Parameters:
-        
-        timestamp(datetime): Timestamp corresponding to the most recent 
-        measurement in data.
-        
-        data(float[]): List of floats containing measurement data.
 
-        queue(Manager.Queue): Managed queue, used for communication with 
-        database interface module.
+        ringBufferName(string): The name of the shared memory of the ring 
+        buffer.
 
-        currCalculations(dict<string,string>): Contains currently active 
-        calculations
-        
-        currMeasurementConfigName(string): Currently active measurement name.
+        ringBufferCapacity(int): The capacity of the ring buffer in samples.
 
-        currChannelDict(dict<string,string>): Currently active channel mapping.
+        queue(MeasurementTransport): Transport, used to pass the processed 
+        values to the database interface module. None, if the processed values
+        are returned by processBlock() instead.
 
-        currScanRate(int): Currently active scan rate.
+        executionPlans(list<ExecutionPlan>): The compiled measurement 
+        configurations.
+        """
+
+        # Stopping is handled by the main process. Pool workers inherit this
+        # already, the workers of a ProcessPoolExecutor may be spawned after 
+        # the event loop has installed its signal handler.
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        DataAquisition.__workerRingBuffer = SampleRingBuffer(
+            ringBufferCapacity,
+            name = ringBufferName)
+        DataAquisition.__workerQueue = queue
+        DataAquisition.__workerExecutionPlans = executionPlans
+
+    @staticmethod
+    def processingFunction(
+        scanStartTime,
+        firstIndex,
+        measConfigIdx,
+        sequenceNumber,
+        offset,
+        count,
+        trace = None):
+        """
+        Worker function, that is called by __scanningFunction() in a worker 
+        process, to trigger data processing and storage of acquired data. The
+        block is processed by processBlock(), and the results are handed over
+        to the database interface as one batch.
+
+        Parameters:
+        See processBlock().
+
+        Returns:
+        True if the processed block has been handed over to the database 
+        interface. False if it has been dropped.
         """
 
         try:
-            # Create resultDict, that is used as structure that is handed over
-            #  to database interface. Each active calculation must exist as a 
-            # key in this dict and has to point to another dict.
-            resultDict = {}
-            for name, expr in currCalculations.items():
-                measurementName = \
-                    currMeasurementConfigName + "_" + name
-                resultDict[measurementName] = {}
-
-            # Calculate offset for reconstruction of timestamps.
-            offset = (1.0 / currScanRate)
-            reproducedTimestamp = timestamp.timestamp()
-
-            # Pop from acquired data, until it is empty.
-            loopCount = 0
-            while len(data) > 0:
-                # Pop once for every configured channel. More recent values have 
-                # higher indices. Values from different channels are ordered 
-                # sequentially in the list. I.e for 4 channels -> 
-                # [1,2,3,4,1,2,3,4,...]
-                # The Values that are popped during one while loop iteration are 
-                # considered as concurrent and there have the same timestamp.
-                channelValues = {}
-                reversedList = list(currChannelDict.values())
-                reversedList.reverse()
-                for chanTag in reversedList:
-                    channelValues[chanTag] = data.pop()
-
-                # Calculate timestamp for current channelValues by starting from
-                # the original timestamp, and then subtracting the sample
-                # intervall multiplied by the loop iteration count. Offset from 
-                # the original timestamp in milliseconds.
-                reproducedTimestamp = reproducedTimestamp - offset
-                
-                # Execute configured measurement calculations with the set of 
-                # values.
-                for name, expr in currCalculations.items():
-                    # Evaluate expression
-                    value = DataAquisition.__doCalculation(
-                        expr = expr,
-                        channelDict = currChannelDict,
-                        channelValues = channelValues)
-
-                    # Store calculated values in resultDict.
-                    measurementName = \
-                        currMeasurementConfigName + "_" + name
-                    resultDict[measurementName][reproducedTimestamp] = value
-
-                loopCount = loopCount + 1
-
-            print("Got " + str(loopCount) + " measurements.")
-            # Hand calculated and timestamped values over to database interface.
-            for measName, valueDict in resultDict.items():
-                queue.put_nowait((measName, valueDict))
+            blocks = DataAquisition.processBlock(
+                scanStartTime,
+                firstIndex,
+                measConfigIdx,
+                sequenceNumber,
+                offset,
+                count,
+                trace)
+
+            # Hand calculated and timestamped values over to database interface
+            # as one batch.
+            if not DataAquisition.__workerQueue.put(
+                blocks, 
+                timeout = DataAquisition.__TRANSPORT_PUT_TIMEOUT):
+                print("Database interface transport full. Block dropped.")
+                return False
+            return True
         
         except KeyboardInterrupt:
             print("Processing worker stopped.")
+            return False
+
+    @staticmethod
+    def processBlock(
+        scanStartTime,
+        firstIndex,
+        measConfigIdx,
+        sequenceNumber,
+        offset,
+        count,
+        trace = None):
+        """
+        Processes an acquired block in a worker process. The acquired block is
+        read from the ring buffer without copying, and is processed as a 
+        whole, by reshaping it into a (samples x channels) array. Timestamps 
+        are not computed. The results are blocks of values together with the 
+        start time of the scan, the sample rate and the index of the first 
+        sample, from which the timestamps can be derived.
+
+        Parameters:
+        
+        scanStartTime(float): Timestamp of the start of the scan.
+
+        firstIndex(int): Index of the first sample of the block, counted from
+        the start of the scan.
+
+        measConfigIdx(int): Index of the measurement configuration, the block
+        has been acquired with.
+
+        sequenceNumber(int): Sequence number of the block in the ring buffer.
+
+        offset(int): Offset of the block in the ring buffer.
+
+        count(int): Count of samples in the block. The values of the 
+        configured channels are interleaved.
+
+        trace(BlockTrace): Optional trace of the block. It is stamped and 
+        attached to the processed blocks.
+
+        Returns:
+        A list with a MeasurementBlock per measurement of the configuration.
+        """
+
+        if trace is not None:
+            trace.stamp(BlockTrace.PROCESS_START)
+        plan = DataAquisition.__workerExecutionPlans[measConfigIdx]
+        data = DataAquisition.__workerRingBuffer.view(offset, count)
+
+        # The acquired values of the different channels are interleaved in
+        # data. I.e for 4 channels -> [1,2,3,4,1,2,3,4,...]. Reshape them into
+        # a (samples x channels) array, so each column holds the values of a 
+        # single channel. Older values have lower row indices. The columns are
+        # ordered by channel number, like the plan.
+        channelCount = plan.channelCount()
+        sampleCount = data.size // channelCount
+        samples = data[:sampleCount * channelCount].reshape(
+            sampleCount, 
+            channelCount)
+
+        # Map the channel tags to their columns.
+        channelValues = {}
+        for columnIdx, chanTag in enumerate(plan.channelTags):
+            channelValues[chanTag] = samples[:, columnIdx]
+
+        # Execute configured measurement calculations on the whole block. 
+        # Results that still refer to the ring buffer are copied, as the block
+        # is released after the processing.
+        blocks = []
+        for name, tableName, expr in plan.measurements:
+            values = expr(channelValues, sampleCount)
+            if np.may_share_memory(values, data):
+                values = values.copy()
+
+            blocks.append(MeasurementBlock(
+                tableName, 
+                scanStartTime,
+                plan.scanRate,
+                firstIndex,
+                values,
+                trace))
+
+        if trace is not None:
+            trace.stamp(BlockTrace.PROCESS_END)
+        return blocks
 
     def changeMeasConfig(self, measConfIdx):
         """
@@ -342,6 +805,7 @@ class DataAquisition:
 
         # Set new measurement configuration index.
         self.__activeMeasConfigIdx = measConfIdx
+        self.__configSwitches.inc()
         print("Changed measurement configuration to " + str(measConfIdx))
 
         # Set GPIOs accordingly.
@@ -367,45 +831,18 @@ class DataAquisition:
         self.__confChangeTimer.cancel()
         self.__runThread = False
         self.__workerThread.join()
-        self.__processingWorkerPool.terminate()
 
-        # Put End symbol to queue
-        self.__dbIfQueue.put_nowait(-1)
+        # Let the workers finish the blocks in flight.
+        self.__processingWorkerPool.close()
+        self.__processingWorkerPool.join()
+        self.__ringBuffer.close()
+
+        # Signal end of stream to the database interface.
+        self.__dbIfQueue.close()
         print("Stopped acquisition module")
 
         return
 
-    @staticmethod
-    def __doCalculation(expr, channelDict, channelValues):
-        """
-        Replaces the channel tags in the mathematical expression expr with 
-        measurement values, given in channelValues.
-
-        Parameters:
-        
-        expr (string): A mathematical expression containing channel tags.
-        
-        channelDict (dict<string,string>): A dictionary containing the 
-        channel/channel tag association. The key is the channel number, the 
-        value is the corresponding channel tag.
-
-        channelValues (dict<string,float>) A dictionary containing the values 
-        of the channels. The key is the channel tag, the value is the measured
-        value of the corresponding channel.
-
-        Returns:
-        A float that represents the result of expr.
-        """
-
-        # Iterate over channelDict and try to replace channel tokens in expr
-        # with the values from channelValues.
-        for __, channelToken in channelDict.items():
-            value = channelValues[channelToken]
-            expr = expr.replace(channelToken, str(value))
-        
-        # Evaluate expression
-        return eval(expr)
-
     def __confChangeFunc(self):
         """
         Worker function, that switches measurement configuration after a user 
@@ -414,7 +851,7 @@ class DataAquisition:
         
         if(self.__runThread):
             # Get the count of configured measurment configurations.
-            measConfCount = len(self.__measurementConfig)
+            measConfCount = len(self.__executionPlans)
 
             # Calculate the new measurement config index by incrementing.
             newMeasConfIdx = (self.__activeMeasConfigIdx + 1) % measConfCount
@@ -11,14 +11,24 @@ License:
 """
 
 # Python imports
+import os
 import sqlite3
 from string import Template
 import time
 import threading
 import datetime
 
+# Third party imports
+import numpy as np
+
 # Project imports
-from SentinelConfig import SentinelConfig
+from SentinelConfig import SentinelConfig, DatabaseConfig
+from MeasurementTransport import EndOfStream, BlockTrace
+from ValueCache import ValueCache
+from WriteAheadSpool import WriteAheadSpool
+from Metrics import MetricsRegistry
+from StreamReduction import StreamReducer
+from TriggeredCapture import CaptureGate
 
 class DatabaseInterface:
 
@@ -28,12 +38,182 @@ class DatabaseInterface:
         "(timestamp REAL, " \
         "value REAL NOT NULL)" )
 
-    # Template for query that inserts measurement values.
+    # Template for query that inserts measurement values. The values are 
+    # bound as parameters.
     VALUE_INSERT_QUERY = Template( \
         "INSERT INTO $tableName (timestamp, value) "
-        "VALUES $valueList" )
+        "VALUES (?, ?)" )
+
+    # Template for query that creates tables for measurements in the block 
+    # layout. Each row holds one processed block. Timestamps are not stored,
+    # but derived from the sample clock: t0 is the timestamp of the start of 
+    # the scan, rate the sample rate and first_index the index of the first
+    # sample of the block, counted from the start of the scan. Sample i of 
+    # the block has the timestamp t0 + (first_index + i) / rate. samples 
+    # holds the values of the block as packed array of BLOCK_SAMPLE_DTYPE.
+    CREATE_BLOCK_QUERY = Template( \
+        "CREATE TABLE IF NOT EXISTS $tableName " \
+        "(t0 REAL NOT NULL, " \
+        "rate REAL NOT NULL, " \
+        "first_index INTEGER NOT NULL, " \
+        "count INTEGER NOT NULL, " \
+        "samples BLOB NOT NULL)" )
+
+    # Templates for queries that create the measurement tables clustered on 
+    # time. The rows are stored in a b-tree keyed by time instead of the rowid,
+    # so they are kept in time order and a time range can be read without 
+    # scanning the table.
+    CREATE_CLUSTERED_QUERY = Template( \
+        "CREATE TABLE IF NOT EXISTS $tableName " \
+        "(timestamp REAL PRIMARY KEY, " \
+        "value REAL NOT NULL) WITHOUT ROWID" )
+    CREATE_CLUSTERED_BLOCK_QUERY = Template( \
+        "CREATE TABLE IF NOT EXISTS $tableName " \
+        "(t0 REAL NOT NULL, " \
+        "rate REAL NOT NULL, " \
+        "first_index INTEGER NOT NULL, " \
+        "count INTEGER NOT NULL, " \
+        "samples BLOB NOT NULL, " \
+        "PRIMARY KEY (t0, first_index)) WITHOUT ROWID" )
+
+    # Templates for queries that create a time index on measurement tables.
+    # Blocks are indexed by the timestamp of their first sample. Readers have 
+    # to use the exact same expression, for the index to be used.
+    CREATE_TIME_INDEX_QUERY = Template( \
+        "CREATE INDEX IF NOT EXISTS ${tableName}_time " \
+        "ON $tableName (timestamp)" )
+    CREATE_BLOCK_TIME_INDEX_QUERY = Template( \
+        "CREATE INDEX IF NOT EXISTS ${tableName}_time " \
+        "ON $tableName (t0 + first_index / rate)" )
+
+    # Template for query that inserts blocks.
+    BLOCK_INSERT_QUERY = Template( \
+        "INSERT INTO $tableName (t0, rate, first_index, count, samples) "
+        "VALUES (?, ?, ?, ?, ?)" )
+
+    # Template for query that creates a rollup table. There is one rollup 
+    # table per bucket size, that holds the buckets of all measurements. 
+    # bucket is the index of the bucket, i.e. the bucket covers the timestamps
+    # from bucket * size up to (bucket + 1) * size. The sum is stored instead
+    # of the mean, so buckets can be merged exactly.
+    CREATE_ROLLUP_QUERY = Template( \
+        "CREATE TABLE IF NOT EXISTS rollup.$tableName " \
+        "(measurement TEXT NOT NULL, " \
+        "bucket INTEGER NOT NULL, " \
+        "minimum REAL NOT NULL, " \
+        "maximum REAL NOT NULL, " \
+        "total REAL NOT NULL, " \
+        "count INTEGER NOT NULL, " \
+        "PRIMARY KEY (measurement, bucket)) WITHOUT ROWID" )
+
+    # Template for query that merges values into a bucket of a rollup table.
+    ROLLUP_UPSERT_QUERY = Template( \
+        "INSERT INTO rollup.$tableName " \
+        "(measurement, bucket, minimum, maximum, total, count) " \
+        "VALUES (?, ?, ?, ?, ?, ?) " \
+        "ON CONFLICT (measurement, bucket) DO UPDATE SET " \
+        "minimum = MIN(minimum, excluded.minimum), " \
+        "maximum = MAX(maximum, excluded.maximum), " \
+        "total = total + excluded.total, " \
+        "count = count + excluded.count" )
+
+    # Template for the name of a rollup table.
+    ROLLUP_TABLE_NAME = Template("Rollup_$size")
+
+    # Suffix of the rollup database file. It is appended to the database name.
+    # The rollup database is not rotated, so buckets spanning a rotation are
+    # merged correctly.
+    ROLLUP_FILE_SUFFIX = ".rollup.sl3"
+
+    # Queries that create the segment catalog. The catalog records every 
+    # database file (segment), that has been created, with its path relative
+    # to the catalog, its creation time, the time span of its values and 
+    # whether it has been closed cleanly. For each measurement table of a 
+    # segment, the time span and the count of samples are recorded, in the
+    # order the tables have been created.
+    CREATE_CATALOG_SEGMENTS_QUERY = \
+        "CREATE TABLE IF NOT EXISTS catalog.Segments " \
+        "(segment INTEGER PRIMARY KEY, " \
+        "path TEXT NOT NULL, " \
+        "created REAL NOT NULL, " \
+        "first_timestamp REAL, " \
+        "last_timestamp REAL, " \
+        "closed INTEGER NOT NULL DEFAULT 0)"
+    CREATE_CATALOG_TABLES_QUERY = \
+        "CREATE TABLE IF NOT EXISTS catalog.SegmentTables " \
+        "(segment INTEGER NOT NULL, " \
+        "table_name TEXT NOT NULL, " \
+        "first_timestamp REAL, " \
+        "last_timestamp REAL, " \
+        "sample_count INTEGER NOT NULL DEFAULT 0, " \
+        "PRIMARY KEY (segment, table_name))"
 
-    def __init__(self, configObject, dbIfQueue):
+    # Queries that maintain the segment catalog.
+    CATALOG_SEGMENT_INSERT_QUERY = \
+        "INSERT INTO catalog.Segments (path, created) VALUES (?, ?)"
+    CATALOG_TABLE_INSERT_QUERY = \
+        "INSERT OR IGNORE INTO catalog.SegmentTables " \
+        "(segment, table_name) VALUES (?, ?)"
+    CATALOG_TABLE_UPDATE_QUERY = \
+        "UPDATE catalog.SegmentTables SET " \
+        "first_timestamp = MIN(COALESCE(first_timestamp, ?), ?), " \
+        "last_timestamp = MAX(COALESCE(last_timestamp, ?), ?), " \
+        "sample_count = sample_count + ? " \
+        "WHERE segment = ? AND table_name = ?"
+    CATALOG_SEGMENT_UPDATE_QUERY = \
+        "UPDATE catalog.Segments SET " \
+        "first_timestamp = (SELECT MIN(first_timestamp) " \
+        "FROM catalog.SegmentTables WHERE segment = ?1), " \
+        "last_timestamp = (SELECT MAX(last_timestamp) " \
+        "FROM catalog.SegmentTables WHERE segment = ?1) " \
+        "WHERE segment = ?1"
+    CATALOG_SEGMENT_CLOSE_QUERY = \
+        "UPDATE catalog.Segments SET closed = 1 WHERE segment = ?"
+
+    # Queries that record the sequence number of the last committed block of
+    # the write-ahead spool. It is updated in the same transaction as the 
+    # values, so blocks, that have been committed right before a crash, are
+    # not replayed a second time, even into another database file.
+    CREATE_CATALOG_SPOOL_QUERY = \
+        "CREATE TABLE IF NOT EXISTS catalog.Spool " \
+        "(id INTEGER PRIMARY KEY CHECK (id = 0), " \
+        "committed_sequence INTEGER NOT NULL)"
+    CATALOG_SPOOL_UPDATE_QUERY = \
+        "INSERT OR REPLACE INTO catalog.Spool (id, committed_sequence) " \
+        "VALUES (0, ?)"
+    CATALOG_SPOOL_SELECT_QUERY = \
+        "SELECT committed_sequence FROM catalog.Spool WHERE id = 0"
+
+    # Suffix of the catalog database file. It is appended to the database 
+    # name.
+    CATALOG_FILE_SUFFIX = ".catalog.sl3"
+
+    # Suffix of the write-ahead spool file. It is appended to the database
+    # name.
+    SPOOL_FILE_SUFFIX = ".spool"
+
+    # Data type of the samples in the blob of the block layout. Little endian
+    # float64.
+    BLOCK_SAMPLE_DTYPE = "<f8"
+
+    # Valid values of the JSON_DATABASE_STORAGE_LAYOUT configuration.
+    STORAGE_LAYOUT_ROWS = DatabaseConfig.STORAGE_LAYOUT_ROWS
+    STORAGE_LAYOUT_BLOCKS = DatabaseConfig.STORAGE_LAYOUT_BLOCKS
+
+    # Valid values of the JSON_DATABASE_CACHE_FULL_POLICY configuration.
+    CACHE_FULL_BACKPRESSURE = DatabaseConfig.CACHE_FULL_BACKPRESSURE
+    CACHE_FULL_DROP_NEWEST = DatabaseConfig.CACHE_FULL_DROP_NEWEST
+
+    # Intervall in seconds, in which a listener, that waits for space in the
+    # value cache, checks if the writeback thread is still alive.
+    CACHE_WAIT_TIMEOUT = 1.0
+
+    # Valid values of the JSON_DATABASE_TIME_INDEX configuration.
+    TIME_INDEX_NONE = DatabaseConfig.TIME_INDEX_NONE
+    TIME_INDEX_CLUSTERED = DatabaseConfig.TIME_INDEX_CLUSTERED
+    TIME_INDEX_ON_ROTATION = DatabaseConfig.TIME_INDEX_ON_ROTATION
+
+    def __init__(self, configObject, dbIfQueue, metrics = None):
         """
         Constructs the database interface. Does not create a database or connect
         to it. Before this object is operational, and data can be written to the
@@ -43,24 +223,47 @@ class DatabaseInterface:
         configObject (SentinelConfig): The configuration data is extracted from
         this object.
 
-        dbIfQueue (Manager.Queue): A queue that is used for communication with 
-        the acquisition processes
+        dbIfQueue (MeasurementTransport): The transport, the processed values
+        are received from. None, if the batches are passed to offer() instead.
+
+        metrics (MetricsRegistry): The registry, the metrics of the database 
+        interface are registered in. If None, a private registry is used.
         """
         
-        # Get main configuration domains
+        # Get main configuration domains. They have been validated, when the
+        # configuration has been loaded.
         self.databaseConfig = configObject.getConfig(
             SentinelConfig.JSON_DATABASE_CONFIG)
-        self.measurementConfig = configObject.getConfig(
-            SentinelConfig.JSON_MEASUREMENT_CONFIG)
+        self.__executionPlans = configObject.getExecutionPlans()
 
         # Extract configuration data from databaseConfig.
-        self.__databaseName = \
-            str(self.databaseConfig[SentinelConfig.JSON_DATABASE_NAME])
-        self.__storageIntervall = \
-            int(self.databaseConfig[SentinelConfig.JSON_WRITE_INTERVALL])
-        self.__changeIntervall = \
-            int(self.databaseConfig[SentinelConfig.JSON_DATABASE_CHANGE_INT])
+        self.__databaseName = self.databaseConfig.databaseName
+        self.__storageIntervall = self.databaseConfig.writeIntervall
+        self.__changeIntervall = self.databaseConfig.changeIntervall
+
+        # Layout of the measurement tables.
+        self.__storageLayout = self.databaseConfig.storageLayout
+
+        # Time index of the measurement tables.
+        self.__timeIndex = self.databaseConfig.timeIndex
 
+        # Bucket sizes of the rollup tables in seconds.
+        self.__rollups = list(self.databaseConfig.rollups)
+
+        # Optional SQLite tuning. None keeps the SQLite default.
+        self.__journalMode = self.databaseConfig.journalMode
+        self.__synchronous = self.databaseConfig.synchronous
+        self.__pageSize = self.databaseConfig.pageSize
+        self.__cacheSize = self.databaseConfig.cacheSize
+
+        # Memory ceiling of the value cache and what happens, when it is 
+        # reached.
+        self.__cacheLimit = self.databaseConfig.cacheLimit
+        self.__cacheFullPolicy = self.databaseConfig.cacheFullPolicy
+
+        # Size of the write-ahead spool in MiB. None disables the spool.
+        self.__spoolSize = self.databaseConfig.spoolSize
+        self.__spoolSync = self.databaseConfig.spoolSync
         
         # Set up worker thread.
         self.__workerThread = threading.Thread(
@@ -75,10 +278,18 @@ class DatabaseInterface:
             name = 'listenerInterfaceWorker',
             daemon = None)
         
-        # A semaphore is needed, to avoid race conditions when this object is
+        # A condition is needed, to avoid race conditions when this object is
         # trying to write back to databse, and another module is adding values
-        # to the value cache.
-        self.__writeSemaphore = threading.Semaphore(value = 1)
+        # to the value cache. It is notified, when the value cache has been 
+        # swapped.
+        self.__cacheCondition = threading.Condition()
+
+        # Set to request a writeback before the write intervall elapsed.
+        self.__writebackEvent = threading.Event()
+
+        # Set, when the blocks left in the spool by the last run have been
+        # replayed. The listener does not receive values before.
+        self.__replayDone = threading.Event()
 
         # Boolean that signals wether this object is connected to a database.
         self.__connected = False
@@ -86,25 +297,158 @@ class DatabaseInterface:
         # The database connection.
         self.dbConnection = None
 
-        # Values will be written to this dict from other objects.
+        # The id of the current database file in the segment catalog.
+        self.__segmentId = None
+
+        # Maps from table name to its insert statement. Built in start().
+        self.__insertQueries = {}
+
+        # Values received from other objects are written to valueCache. 
         # DatabaseInterface will write the contents of valueCache back to 
-        # database, if the configured write intervall elapsed. 
-        self.valueCache = {}
+        # database, if the configured write intervall elapsed. For the 
+        # writeback, valueCache is swapped with __flushCache, so values can be
+        # received while the writeback is running. The memory ceiling is split
+        # evenly between both caches and all measurements. The caches are 
+        # allocated in start().
+        self.valueCache = None
+        self.__flushCache = None
+
+        # Traces of the batches in valueCache. They are swapped together with
+        # the cache, and stamped when the writeback has been committed.
+        self.__traces = []
+
+        # The write-ahead spool, opened in start(), and the sequence number of
+        # the last block, that has been spooled and appended to valueCache.
+        # Blocks are spooled as they are stored, after the triggers and the
+        # reductions. Blocks held back by these stages, in the reorder window,
+        # the pre-trigger ring or an incomplete filter window, are not spooled
+        # yet and are lost on a crash. Spooling the acquired blocks instead
+        # would require to replay the stages, without storing their outputs,
+        # that have already been committed, a second time.
+        self.__spool = None
+        self.__spooledSequence = 0
 
         # Controlls the worker loop.
         self.__runThread = False
 
-        # The database interface queue from which data is pushed to this module.
+        # The database interface transport from which data is pushed to this 
+        # module.
         self.__dbIfQueue = dbIfQueue
 
-        # The counter used for the database file changes.
+        # The counter used for the database file changes, and the time, at
+        # which the next write cycle is counted. Only elapsed write intervalls
+        # are counted, so writebacks forced by a full value cache do not
+        # change the database file earlier.
         self.__writeCycleCounter = 0
+        self.__nextWriteCycleTime = 0.0
+
+        # Metrics of the database interface.
+        self.metrics = metrics if metrics is not None else MetricsRegistry()
+        self.__samplesReceived = self.metrics.counter(
+            "sentinel_samples_received_total",
+            "Samples received by the database interface.")
+        self.__samplesCommitted = self.metrics.counter(
+            "sentinel_samples_committed_total",
+            "Samples committed to the database.")
+        self.__samplesDropped = self.metrics.counter(
+            "sentinel_samples_dropped_total",
+            "Samples dropped, because the value cache or the spool was full, "
+            "or their writeback failed.")
+        self.__writebackFailures = self.metrics.counter(
+            "sentinel_writeback_failures_total",
+            "Writebacks, that have been rolled back because of an SQLite "
+            "error.")
+        self.__rowsCommitted = self.metrics.counter(
+            "sentinel_rows_committed_total",
+            "Rows committed to the measurement tables.")
+        self.__writebackSeconds = self.metrics.histogram(
+            "sentinel_writeback_seconds",
+            "Duration of the writebacks of the value cache to the database.")
+        self.__writebackDuration = self.metrics.gauge(
+            "sentinel_writeback_duration_seconds",
+            "Duration of the last writeback.")
+        self.metrics.gauge(
+            "sentinel_value_cache_samples",
+            "Samples in the value cache, that receives values.",
+            function = lambda: self.valueCache.sampleCount())
+        self.metrics.gauge(
+            "sentinel_value_cache_capacity_samples",
+            "Capacity of the value cache per measurement.",
+            function = lambda: self.valueCache.capacity)
+        self.__stageLatencies = {
+            stage : self.metrics.histogram(
+                "sentinel_stage_latency_seconds",
+                "Latency of the stages of the pipeline per acquired block.",
+                labels = {"stage" : stage})
+            for stage, start, end in BlockTrace.STAGES }
+        if self.__dbIfQueue is not None:
+            self.metrics.gauge(
+                "sentinel_transport_batches",
+                "Batches in the transport to the database interface.",
+                function = self.__dbIfQueue.qsize)
+
+        # The reducers of the measurements with a configured reduction, by 
+        # table name. Blocks of other measurements are stored as they are.
+        reductionGaps = self.metrics.counter(
+            "sentinel_reduction_gaps_total",
+            "Missing blocks, that restarted the reduction of a measurement.")
+        reductionLateBlocks = self.metrics.counter(
+            "sentinel_reduction_late_blocks_total",
+            "Blocks dropped by the reduction, as they arrived too late.")
+        self.__reducers = {}
+        for plan in configObject.getExecutionPlans():
+            for tableName, reduction in plan.reductions:
+                self.__reducers[tableName] = StreamReducer(
+                    StreamReducer.decimatorFactory(reduction),
+                    reductionGaps,
+                    reductionLateBlocks)
+
+        # The capture gates of the measurement configurations with a trigger.
+        # A gate is shared by all tables of its configuration, as it captures
+        # the values of all measurements around an event.
+        triggerEvents = self.metrics.counter(
+            "sentinel_trigger_events_total",
+            "Trigger events, that opened a new event window.")
+        triggerCaptured = self.metrics.counter(
+            "sentinel_trigger_captured_samples_total",
+            "Values captured by the triggers, summed over all measurements.")
+        triggerGaps = self.metrics.counter(
+            "sentinel_trigger_gaps_total",
+            "Missing blocks, that restarted a trigger.")
+        triggerLateBlocks = self.metrics.counter(
+            "sentinel_trigger_late_blocks_total",
+            "Blocks dropped by a trigger, as they arrived too late.")
+        self.__gates = {}
+        for plan in configObject.getExecutionPlans():
+            if plan.trigger is None:
+                continue
+            sourceName, trigger = plan.trigger
+            gate = CaptureGate(
+                sourceName,
+                trigger,
+                triggerEvents,
+                triggerCaptured,
+                triggerGaps,
+                triggerLateBlocks)
+            for tableName in plan.tableNames:
+                self.__gates[tableName] = gate
+
+        # List of (commitTime, sampleCount, duration, minLatency, meanLatency,
+        # maxLatency) tuples, one per writeback. The latencies are the time in
+        # seconds from the timestamp of a sample until its commit.
+        self.writebackStatistics = []
     
-    def start(self):
+    def start(self, startThreads = True):
         """
         Creates the database structure or connects to it, and starts worker 
         threads.
 
+        Parameters:
+        startThreads (bool): If False, the listener and the writeback thread
+        are not started. The caller has to drive the database interface with
+        openDatabase(), offer(), writebackCycle() and closeDatabase() then, 
+        i.e. from an event loop.
+
         Returns:
         True if start was successfull. False otherwise.
         """
@@ -112,78 +456,262 @@ class DatabaseInterface:
         # Only start, if not already started.
         if(self.__connected):
             return False
+
+        # Allocate the value caches.
+        tableNames = self.__tableNames()
+        cacheCapacity = int(self.__cacheLimit * 1024 * 1024 / 
+            (2 * len(tableNames) * np.dtype(ValueCache.DTYPE).itemsize))
+        if cacheCapacity <= 0:
+            print("Invalid cache memory limit " + str(self.__cacheLimit) + ".")
+            return False
+        self.valueCache = ValueCache(tableNames, cacheCapacity)
+        self.__flushCache = ValueCache(tableNames, cacheCapacity)
+
+        # Build the insert statement of every table once. SQLite caches the
+        # compiled statements by their text.
+        if self.__storageLayout == DatabaseInterface.STORAGE_LAYOUT_BLOCKS:
+            insertQuery = DatabaseInterface.BLOCK_INSERT_QUERY
+        else:
+            insertQuery = DatabaseInterface.VALUE_INSERT_QUERY
+        self.__insertQueries = {
+            tableName : self.__clusteredInsert(
+                insertQuery.substitute(tableName = tableName))
+            for tableName in tableNames }
+
+        # Every measurement produces one value per sample. Warn, if the cache
+        # can not hold the values of a whole write intervall.
+        maxScanRate = max(plan.scanRate for plan in self.__executionPlans)
+        if cacheCapacity < maxScanRate * self.__storageIntervall / 1000.0:
+            if self.__cacheFullPolicy == \
+                DatabaseInterface.CACHE_FULL_DROP_NEWEST:
+                consequence = "Values will be dropped."
+            else:
+                consequence = "Writebacks will be forced early."
+            print(
+                "Value cache holds only " + 
+                str(round(cacheCapacity / maxScanRate, 2)) + " s of values " +
+                "per measurement. " + consequence)
+
+        # Open the write-ahead spool. Blocks, that are left in it by the last
+        # run, are replayed by the worker thread.
+        if self.__spoolSize is not None:
+            spoolCapacity = int(self.__spoolSize * 1024 * 1024)
+            if spoolCapacity <= WriteAheadSpool.HEADER_SIZE:
+                print("Invalid spool size " + str(self.__spoolSize) + ".")
+                return False
+            try:
+                self.__spool = WriteAheadSpool(
+                    self.__databaseName + DatabaseInterface.SPOOL_FILE_SUFFIX,
+                    spoolCapacity,
+                    self.__spoolSync)
+            except (OSError, ValueError) as e:
+                print("Could not open spool file: " + str(e))
+                return False
+            self.__spooledSequence = self.__spool.committedSequence
+            self.metrics.gauge(
+                "sentinel_spool_pending_records",
+                "Spooled blocks, that have not been committed.",
+                function = self.__spool.pendingCount)
+        else:
+            self.__replayDone.set()
         
         # Start worker thread.
         self.__runThread = True
-        self.__workerThread.start()
-        self.__listenerThread.start()
+        if startThreads:
+            self.__workerThread.start()
+            self.__listenerThread.start()
         return True
 
         
     def stop(self):
         """
-        Closes the database interface.
+        Closes the database interface. Has to be called after the producer 
+        side has closed the transport.
 
         Returns:
         True is stopped successfully. False otherwise.
         """
 
+        # Wait until the end of stream has been received, so all values are in
+        # the value cache, and then stop the writeback loop.
+        self.__listenerThread.join()
         self.__runThread = False
+        self.__writebackEvent.set()
         self.__workerThread.join() 
-        self.__listenerThread.join()
 
     def storeFunction(self):
         """
-        Used to queue measurement values for storage to database.
-
-        Parameters:
-        
-        measurement (string): A name to uniquely identify the meaurement. 
-        Is also the name of the SQL table the values are written to. As such, 
-        measurement should comply with SQL syntax rules.
-
-        values: (dict<string,float>): A dictionary, that contains timestamp, 
-        value tuples.
+        Receives batches of MeasurementBlock objects from the transport and 
+        queues them for storage to database. Each block carries the name of 
+        the measurement, which is also the name of the SQL table the values are
+        written to, a column of timestamps and a column of values. Returns, 
+        when the end of the stream has been received.
         """
 
-        while(self.__runThread):
+        # Values left in the spool have to be stored first.
+        self.__replayDone.wait()
+
+        while(True):
             # Wait for input.
             try:
-                obj = self.__dbIfQueue.get()
-            except:
+                blocks = self.__dbIfQueue.get()
+            except EndOfStream:
+                # End of stream received. Store the values held back by the 
+                # reductions and terminate this thread.
+                self.__storeBatch(self.flushReductions())
                 return
-                
-            # Do some checks on obj.
-            if obj == None:
-                # obj does not contain any data. Skip this iteration and wait
-                # for next object.
-                self.__dbIfQueue.task_done()
-                continue
-        
-            if obj == -1:
-                # End symbol received. Terminate this thread.
-                self.__dbIfQueue.task_done()
+            except:
                 return
 
-            # Aquire lock
-            self.__writeSemaphore.acquire()
+            trace = blocks[0].trace if blocks else None
+            if trace is not None:
+                trace.stamp(BlockTrace.RECEIVED)
+            self.__storeBatch(self.reduce(blocks))
+
+    def __storeBatch(self, blocks):
+        """
+        Appends a batch to the value cache. Called by the listener thread.
+        """
+
+        with self.__cacheCondition:
+            # If the batch does not fit into the value cache or the spool,
+            # either drop it, or force a writeback and wait until it fits.
+            while not self.__fits(blocks) and \
+                not self.__mustDrop(blocks) and \
+                self.__workerThread.is_alive():
+                self.__writebackEvent.set()
+                self.__cacheCondition.wait(
+                    DatabaseInterface.CACHE_WAIT_TIMEOUT)
+            self.__appendBatch(blocks)
+
+    def reduce(self, blocks):
+        """
+        Applies the configured triggers and reductions to a batch of 
+        MeasurementBlock objects. Batches of configurations without trigger 
+        and blocks of measurements without reduction are passed on. Has to be
+        called from one thread only, in the order the batches are received.
+
+        Parameters:
+        blocks (list<MeasurementBlock>): The batch.
+
+        Returns:
+        The reduced batch. It may contain blocks of earlier batches, that 
+        have been held back, or be empty.
+        """
+
+        # A batch holds the blocks of one measurement configuration. The 
+        # captured blocks of a trigger are in order, with intended gaps 
+        # between the event windows.
+        gate = self.__gates.get(blocks[0].name) if blocks else None
+        if gate is not None:
+            blocks = gate.push(blocks)
+        return self.__pushReductions(blocks, gate is not None)
+
+    def flushReductions(self):
+        """
+        Returns the blocks, that are still held back by the triggers and the
+        reductions, and ends their streams. Called at the end of the stream.
+        """
+
+        reduced = []
+        for gate in dict.fromkeys(self.__gates.values()):
+            reduced.extend(self.__pushReductions(gate.flush(), True))
+        for reducer in self.__reducers.values():
+            reduced.extend(reducer.flush())
+        return reduced
 
-            measurement = obj[0]
-            value = obj[1]
+    def __pushReductions(self, blocks, ordered):
+        if not self.__reducers:
+            return blocks
+        reduced = []
+        for block in blocks:
+            reducer = self.__reducers.get(block.name)
+            if reducer is None:
+                reduced.append(block)
+            else:
+                reduced.extend(reducer.push(block, ordered))
+        return reduced
 
-            # Add dict to valueCache, if not already in valueCache
-            if measurement not in self.valueCache.keys():
-                self.valueCache[measurement] = {}
-            
-            self.valueCache[measurement].update(value)
+    def offer(self, blocks):
+        """
+        Stores a batch of MeasurementBlock objects without waiting. Used 
+        instead of the listener thread, if the database interface has been
+        started without threads.
 
-            # Everything has been done. Releae lock.
-            self.__writeSemaphore.release()
+        Parameters:
+        blocks (list<MeasurementBlock>): The batch.
 
-            # Tell the queue that the current object has finished processing.
-            self.__dbIfQueue.task_done()
+        Returns:
+        True if the batch has been stored, or dropped according to the cache 
+        full policy. False if it does not fit, before the next writeback.
+        """
 
-        return
+        with self.__cacheCondition:
+            if not self.__fits(blocks) and not self.__mustDrop(blocks):
+                return False
+            self.__appendBatch(blocks)
+            return True
+
+    def __mustDrop(self, blocks):
+        """
+        Checks, if a batch, that does not fit into the value cache or the
+        spool, has to be dropped instead of waiting for a writeback. A batch,
+        that is larger than the whole cache or the empty spool, can never fit.
+        Has to be called with __cacheCondition held.
+        """
+
+        return self.__cacheFullPolicy == \
+            DatabaseInterface.CACHE_FULL_DROP_NEWEST or \
+            self.valueCache.exceedsCapacity(blocks) or \
+            (self.__spool is not None and self.__spool.pendingCount() == 0)
+
+    def __appendBatch(self, blocks):
+        """
+        Spools and appends the blocks of a batch. Blocks, that do not fit, are
+        dropped. Has to be called with __cacheCondition held.
+        """
+
+        for block in blocks:
+            self.__samplesReceived.inc(len(block))
+            if not self.__spoolAndAppend(block):
+                self.__samplesDropped.inc(len(block))
+                print(
+                    "Value cache full. Dropped " + str(len(block)) +
+                    " values of " + block.name + ".")
+        # Reduced batches may carry the traces of several acquired blocks.
+        traces = {id(block.trace) : block.trace 
+            for block in blocks if block.trace is not None}
+        for trace in traces.values():
+            trace.stamp(BlockTrace.STORED)
+            self.__traces.append(trace)
+
+    def __fits(self, blocks):
+        """
+        Checks, if a batch of blocks fits into the value cache and the spool.
+        Has to be called with __cacheCondition held.
+        """
+
+        if not self.valueCache.fits(blocks):
+            return False
+        return self.__spool is None or self.__spool.fits(blocks)
+
+    def __spoolAndAppend(self, block):
+        """
+        Appends a block to the spool, if it is enabled, and to the value 
+        cache. Has to be called with __cacheCondition held.
+
+        Returns:
+        True if the block has been appended. False if it does not fit.
+        """
+
+        if not self.valueCache.fits([block]):
+            return False
+        if self.__spool is not None:
+            sequence = self.__spool.append(block)
+            if sequence is None:
+                return False
+            self.__spooledSequence = sequence
+        return self.valueCache.append(block)
 
     def __workerWriteback(self):
         """
@@ -192,78 +720,306 @@ class DatabaseInterface:
         value cache to the databse.
         """
 
-
-        dbName = DatabaseInterface.__constructDbName(self.__databaseName)
-        print(dbName)
-        self.__createDbStructure(dbName)
+        self.openDatabase()
 
         # Enter writeback loop.
         while(self.__runThread):
-            # Call __writeback every storageIntervall milliseconds.
-            time.sleep(self.__storageIntervall/1000.0)
-
-            # Do writeback.
-            self.__writeback()
-
-            # If count of writebacks exceeded configured limit, create new
-            # database file.
-            self.__writeCycleCounter += 1
-            if  self.__writeCycleCounter >= self.__changeIntervall and \
-                self.__changeIntervall != 0:
-
-                self.dbConnection.close()
-                dbName = \
-                    DatabaseInterface.__constructDbName(self.__databaseName)
-                self.__createDbStructure(dbName)
-                self.__writeCycleCounter = 0
+            # Call __writeback every storageIntervall milliseconds, or 
+            # earlier if the value cache is full.
+            self.__writebackEvent.wait(self.__storageIntervall/1000.0)
+            self.__writebackEvent.clear()
+            self.writebackCycle()
         
-        # Close database connection, after writeback loop finished.
-        self.dbConnection.close()
+        self.closeDatabase()
+
+    def writebackIntervall(self):
+        """
+        Returns the configured write intervall in seconds.
+        """
+
+        return self.__storageIntervall / 1000.0
+
+    def openDatabase(self):
+        """
+        Creates the first database file and replays the blocks left in the
+        spool. All database functions have to be called from the same thread.
+        """
+
+        dbName = DatabaseInterface.__constructDbName(self.__databaseName)
+        print(dbName)
+        self.__nextWriteCycleTime = \
+            time.monotonic() + self.writebackIntervall()
+        try:
+            self.__createDbStructure(dbName)
+            if self.__spool is not None:
+                self.__replaySpool()
+        finally:
+            # Let the listener continue, even if the replay failed.
+            self.__replayDone.set()
+
+    def writebackCycle(self):
+        """
+        Writes the value cache back to database, and creates a new database
+        file, if the configured count of write intervalls has elapsed.
+        """
+
+        # Do writeback.
+        self.__writeback()
+
+        # Writebacks, that have been forced before the write intervall has
+        # elapsed, are not counted.
+        now = time.monotonic()
+        if now < self.__nextWriteCycleTime:
+            return
+        self.__nextWriteCycleTime = now + self.writebackIntervall()
+
+        # If count of write cycles exceeded configured limit, create new
+        # database file.
+        self.__writeCycleCounter += 1
+        if  self.__writeCycleCounter >= self.__changeIntervall and \
+            self.__changeIntervall != 0:
+
+            self.__closeDb()
+            dbName = \
+                DatabaseInterface.__constructDbName(self.__databaseName)
+            self.__createDbStructure(dbName)
+            self.__writeCycleCounter = 0
+
+    def closeDatabase(self):
+        """
+        Writes back what is left in the cache and closes the database 
+        connection and the spool.
+        """
+
+        self.__writeback()
+        self.__closeDb()
+        if self.__spool is not None:
+            self.__spool.close()
         print("Database Connection closed")
 
+    def __replaySpool(self):
+        """
+        Writes the blocks, that have been spooled but not committed by the 
+        last run, to the database. Blocks, that the catalog records as 
+        committed, are skipped. Blocks of measurements, that are not 
+        configured anymore, are dropped.
+        """
+
+        pending = self.__spool.pending()
+
+        # The spool is released only after the commit. If the process died 
+        # in between, the catalog is ahead of the spool. A catalog sequence
+        # number, that the spool has not reached yet, has been recorded with
+        # an earlier spool file. Then all pending blocks are replayed, and the
+        # spool continues after the recorded sequence number.
+        catalogSequence = self.dbConnection.execute(
+            DatabaseInterface.CATALOG_SPOOL_SELECT_QUERY).fetchone()
+        catalogSequence = catalogSequence[0] if catalogSequence else 0
+        if catalogSequence < self.__spool.nextSequence:
+            committed = [sequence for sequence, block in pending 
+                if sequence <= catalogSequence]
+            if committed:
+                print("Skipping " + str(len(committed)) + 
+                    " spooled blocks, that have already been committed.")
+            pending = [(sequence, block) for sequence, block in pending 
+                if sequence > catalogSequence]
+        if pending:
+            print("Replaying " + str(len(pending)) + 
+                " blocks from the spool.")
+
+        tableNames = set(self.__tableNames())
+        for sequence, block in pending:
+            self.__samplesReceived.inc(len(block))
+            if block.name not in tableNames or \
+                self.valueCache.exceedsCapacity([block]):
+                self.__samplesDropped.inc(len(block))
+                print(
+                    "Can not replay spooled block. Dropped " + 
+                    str(len(block)) + " values of " + block.name + ".")
+            else:
+                if not self.valueCache.fits([block]):
+                    self.__writeback()
+                self.valueCache.append(block)
+            self.__spooledSequence = sequence
+
+        # Write the replayed blocks back immediately, and release the dropped
+        # and skipped ones from the spool.
+        self.__writeback()
+        self.__spool.commit(max(self.__spooledSequence, catalogSequence))
+        self.__spooledSequence = self.__spool.committedSequence
+
     def __writeback(self):
         """
         Writes value cache to the database.
         """
-        # Do nothing, if no values are in the cache.
-        if(len(self.valueCache)):       
-            # Aquire lock, so valueTriple is ensured to not change.
-            try:
-                self.__writeSemaphore.acquire()
-            except:
+        # Aquire lock, so valueCache is ensured to not change, while it is
+        # swapped with the empty flush cache. The listener can continue to 
+        # fill the new cache, while the old one is written to database.
+        with self.__cacheCondition:
+            # Do nothing, if no values are in the cache.
+            if self.valueCache.isEmpty():
                 return
+            flushCache = self.valueCache
+            self.valueCache = self.__flushCache
+            self.__flushCache = flushCache
+            flushSequence = self.__spooledSequence
+            flushTraces = self.__traces
+            self.__traces = []
+            self.__cacheCondition.notify_all()
+
+        committed = False
+        try:
+            committed = self.__writebackCache(flushCache, flushSequence)
+
+            # Record the latencies of the stages of the committed batches.
+            if committed:
+                commitTime = time.monotonic()
+                for trace in flushTraces:
+                    trace.stamp(BlockTrace.COMMITTED, commitTime)
+                    for stage, latency in trace.stageLatencies():
+                        self.__stageLatencies[stage].observe(latency)
+        finally:
+            # The values have been written or are lost. Either way, the 
+            # buffers can be reused for the next swap. Only committed values
+            # are released from the spool, the others are replayed on the
+            # next start.
+            with self.__cacheCondition:
+                flushCache.clear()
+                if committed and self.__spool is not None:
+                    self.__spool.commit(flushSequence)
+                    self.__cacheCondition.notify_all()
+
+    def __writebackCache(self, flushCache, flushSequence):
+        """
+        Writes the blocks of a swapped out value cache to the database.
+
+        Parameters:
+        flushCache (ValueCache): The value cache.
+
+        flushSequence (int): The spool sequence number of the last block in
+        the value cache. Recorded in the catalog, if the spool is enabled.
+
+        Returns:
+        True if the values have been committed. False if the transaction 
+        failed and has been rolled back. The values are dropped then.
+        """
+
+        valueCache = flushCache.blocks()
+
+        startTime = time.time()
+        sampleCount = 0
+        rowCount = 0
+        timestampSum = 0.0
+        oldestTimestamp = float("inf")
+        newestTimestamp = float("-inf")
+
+        # Insert all values of the cache with prepared statements. All 
+        # inserts of one writeback are done in a single transaction. If it
+        # fails, i.e. because the disk is full or the database is locked, it
+        # is rolled back, so the next writeback can start a new one.
+        cursor = self.dbConnection.cursor()
+        try:
+            cursor.execute("BEGIN")
+            for tableName, blockList in valueCache.items():
+                blockList = [block for block in blockList if len(block)]
+                if not blockList:
+                    continue
+
+                if self.__storageLayout == \
+                    DatabaseInterface.STORAGE_LAYOUT_BLOCKS:
+                    # One row per block. Only the sample clock is stored.
+                    cursor.executemany(
+                        self.__insertQueries[tableName],
+                        [(block.scanStartTime,
+                        block.rate,
+                        block.firstIndex,
+                        len(block),
+                        block.values.astype(
+                            DatabaseInterface.BLOCK_SAMPLE_DTYPE).tobytes())
+                        for block in blockList])
+                    rowCount += cursor.rowcount
+                else:
+                    # One row per sample. Timestamps are materialized from the
+                    # sample clock.
+                    timestamps = np.concatenate(
+                        [block.timestamps() for block in blockList])
+                    values = np.concatenate(
+                        [block.values for block in blockList])
+                    cursor.executemany(
+                        self.__insertQueries[tableName],
+                        zip(timestamps.tolist(), values.tolist()))
+                    rowCount += cursor.rowcount
 
-            # Iterate over valueCache to build the SQL statments.
-            for tableName, valueDict in self.valueCache.items():
-                # Build value list for SQL query.
-                valueListStr = ""
-                firstIteration = True
-                for timestamp, value in valueDict.items():
-                    # Do not add comma on first iteration of loop
-                    if(firstIteration):
-                        valueListStr += \
-                            "('" + str(timestamp) + "', " + str(value) + ")"
-                        firstIteration = False
-                    else:
-                         valueListStr += \
-                             ",('" + str(timestamp) + "', " + str(value) + ")"
-
-                insertQuery = \
-                    DatabaseInterface.VALUE_INSERT_QUERY.substitute(
-                        tableName = tableName,
-                        valueList = valueListStr)
-                self.dbConnection.cursor().execute(insertQuery)
-
-            # Clear value cache
-            self.valueCache = {}
-
-            # Commit changes to DB and release semaphore.
+                # Merge the values into the rollup tables. The rollups are
+                # built from the stored values, i.e. after the trigger and
+                # the reductions. With an Average reduction, minimum and
+                # maximum are the envelope of the averages, not of the raw
+                # values.
+                if self.__rollups:
+                    self.__updateRollups(cursor, tableName, blockList)
+
+                # Timestamp statistics are derived from the sample clock.
+                tableSampleCount = 0
+                tableFirstTimestamp = float("inf")
+                tableLastTimestamp = float("-inf")
+                for block in blockList:
+                    count = len(block)
+                    firstTimestamp = block.startTime()
+                    lastTimestamp = block.scanStartTime + \
+                        (block.firstIndex + count - 1) / block.rate
+                    tableSampleCount += count
+                    timestampSum += \
+                        count * (firstTimestamp + lastTimestamp) / 2.0
+                    tableFirstTimestamp = \
+                        min(tableFirstTimestamp, firstTimestamp)
+                    tableLastTimestamp = max(tableLastTimestamp, lastTimestamp)
+                sampleCount += tableSampleCount
+                oldestTimestamp = min(oldestTimestamp, tableFirstTimestamp)
+                newestTimestamp = max(newestTimestamp, tableLastTimestamp)
+
+                # Record the written values in the segment catalog.
+                cursor.execute(
+                    DatabaseInterface.CATALOG_TABLE_INSERT_QUERY,
+                    (self.__segmentId, tableName))
+                cursor.execute(
+                    DatabaseInterface.CATALOG_TABLE_UPDATE_QUERY,
+                    (tableFirstTimestamp, tableFirstTimestamp,
+                    tableLastTimestamp, tableLastTimestamp,
+                    tableSampleCount, self.__segmentId, tableName))
+
+            cursor.execute(
+                DatabaseInterface.CATALOG_SEGMENT_UPDATE_QUERY,
+                (self.__segmentId,))
+            if self.__spool is not None:
+                cursor.execute(
+                    DatabaseInterface.CATALOG_SPOOL_UPDATE_QUERY,
+                    (flushSequence,))
+
+            # Commit changes to DB.
             self.dbConnection.commit()
+        except sqlite3.Error as e:
+            self.__rollback()
+            self.__writebackFailures.inc()
+            self.__samplesDropped.inc(flushCache.sampleCount())
+            print("Writeback failed. Dropped " +
+                str(flushCache.sampleCount()) + " values: " + str(e))
+            return False
 
-            try:
-                self.__writeSemaphore.release()
-            except:
-                return
+        # Update statistics.
+        commitTime = time.time()
+        self.__samplesCommitted.inc(sampleCount)
+        self.__rowsCommitted.inc(rowCount)
+        self.__writebackSeconds.observe(commitTime - startTime)
+        self.__writebackDuration.set(commitTime - startTime)
+        if sampleCount:
+            self.writebackStatistics.append((
+                commitTime,
+                sampleCount,
+                commitTime - startTime,
+                commitTime - newestTimestamp,
+                commitTime - timestampSum / sampleCount,
+                commitTime - oldestTimestamp))
+        return True
 
     def __createDbStructure(self, dbName):
         """
@@ -273,32 +1029,221 @@ class DatabaseInterface:
         dbName(string): The name of the database.
         """
 
-         # Try to establish connection to databse.
+         # Try to establish connection to databse. Transactions are handled 
+         # explicitly.
         try:
-            self.dbConnection = sqlite3.connect(dbName)
+            self.dbConnection = sqlite3.connect(
+                dbName, 
+                isolation_level = None)
         except:
             self.__connected = False
             return False
 
+        # Apply SQLite tuning. The page size has to be set before the journal 
+        # mode, as it can not be changed anymore in WAL mode.
+        if self.__pageSize is not None:
+            self.dbConnection.execute(
+                "PRAGMA page_size = " + str(self.__pageSize))
+        if self.__journalMode is not None:
+            self.dbConnection.execute(
+                "PRAGMA journal_mode = " + self.__journalMode)
+        if self.__synchronous is not None:
+            self.dbConnection.execute(
+                "PRAGMA synchronous = " + self.__synchronous)
+        if self.__cacheSize is not None:
+            self.dbConnection.execute(
+                "PRAGMA cache_size = " + str(self.__cacheSize))
+
+        # The catalog and the rollup database are attached to every database
+        # file, so they are updated in the same transaction as the values.
+        self.__attachDb(
+            self.__databaseName + DatabaseInterface.CATALOG_FILE_SUFFIX,
+            "catalog")
+        self.dbConnection.execute(
+            DatabaseInterface.CREATE_CATALOG_SEGMENTS_QUERY)
+        self.dbConnection.execute(
+            DatabaseInterface.CREATE_CATALOG_TABLES_QUERY)
+        if self.__spool is not None:
+            self.dbConnection.execute(
+                DatabaseInterface.CREATE_CATALOG_SPOOL_QUERY)
+        if self.__rollups:
+            self.__attachDb(
+                self.__databaseName + DatabaseInterface.ROLLUP_FILE_SUFFIX,
+                "rollup")
+            for rollup in self.__rollups:
+                rollupTableName = \
+                    DatabaseInterface.ROLLUP_TABLE_NAME.substitute(
+                        size = rollup)
+                self.dbConnection.execute(
+                    DatabaseInterface.CREATE_ROLLUP_QUERY.substitute(
+                        tableName = rollupTableName))
+
         # Create database structure
         c = self.dbConnection.cursor()
 
         # Create a table for each Measurement and MeasurementConfig
-        for measurementConf in self.measurementConfig:
-            measConfigName = \
-                str(measurementConf[SentinelConfig.JSON_MEASUREMENT_NAME])
-            measurements = \
-                measurementConf[SentinelConfig.JSON_MEASUREMENTS]
-
-            # Iterate over measurements.
-            for measurementName in measurements.keys():
-                # Build table name from MeasurementConfig name + Measurement 
-                # name.
-                tableName = measConfigName + "_" + str(measurementName)
-                query = \
-                    DatabaseInterface.CREATE_QUERY.substitute(
-                        tableName = tableName)
-                c.execute(query)
+        clustered = self.__timeIndex == DatabaseInterface.TIME_INDEX_CLUSTERED
+        for tableName in self.__tableNames():
+            if self.__storageLayout == DatabaseInterface.STORAGE_LAYOUT_BLOCKS:
+                if clustered:
+                    createQuery = DatabaseInterface.CREATE_CLUSTERED_BLOCK_QUERY
+                else:
+                    createQuery = DatabaseInterface.CREATE_BLOCK_QUERY
+            else:
+                if clustered:
+                    createQuery = DatabaseInterface.CREATE_CLUSTERED_QUERY
+                else:
+                    createQuery = DatabaseInterface.CREATE_QUERY
+            c.execute(createQuery.substitute(tableName = tableName))
+
+            # Clustered blocks are ordered by scan and index, but a range 
+            # query needs the timestamp of the first sample of a block. As 
+            # there are only few blocks, the index is cheap to maintain.
+            if clustered and \
+                self.__storageLayout == DatabaseInterface.STORAGE_LAYOUT_BLOCKS:
+                c.execute(
+                    DatabaseInterface.CREATE_BLOCK_TIME_INDEX_QUERY.substitute(
+                        tableName = tableName))
+
+        # Register the new file in the segment catalog. The path is stored
+        # relative to the catalog, so the files can be moved together.
+        catalogDir = os.path.dirname(os.path.abspath(
+            self.__databaseName + DatabaseInterface.CATALOG_FILE_SUFFIX))
+        c.execute("BEGIN")
+        c.execute(
+            DatabaseInterface.CATALOG_SEGMENT_INSERT_QUERY,
+            (os.path.relpath(os.path.abspath(dbName), catalogDir), time.time()))
+        self.__segmentId = c.lastrowid
+        c.executemany(
+            DatabaseInterface.CATALOG_TABLE_INSERT_QUERY,
+            [(self.__segmentId, tableName) 
+            for tableName in self.__tableNames()])
+        self.dbConnection.commit()
+
+    def __attachDb(self, fileName, schemaName):
+        """
+        Attaches a database to the current database connection, and applies
+        the journal mode and synchronous level to it.
+
+        Parameters:
+        fileName (string): The file name of the database.
+
+        schemaName (string): The name, the database is attached as.
+        """
+
+        self.dbConnection.execute(
+            "ATTACH DATABASE ? AS " + schemaName, (fileName,))
+        if self.__journalMode is not None:
+            self.dbConnection.execute(
+                "PRAGMA " + schemaName + ".journal_mode = " + 
+                self.__journalMode)
+        if self.__synchronous is not None:
+            self.dbConnection.execute(
+                "PRAGMA " + schemaName + ".synchronous = " + 
+                self.__synchronous)
+
+    def __updateRollups(self, cursor, tableName, blockList):
+        """
+        Merges the values of blocks into the rollup tables. Has to be called
+        within the transaction of the writeback.
+
+        Parameters:
+        cursor (sqlite3.Cursor): The cursor of the writeback.
+
+        tableName (string): The name of the measurement.
+
+        blockList (list<MeasurementBlock>): The blocks of the measurement.
+        """
+
+        # Blocks are not necessarily received in time order.
+        timestamps = np.concatenate(
+            [block.timestamps() for block in blockList])
+        values = np.concatenate([block.values for block in blockList])
+        if np.any(np.diff(timestamps) < 0):
+            order = np.argsort(timestamps, kind = "stable")
+            timestamps = timestamps[order]
+            values = values[order]
+
+        for rollup in self.__rollups:
+            buckets = np.floor(timestamps / rollup).astype(np.int64)
+            starts = np.flatnonzero(np.diff(buckets, prepend = buckets[0] - 1))
+            counts = np.diff(np.append(starts, len(buckets)))
+            upsertQuery = DatabaseInterface.ROLLUP_UPSERT_QUERY.substitute(
+                tableName = DatabaseInterface.ROLLUP_TABLE_NAME.substitute(
+                    size = rollup))
+            cursor.executemany(
+                upsertQuery,
+                zip(
+                    [tableName] * len(starts),
+                    buckets[starts].tolist(),
+                    np.minimum.reduceat(values, starts).tolist(),
+                    np.maximum.reduceat(values, starts).tolist(),
+                    np.add.reduceat(values, starts).tolist(),
+                    counts.tolist()))
+
+    def __clusteredInsert(self, insertQuery):
+        """
+        Adapts an insert query to tables clustered on time. There, the time is
+        the primary key. Duplicates can only be caused by a step of the clock
+        of the host, and must not abort the whole writeback.
+        """
+
+        if self.__timeIndex == DatabaseInterface.TIME_INDEX_CLUSTERED:
+            return insertQuery.replace("INSERT", "INSERT OR IGNORE", 1)
+        return insertQuery
+
+    def __closeDb(self):
+        """
+        Closes the current database file. Creates the time indexes before, if
+        they are configured to be created on rotation.
+        """
+
+        if self.__timeIndex == DatabaseInterface.TIME_INDEX_ON_ROTATION:
+            if self.__storageLayout == DatabaseInterface.STORAGE_LAYOUT_BLOCKS:
+                indexQuery = DatabaseInterface.CREATE_BLOCK_TIME_INDEX_QUERY
+            else:
+                indexQuery = DatabaseInterface.CREATE_TIME_INDEX_QUERY
+            try:
+                cursor = self.dbConnection.cursor()
+                cursor.execute("BEGIN")
+                for tableName in self.__tableNames():
+                    cursor.execute(
+                        indexQuery.substitute(tableName = tableName))
+                self.dbConnection.commit()
+            except sqlite3.Error as e:
+                self.__rollback()
+                print("Could not create time index: " + str(e))
+
+        # Mark the file as closed cleanly in the segment catalog.
+        self.dbConnection.execute(
+            DatabaseInterface.CATALOG_SEGMENT_CLOSE_QUERY,
+            (self.__segmentId,))
+        self.dbConnection.close()
+
+    def __rollback(self):
+        """
+        Rolls back the open transaction after an SQLite error. Errors of the 
+        rollback itself are printed, as the transaction may already have been
+        rolled back by SQLite.
+        """
+
+        try:
+            if self.dbConnection.in_transaction:
+                self.dbConnection.rollback()
+        except sqlite3.Error as e:
+            print("Could not roll back transaction: " + str(e))
+
+    def __tableNames(self):
+        """
+        Returns the names of the tables of all measurements of all measurement
+        configurations, as compiled into the execution plans. The table name 
+        is built from the MeasurementConfig name and the Measurement name.
+        """
+
+        return [
+            tableName 
+            for plan in self.__executionPlans 
+            for tableName in plan.tableNames]
     
     @staticmethod
     def __constructDbName(dbNameBase):
@@ -310,9 +1255,17 @@ class DatabaseInterface:
         dbNameBase(string): The base name of the database.
 
         Return:
-        A string in the format <dbNameBase>_<YYYY-MM-DD>T<HH-MM-SS>
+        A string in the format <dbNameBase>_<YYYY-MM-DD>T<HH-MM-SS>. If a
+        file with this name exists already, i.e. after two changes of the 
+        database file within one second, a counter is appended as 
+        <dbNameBase>_<YYYY-MM-DD>T<HH-MM-SS>_<n>.
         """
 
         tempTimestamp = datetime.datetime.now().isoformat().replace(":", "-")
         timestamp = tempTimestamp.split(".")[0]
-        return dbNameBase + "_" + timestamp + ".sl3"
\ No newline at end of file
+        dbName = dbNameBase + "_" + timestamp + ".sl3"
+        counter = 1
+        while os.path.exists(dbName):
+            dbName = dbNameBase + "_" + timestamp + "_" + str(counter) + ".sl3"
+            counter += 1
+        return dbName
\ No newline at end of file
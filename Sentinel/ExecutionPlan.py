@@ -0,0 +1,193 @@
+"""
+This program has been created as part of the "Mikrosystemtechnik Labor" lecture
+at the "Institut für Sensor und Aktuator Systeme" TU Wien.
+This class holds everything, that is needed to acquire and process the values
+of one measurement configuration: The scanned boards and their channel masks,
+the order of the channels in the acquired data, the compiled measurement 
+expressions, the names of the tables, the results are written to, the
+reductions of their sample rate and the trigger. The plans are compiled once,
+when the configuration is loaded, and can not be changed afterwards. A switch
+of the measurement configuration only selects another plan.
+
+Author: David FREISMUTH
+Date: DEC 2019
+License:
+"""
+
+# Project imports
+from ConfigModel import ConfigError, suggestion
+from MeasurementExpression import MeasurementExpression
+from daqhats_utils import chan_list_to_mask
+
+class ExecutionPlan:
+    """
+    Immutable, compiled form of a measurement configuration. boards holds a
+    (board index, channel numbers, channel mask) tuple per scanned DAQ board,
+    in ascending order of the board index. reductions holds a (table name,
+    ReductionConfig) tuple per reduced measurement. trigger is a (table name
+    of the source, TriggerConfig) tuple, or None if all values are stored.
+    """
+
+    __slots__ = (
+        "index",
+        "name",
+        "scanRate",
+        "boards",
+        "channelTags",
+        "measurements",
+        "tableNames",
+        "reductions",
+        "trigger",
+        "outputState")
+
+    def __init__(
+        self, 
+        index, 
+        name, 
+        scanRate, 
+        boardChannels, 
+        measurements, 
+        outputState,
+        reductions = None,
+        trigger = None):
+        """
+        Compiles a measurement configuration.
+
+        Parameters:
+        index (int): The index of the measurement configuration in the
+        configuration file.
+
+        name (string): The name of the measurement configuration.
+
+        scanRate (float): The scan rate per channel.
+
+        boardChannels (dict<int,dict<int,string>>): Maps from the index of a
+        DAQ board to the channels, that are scanned on this board. The 
+        channels map from channel number to channel tag.
+
+        measurements (dict<string,string>): Maps from measurement name to its
+        expression.
+
+        outputState (bool): The state of the GPIO outputs.
+
+        reductions (dict<string,ReductionConfig>): Optional reductions of the
+        sample rate, by measurement name.
+
+        trigger (TriggerConfig): Optional trigger. Its source is the name of a
+        measurement.
+
+        Throws:
+        ConfigError: When a channel number or a measurement expression is
+        invalid. The paths of the problems are relative to the measurement
+        configuration.
+        """
+
+        name = str(name)
+
+        # Every DAQ card interleaves the values of its scanned channels in
+        # ascending order of their channel numbers, independent of the order
+        # in the configuration file. The blocks of stacked boards are merged
+        # column wise, in ascending order of the board index.
+        boards = []
+        channelTags = []
+        for boardIndex in sorted(boardChannels):
+            channels = boardChannels[boardIndex]
+            try:
+                channelNumbers = sorted(int(channel) for channel in channels)
+            except ValueError:
+                raise ConfigError([
+                    ("Channels", "Channel numbers have to be integers.")])
+            if not channelNumbers:
+                continue
+            boards.append((
+                int(boardIndex),
+                tuple(channelNumbers),
+                chan_list_to_mask(channelNumbers)))
+            channelTags.extend(
+                channels[channel] for channel in sorted(
+                    channels, key = lambda channel: int(channel)))
+        if not boards:
+            raise ConfigError([("Channels", "No channels configured.")])
+        channelTags = tuple(channelTags)
+
+        compiledMeasurements = []
+        problems = []
+        for measurementName, expression in measurements.items():
+            try:
+                compiledMeasurements.append((
+                    str(measurementName),
+                    name + "_" + str(measurementName),
+                    MeasurementExpression(expression, channelTags)))
+            except ValueError as error:
+                problems.append(
+                    ("Measurements." + str(measurementName), str(error)))
+
+        # Reductions are stored by table name, as the reduced blocks are 
+        # identified by their table.
+        tableNames = {measurementName : tableName
+            for measurementName, tableName, expression in compiledMeasurements}
+        compiledReductions = []
+        for measurementName, reduction in (reductions or {}).items():
+            if measurementName not in measurements:
+                problems.append((
+                    "Reductions." + str(measurementName),
+                    "No measurement with this name." +
+                    suggestion(measurementName, measurements)))
+            elif measurementName in tableNames:
+                compiledReductions.append(
+                    (tableNames[measurementName], reduction))
+        if trigger is not None and trigger.source not in measurements:
+            problems.append((
+                "Trigger.Source",
+                "No measurement with this name." +
+                suggestion(trigger.source, measurements)))
+        if problems:
+            raise ConfigError(problems)
+
+        self.__set("index", int(index))
+        self.__set("name", name)
+        self.__set("scanRate", float(scanRate))
+        self.__set("boards", tuple(boards))
+        self.__set("channelTags", channelTags)
+        self.__set("measurements", tuple(compiledMeasurements))
+        self.__set("tableNames", tuple(
+            tableName for measurementName, tableName, expression
+            in compiledMeasurements))
+        self.__set("reductions", tuple(compiledReductions))
+        self.__set("trigger", (tableNames[trigger.source], trigger)
+            if trigger is not None else None)
+        self.__set("outputState", bool(outputState))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("ExecutionPlan objects are immutable.")
+
+    def __delattr__(self, name):
+        raise AttributeError("ExecutionPlan objects are immutable.")
+
+    def __getstate__(self):
+        return {name : getattr(self, name) for name in ExecutionPlan.__slots__}
+
+    def __setstate__(self, state):
+        for name, value in state.items():
+            self.__set(name, value)
+
+    def __repr__(self):
+        return "ExecutionPlan(" + str(self.index) + ", " + \
+            repr(self.name) + ")"
+
+    def channelCount(self):
+        """
+        Returns the count of scanned channels of all boards.
+        """
+
+        return len(self.channelTags)
+
+    def boardCount(self):
+        """
+        Returns the count of scanned boards.
+        """
+
+        return len(self.boards)
+
+    def __set(self, name, value):
+        object.__setattr__(self, name, value)
@@ -42,13 +42,20 @@ License:
 """
 
 # Python imports
+import asyncio
 import copy
 
 # Third party imports
-import RPi.GPIO as GPIO
 import time
+try:
+    import RPi.GPIO as GPIO
+except ImportError:
+    # Not running on a Raspberry Pi. The outputs are not driven, but the
+    # measurement configuration messages are still consumed.
+    GPIO = None
 # Project imports
 from SentinelConfig import SentinelConfig
+from Metrics import MetricsRegistry
 from threading import Timer, Semaphore, Thread
 
 class GpioHandler:
@@ -72,7 +79,10 @@ class GpioHandler:
     OUTPUT_STATE_DRIVE = 1
     OUTPUT_STATE_FLYBACK = 2
 
-    def __init__(self, configObject, gpioQueue):
+    # Output state with all transistors closed.
+    OUTPUTS_CLOSED = (True, True, False, False)
+
+    def __init__(self, configObject, gpioQueue, metrics = None):
         """
         Loads the configObject.
         
@@ -82,22 +92,23 @@ class GpioHandler:
         loaded from.
 
         gpioQueue(Manager.Queue): The queue that will be listened by this class.
+        An asyncio.Queue, if the handler is run with runAsync().
+
+        metrics(MetricsRegistry): The registry, the metrics of the GPIO handler
+        are registered in. If None, a private registry is used.
         """
 
-        # Get measurement control config.
-        self.__measContConfig = configObject.getConfig(
-            SentinelConfig.JSON_MEAS_CONTROL)
+        # Get the GPIO pins of the outputs. Their count has been checked, when
+        # the configuration has been loaded.
+        self.__outputGpios = list(configObject.getConfig(
+            SentinelConfig.JSON_MEAS_CONTROL).outputGpios)
 
         # Stores the currently active measurement config index.
         self.__activemeasConfIdx = 0
 
         # Get output states of measurement configurations.
-        measConfs = configObject.getConfig(
-            SentinelConfig.JSON_MEASUREMENT_CONFIG)
-        self.__outputStates = []
-        for measConf in measConfs:
-            self.__outputStates.append( 
-                measConf[SentinelConfig.JSON_MEASUREMENT_OUT_STATE])
+        self.__outputStates = [
+            plan.outputState for plan in configObject.getExecutionPlans()]
 
         # Timers for Output Switching state machine.
         self.__outputDriveTimer = Timer(
@@ -122,17 +133,26 @@ class GpioHandler:
         # The communication queue.
         self.__gpioQueue = gpioQueue
 
+        # Metrics of the GPIO handler.
+        self.metrics = metrics if metrics is not None else MetricsRegistry()
+        self.__outputSwitches = self.metrics.counter(
+            "sentinel_gpio_switches_total",
+            "Measurement configuration messages handled by the GPIO handler.")
+        self.metrics.gauge(
+            "sentinel_gpio_queue_depth",
+            "Messages in the queue to the GPIO handler.",
+            function = self.__gpioQueue.qsize)
+
     def start(self):
         """
         Starts the listener thread.
         """
         
-        if len(self.__measContConfig[SentinelConfig.JSON_MEAS_CONTROL_OUTPUT]) != 4:
-            return False
-        else:
-            self.__runThread = True
-            self.__listenerThread.start()
-            return True
+        if GPIO is None:
+            print("RPi.GPIO is not available. GPIO outputs are disabled.")
+        self.__runThread = True
+        self.__listenerThread.start()
+        return True
 
     def stop(self):
         """
@@ -141,7 +161,8 @@ class GpioHandler:
         
         self.__runThread = False
         self.__listenerThread.join()
-        GPIO.cleanup()
+        if GPIO is not None:
+            GPIO.cleanup()
 
     def __handleOutput(self):
         """
@@ -149,99 +170,117 @@ class GpioHandler:
         timer objects and by applyMeasConfig() from outside.
         """
 
-         # Set RPi.GPIO module to use board numbering. 
+        # Without RPi.GPIO, only consume the queue.
+        if GPIO is None:
+            while(self.__runThread):
+                try:
+                    self.__activemeasConfIdx = self.__gpioQueue.get()
+                except:
+                    return
+                self.__outputSwitches.inc()
+                self.__gpioQueue.task_done()
+            return
+
+        self.__setupOutputs()
+        while(self.__runThread):
+            try:
+                self.__activemeasConfIdx = self.__gpioQueue.get()
+            except:
+                return
+
+            # Run through the states of the output state machine.
+            for state, outputState, holdTime in \
+                self.__outputSequence(self.__activemeasConfIdx):
+                self.__outputStateMachine = state
+                GPIO.output(
+                    self.__outputGpios,
+                    outputState)
+                time.sleep(holdTime)
+            self.__outputStateMachine = GpioHandler.OUTPUT_STATE_IDLE
+            self.__outputSwitches.inc()
+            self.__gpioQueue.task_done()
+
+    async def runAsync(self):
+        """
+        Coroutine, that replaces the listener thread in the asyncio runtime.
+        Consumes the gpioQueue, which has to be an asyncio.Queue then, and 
+        runs the output state machine until it is cancelled. The waits of the
+        state machine do not block the event loop. On cancellation, all 
+        transistors are closed, so the relais is not driven any further.
+        """
+
+        if GPIO is None:
+            print("RPi.GPIO is not available. GPIO outputs are disabled.")
+        else:
+            self.__setupOutputs()
+
+        try:
+            while True:
+                self.__activemeasConfIdx = await self.__gpioQueue.get()
+                if GPIO is not None:
+                    for state, outputState, holdTime in \
+                        self.__outputSequence(self.__activemeasConfIdx):
+                        self.__outputStateMachine = state
+                        GPIO.output(
+                            self.__outputGpios,
+                            outputState)
+                        await asyncio.sleep(holdTime)
+                self.__outputStateMachine = GpioHandler.OUTPUT_STATE_IDLE
+                self.__outputSwitches.inc()
+                self.__gpioQueue.task_done()
+        finally:
+            if GPIO is not None:
+                GPIO.output(
+                    self.__outputGpios,
+                    GpioHandler.OUTPUTS_CLOSED)
+                GPIO.cleanup()
+
+    def __setupOutputs(self):
+        """
+        Sets up the output GPIOs, with all transistors closed.
+        """
+
+        # Set RPi.GPIO module to use board numbering. 
         GPIO.setmode(GPIO.BOARD)
         
         # Setup in/outputs.
         GPIO.setup(
-            self.__measContConfig[SentinelConfig.JSON_MEAS_CONTROL_OUTPUT][0],
+            self.__outputGpios[0],
             GPIO.OUT,
             initial = GPIO.HIGH)
         GPIO.setup(
-            self.__measContConfig[SentinelConfig.JSON_MEAS_CONTROL_OUTPUT][1],
+            self.__outputGpios[1],
             GPIO.OUT,
             initial = GPIO.HIGH)
         GPIO.setup(
-            self.__measContConfig[SentinelConfig.JSON_MEAS_CONTROL_OUTPUT][2],
+            self.__outputGpios[2],
             GPIO.OUT,
             initial = GPIO.LOW)
         GPIO.setup(
-            self.__measContConfig[SentinelConfig.JSON_MEAS_CONTROL_OUTPUT][3],
+            self.__outputGpios[3],
             GPIO.OUT,
             initial = GPIO.LOW)
 
-        while(self.__runThread):
-            try:
-                self.__activemeasConfIdx = self.__gpioQueue.get()
-            except:
-                return
-
-            runStateMachine = True
-            while(runStateMachine):
-                
-                # OUTPUT_STATE_IDLE
-                if self.__outputStateMachine == GpioHandler.OUTPUT_STATE_IDLE:
-                    # Determine which transistors to switch.
-                    if self.__outputStates[self.__activemeasConfIdx]:
-                        #Current flow from transitor A to D.
-                        outputState = (False, True, False, True)
-                        GPIO.output(
-                            self.__measContConfig\
-                                [SentinelConfig.JSON_MEAS_CONTROL_OUTPUT],
-                            outputState)
-                    else:
-                        # Current flow from transitor B to C.
-                        outputState = (True, False, True, False)
-                        GPIO.output(
-                            self.__measContConfig\
-                                [SentinelConfig.JSON_MEAS_CONTROL_OUTPUT],
-                            outputState)
+    def __outputSequence(self, measConfIdx):
+        """
+        Returns the states of the output state machine for a switch to the
+        measurement configuration measConfIdx, as (state, output state, hold
+        time) tuples. The output state is held for hold time seconds.
+        """
 
-                    # Set new state and wait.
-                    self.__outputStateMachine = GpioHandler.OUTPUT_STATE_DRIVE
-                    time.sleep(GpioHandler.DRIVE_TIME)
+        if self.__outputStates[measConfIdx]:
+            # Current flow from transitor A to D. Then let current flow over 
+            # transistor A and the flyback diode parallely to B.
+            drive = (False, True, False, True)
+            flyback = (False, True, False, False)
+        else:
+            # Current flow from transitor B to C. Then let current flow over 
+            # transistor C and the flyback diode parallely to D.
+            drive = (True, False, True, False)
+            flyback = (True, True, True, False)
 
-                # OUTPUT_STATE_DRIVE
-                elif self.__outputStateMachine == GpioHandler.OUTPUT_STATE_DRIVE:
-                    if self.__outputStates[self.__activemeasConfIdx]:
-                        #Let current flow over transistor A and the flyback diode 
-                        #parallely to B.
-                        outputState = (False, True, False, False)
-                        GPIO.output(
-                            self.__measContConfig\
-                                [SentinelConfig.JSON_MEAS_CONTROL_OUTPUT],
-                            outputState)
-            
-                    else:
-                        #Let current flow over transistor C and the flyback diode 
-                        #parallely to D.
-                        outputState = (True, True, True, False)
-                        GPIO.output(
-                            self.__measContConfig\
-                                [SentinelConfig.JSON_MEAS_CONTROL_OUTPUT],
-                            outputState)
-                       
-                    # Set new state and wait.
-                    self.__outputStateMachine = GpioHandler.OUTPUT_STATE_FLYBACK
-                    time.sleep(GpioHandler.FLYBACK_TIME)
-
-                # OUTPUT_STATE_FLYBACK
-                elif self.__outputStateMachine == GpioHandler.OUTPUT_STATE_FLYBACK:
-                    # Close all transistors.
-                    outputState = (True, True, False, False)
-                    GPIO.output(
-                        self.__measContConfig\
-                            [SentinelConfig.JSON_MEAS_CONTROL_OUTPUT],
-                        outputState)
-
-                    # Set new state and start timer.
-                    self.__outputStateMachine = GpioHandler.OUTPUT_STATE_IDLE
-                    runStateMachine = False
-                    self.__gpioQueue.task_done()
-
-                # INVALID STATE
-                else:
-                    print(
-                        "Invalid Outpute state machine state. "
-                        "Stopping GPIO handling")
-                    self.stop()
\ No newline at end of file
+        return (
+            (GpioHandler.OUTPUT_STATE_DRIVE, drive, GpioHandler.DRIVE_TIME),
+            (GpioHandler.OUTPUT_STATE_FLYBACK, flyback, 
+                GpioHandler.FLYBACK_TIME),
+            (GpioHandler.OUTPUT_STATE_IDLE, GpioHandler.OUTPUTS_CLOSED, 0))
@@ -0,0 +1,266 @@
+"""
+This program has been created as part of the "Mikrosystemtechnik Labor" lecture
+at the "Institut für Sensor und Aktuator Systeme" TU Wien.
+This class encapsulates a mathematical expression of a measurement, as it is
+given in the "Measurements" dictionary of the configuration file. The
+expression is parsed once, checked against a restricted set of syntax elements
+and compiled. The compiled expression is then evaluated on whole blocks of
+channel values, rather than on single samples.
+
+Author: David FREISMUTH
+Date: DEC 2019
+License:
+"""
+
+# Python imports
+import ast
+from functools import reduce
+
+# Third party imports
+import numpy as np
+
+# Project imports
+from ConfigModel import suggestion
+
+def elementMinimum(*values):
+    """
+    Element wise minimum of any count of arguments. Unlike np.minimum, a third
+    argument is never used as output array.
+    """
+
+    return reduce(np.minimum, values)
+
+def elementMaximum(*values):
+    """
+    Element wise maximum of any count of arguments. Unlike np.maximum, a third
+    argument is never used as output array.
+    """
+
+    return reduce(np.maximum, values)
+
+class MeasurementExpression:
+    """
+    A compiled mathematical expression, whose variables are channel tags.
+    """
+
+    # Syntax elements, that may appear in an expression. Everything else (i.e.
+    # attribute access, subscripts, lambdas, comprehensions) is rejected.
+    ALLOWED_NODES = (
+        ast.Expression,
+        ast.BinOp,
+        ast.UnaryOp,
+        ast.Call,
+        ast.Name,
+        ast.Load,
+        ast.Constant,
+        ast.Add,
+        ast.Sub,
+        ast.Mult,
+        ast.Div,
+        ast.FloorDiv,
+        ast.Mod,
+        ast.Pow,
+        ast.UAdd,
+        ast.USub)
+
+    # Functions, that may be called in an expression. All of them operate
+    # element wise on whole blocks.
+    FUNCTIONS = {
+        "abs" : np.abs,
+        "sqrt" : np.sqrt,
+        "exp" : np.exp,
+        "log" : np.log,
+        "log10" : np.log10,
+        "sin" : np.sin,
+        "cos" : np.cos,
+        "tan" : np.tan,
+        "min" : elementMinimum,
+        "max" : elementMaximum }
+
+    # Allowed count of arguments per function as (minimum, maximum) tuple.
+    # Functions, that are not listed, take exactly one argument. A ufunc
+    # would use surplus arguments as output array, so the counts are checked
+    # when the expression is compiled.
+    ARGUMENT_COUNTS = {
+        "min" : (2, None),
+        "max" : (2, None) }
+
+    # Named constants, that may be used in an expression.
+    CONSTANTS = {
+        "pi" : np.pi,
+        "e" : np.e }
+
+    def __init__(self, expression, channelTags):
+        """
+        Parses and compiles the expression.
+
+        Parameters:
+        expression (string): A mathematical expression containing channel tags.
+
+        channelTags (list<string>): The channel tags, that may be used as
+        variables in expression.
+
+        Throws:
+        ValueError: When expression can not be parsed, contains unsupported
+        syntax elements or unknown identifiers.
+        """
+
+        self.expression = str(expression)
+        self.channelTags = tuple(channelTags)
+
+        # Channel tags have to be valid identifiers and must not shadow
+        # functions or constants.
+        for tag in self.channelTags:
+            if not tag.isidentifier():
+                raise ValueError(
+                    "Channel tag '" + tag + "' is not a valid identifier.")
+            if tag in MeasurementExpression.FUNCTIONS or \
+                tag in MeasurementExpression.CONSTANTS:
+                raise ValueError(
+                    "Channel tag '" + tag + "' shadows a built in name.")
+
+        try:
+            tree = ast.parse(self.expression, mode = "eval")
+        except SyntaxError as error:
+            raise ValueError(
+                "Could not parse expression '" + self.expression + "': " +
+                str(error.msg))
+
+        self.__checkTree(tree)
+
+        # Numeric constants are evaluated as float64, so operations on
+        # constants alone, like 2**1000**1000, overflow to inf instead of
+        # computing huge integers.
+        self.__constants = {}
+        tree = ast.fix_missing_locations(
+            _ConstantNamer(self.__constants, self.channelTags).visit(tree))
+        self.__code = compile(tree, "<" + self.expression + ">", "eval")
+
+    def __call__(self, channelValues, sampleCount):
+        """
+        Evaluates the expression on a whole block of channel values.
+
+        Parameters:
+        channelValues (dict<string,ndarray>): Maps from channel tag to an array
+        of the values of the corresponding channel.
+
+        sampleCount (int): The count of samples in the block.
+
+        Returns:
+        An array of floats with sampleCount entries, that represents the result
+        of the expression. Constant expressions are broadcasted to the size of
+        the block.
+        """
+
+        namespace = dict(MeasurementExpression.FUNCTIONS)
+        namespace.update(MeasurementExpression.CONSTANTS)
+        namespace.update(self.__constants)
+        namespace.update(channelValues)
+        value = eval(self.__code, {"__builtins__": {}}, namespace)
+        return np.broadcast_to(
+            np.asarray(value, dtype = np.float64),
+            (sampleCount,))
+
+    def __reduce__(self):
+        """
+        Compiled code can not be pickled. The expression is therefore
+        recompiled, when it is passed to another process.
+        """
+
+        return (MeasurementExpression, (self.expression, self.channelTags))
+
+    def __repr__(self):
+        return "MeasurementExpression(" + repr(self.expression) + ")"
+
+    def __checkTree(self, tree):
+        """
+        Walks the syntax tree of the expression and rejects all nodes, that are
+        not explicitly allowed.
+
+        Parameters:
+        tree (ast.Expression): The parsed expression.
+
+        Throws:
+        ValueError: When an unsupported node, an unknown identifier or a
+        function call with a wrong count of arguments is found.
+        """
+
+        # Function names are only allowed as the callee of a call.
+        calleeNodes = set()
+
+        for node in ast.walk(tree):
+            if not isinstance(node, MeasurementExpression.ALLOWED_NODES):
+                raise ValueError(
+                    "Unsupported element '" + type(node).__name__ + "' in "
+                    "expression '" + self.expression + "'.")
+
+            if isinstance(node, ast.Constant) and \
+                (isinstance(node.value, bool) or
+                not isinstance(node.value, (int, float))):
+                raise ValueError(
+                    "Unsupported constant " + repr(node.value) + " in "
+                    "expression '" + self.expression + "'.")
+
+            if isinstance(node, ast.Call):
+                if not isinstance(node.func, ast.Name) or \
+                    node.func.id not in MeasurementExpression.FUNCTIONS:
+                    raise ValueError(
+                        "Unsupported function call in expression '" +
+                        self.expression + "'. Supported functions are: " +
+                        ", ".join(MeasurementExpression.FUNCTIONS) + ".")
+                if len(node.keywords) > 0:
+                    raise ValueError(
+                        "Keyword arguments are not supported in expression '" +
+                        self.expression + "'.")
+                minimum, maximum = MeasurementExpression.ARGUMENT_COUNTS.get(
+                    node.func.id, (1, 1))
+                if len(node.args) < minimum or \
+                    (maximum is not None and len(node.args) > maximum):
+                    raise ValueError(
+                        "Function " + node.func.id + " takes " +
+                        MeasurementExpression.__countText(minimum, maximum) +
+                        ", got " + str(len(node.args)) + " in expression '" +
+                        self.expression + "'.")
+                calleeNodes.add(id(node.func))
+
+            elif isinstance(node, ast.Name) and id(node) not in calleeNodes:
+                if node.id not in self.channelTags and \
+                    node.id not in MeasurementExpression.CONSTANTS:
+                    raise ValueError(
+                        "Unknown identifier '" + node.id + "' in expression '" +
+                        self.expression + "'. Known channel tags are: " +
+                        ", ".join(self.channelTags) + "." +
+                        suggestion(node.id, self.channelTags))
+
+    @staticmethod
+    def __countText(minimum, maximum):
+        if maximum is None:
+            return "at least " + str(minimum) + " arguments"
+        if minimum == maximum:
+            return str(minimum) + " argument" + ("s" if minimum != 1 else "")
+        return str(minimum) + " to " + str(maximum) + " arguments"
+
+class _ConstantNamer(ast.NodeTransformer):
+    """
+    Replaces the numeric constants of a checked syntax tree by names, that are
+    bound to float64 values.
+    """
+
+    def __init__(self, constants, reservedNames):
+        """
+        Parameters:
+        constants (dict<string,float64>): Receives the values of the names.
+
+        reservedNames (list<string>): Names, that must not be used, i.e. the
+        channel tags.
+        """
+
+        self.__constants = constants
+        self.__reservedNames = set(reservedNames)
+
+    def visit_Constant(self, node):
+        name = "_constant" + str(len(self.__constants))
+        while name in self.__reservedNames:
+            name = "_" + name
+        self.__constants[name] = np.float64(node.value)
+        return ast.copy_location(ast.Name(id = name, ctx = ast.Load()), node)
@@ -0,0 +1,269 @@
+"""
+This program has been created as part of the "Mikrosystemtechnik Labor" lecture
+at the "Institut für Sensor und Aktuator Systeme" TU Wien.
+This module contains the transport between the processing workers of the data
+acquisition module and the database interface. Each processed block is sent as
+one batch of typed numpy arrays through a pipe, without passing through a
+manager process. The capacity of the transport is bounded, so a stalled
+database interface slows down the producers instead of filling up memory. The
+end of the stream is signalled explicitly by close(). Each batch can carry a
+BlockTrace, that records when the acquired block passed the stages of the
+pipeline.
+
+Author: David FREISMUTH
+Date: DEC 2019
+License:
+"""
+
+# Python imports
+import multiprocessing
+import queue
+import time
+
+# Third party imports
+import numpy as np
+
+class BlockTrace:
+    """
+    Sequence number and stage timestamps of an acquired block. The timestamps
+    are taken with time.monotonic(), which is comparable across the processes
+    of the sentinel.
+    """
+
+    __slots__ = ("sequenceNumber", "stamps")
+
+    # The stamps, that are recorded along the pipeline, in order.
+    READ_START = "readStart"
+    READ_END = "readEnd"
+    DISPATCHED = "dispatched"
+    PROCESS_START = "processStart"
+    PROCESS_END = "processEnd"
+    RECEIVED = "received"
+    STORED = "stored"
+    COMMITTED = "committed"
+
+    # The stages as (name, start stamp, end stamp) tuples. 
+    #   read: a_in_scan_read of the block.
+    #   dispatch: Copy to the ring buffer, pickling and queueing in the pool.
+    #   process: Evaluation of the measurement expressions.
+    #   transport: Transport to the database interface, including the wait
+    #   for free capacity.
+    #   store: Wait for the value cache lock and space in the value cache.
+    #   writeback: Time in the value cache until the commit.
+    #   total: From the start of the read to the commit.
+    STAGES = (
+        ("read", READ_START, READ_END),
+        ("dispatch", DISPATCHED, PROCESS_START),
+        ("process", PROCESS_START, PROCESS_END),
+        ("transport", PROCESS_END, RECEIVED),
+        ("store", RECEIVED, STORED),
+        ("writeback", STORED, COMMITTED),
+        ("total", READ_START, COMMITTED))
+
+    def __init__(self, sequenceNumber):
+        """
+        Parameters:
+        sequenceNumber (int): The sequence number of the acquired block.
+        """
+
+        self.sequenceNumber = sequenceNumber
+        self.stamps = {}
+
+    def __getstate__(self):
+        return (self.sequenceNumber, self.stamps)
+
+    def __setstate__(self, state):
+        self.sequenceNumber, self.stamps = state
+
+    def stamp(self, name, timestamp = None):
+        """
+        Records a stamp.
+
+        Parameters:
+        name (string): The name of the stamp.
+
+        timestamp (float): The time.monotonic() timestamp. Defaults to now.
+        """
+
+        self.stamps[name] = \
+            time.monotonic() if timestamp is None else timestamp
+
+    def stageLatencies(self):
+        """
+        Returns the latencies of the stages, of which both stamps have been
+        recorded, as list of (stage name, seconds) tuples.
+        """
+
+        return [
+            (stage, self.stamps[end] - self.stamps[start])
+            for stage, start, end in BlockTrace.STAGES
+            if start in self.stamps and end in self.stamps]
+
+class MeasurementBlock:
+    """
+    The processed values of one measurement for one acquired block. The 
+    timestamps of the values are not stored, but derived from the sample clock:
+    The value with index i has been acquired at 
+    scanStartTime + (firstIndex + i) / rate.
+    """
+
+    __slots__ = (
+        "name", "scanStartTime", "rate", "firstIndex", "values", "trace")
+
+    def __init__(
+        self, name, scanStartTime, rate, firstIndex, values, trace = None):
+        """
+        Parameters:
+        name (string): The name of the measurement. Also the name of the SQL
+        table the values are written to.
+
+        scanStartTime (float): Timestamp of the start of the scan, the block
+        belongs to.
+
+        rate (float): The sample rate of the values in samples per second.
+
+        firstIndex (int): The index of the first value of the block, counted 
+        from the start of the scan.
+
+        values (ndarray): The values of the measurement as float64 array.
+
+        trace (BlockTrace): Optional trace of the acquired block. Shared by all
+        blocks, that have been calculated from the same acquired block.
+        """
+
+        self.name = name
+        self.scanStartTime = float(scanStartTime)
+        self.rate = float(rate)
+        self.firstIndex = int(firstIndex)
+        self.values = np.asarray(values, dtype = np.float64)
+        self.trace = trace
+
+    def __getstate__(self):
+        return (
+            self.name, 
+            self.scanStartTime, 
+            self.rate, 
+            self.firstIndex, 
+            self.values,
+            self.trace)
+
+    def __setstate__(self, state):
+        self.name, self.scanStartTime, self.rate, self.firstIndex, \
+            self.values, self.trace = state
+
+    def __len__(self):
+        return len(self.values)
+
+    def startTime(self):
+        """
+        Returns the timestamp of the first value of the block.
+        """
+
+        return self.scanStartTime + self.firstIndex / self.rate
+
+    def timestamps(self):
+        """
+        Materializes the timestamps of the values of the block.
+
+        Returns:
+        A float64 array of timestamps.
+        """
+
+        return self.scanStartTime + \
+            (np.arange(len(self.values), dtype = np.float64) + 
+            self.firstIndex) / self.rate
+
+class EndOfStream(Exception):
+    """
+    Raised by MeasurementTransport.get(), after the producer side has closed
+    the transport.
+    """
+    pass
+
+class _EndOfStreamMarker:
+    """
+    The message, that is sent by MeasurementTransport.close().
+    """
+    pass
+
+class MeasurementTransport:
+    """
+    Bounded, multi producer, single consumer transport of MeasurementBlock
+    batches. Has to be passed to the producer processes at their creation, i.e.
+    as initializer argument of a multiprocessing.Pool.
+    """
+
+    # Default count of batches, the transport can hold.
+    DEFAULT_CAPACITY = 64
+
+    def __init__(self, capacity = DEFAULT_CAPACITY):
+        """
+        Parameters:
+        capacity (int): The count of batches the transport can hold, before
+        put() blocks.
+        """
+
+        self.capacity = int(capacity)
+        self.__queue = multiprocessing.Queue(maxsize = self.capacity)
+
+    def put(self, blocks, timeout = None):
+        """
+        Sends a batch of blocks. Blocks, if the transport is full.
+
+        Parameters:
+        blocks (list<MeasurementBlock>): The blocks of one processed block.
+        The arrays of the blocks must not be modified afterwards, as they are
+        serialized asynchronously.
+
+        timeout (float): Maximum time in seconds to wait for free capacity.
+        None waits forever.
+
+        Returns:
+        True if the batch has been sent. False, if the transport stayed full
+        until timeout.
+        """
+
+        try:
+            self.__queue.put(list(blocks), timeout = timeout)
+        except queue.Full:
+            return False
+        return True
+
+    def get(self, timeout = None):
+        """
+        Receives a batch of blocks.
+
+        Parameters:
+        timeout (float): Maximum time in seconds to wait for a batch. None
+        waits forever.
+
+        Returns:
+        A list of MeasurementBlock objects, or None if no batch arrived until
+        timeout.
+
+        Throws:
+        EndOfStream: When the transport has been closed by the producer side.
+        """
+
+        try:
+            batch = self.__queue.get(timeout = timeout)
+        except queue.Empty:
+            return None
+        if isinstance(batch, _EndOfStreamMarker):
+            raise EndOfStream()
+        return batch
+
+    def close(self):
+        """
+        Signals the end of the stream to the consumer. Has to be called after
+        all producers have finished.
+        """
+
+        self.__queue.put(_EndOfStreamMarker())
+
+    def qsize(self):
+        """
+        Returns the approximate count of batches in the transport.
+        """
+
+        return self.__queue.qsize()
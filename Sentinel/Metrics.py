@@ -0,0 +1,591 @@
+"""
+This program has been created as part of the "Mikrosystemtechnik Labor" lecture
+at the "Institut für Sensor und Aktuator Systeme" TU Wien.
+This module implements the runtime metrics of the sentinel. The modules of the
+sentinel register counters, gauges and histograms in a MetricsRegistry, that
+is shared by all of them. The MetricsExporter serves the metrics of a registry
+via HTTP in the Prometheus text format, and optionally writes them
+periodically to a JSON snapshot file.
+
+Author: David FREISMUTH
+Date: DEC 2019
+License:
+"""
+
+# Python imports
+import bisect
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import os
+import threading
+import time
+
+class Counter:
+    """
+    A value, that only increases. Thread safe.
+    """
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__value = 0
+
+    def inc(self, amount = 1):
+        """
+        Increases the counter.
+
+        Parameters:
+        amount (int or float): The increment. Must not be negative.
+
+        Throws:
+        ValueError: If amount is negative.
+        """
+
+        if amount < 0:
+            raise ValueError("Counters can only be increased.")
+        with self.__lock:
+            self.__value += amount
+
+    def value(self):
+        return self.__value
+
+class Gauge:
+    """
+    A value, that can go up and down. Either set explicitly, or read from a
+    function whenever the metrics are collected. Thread safe.
+    """
+
+    def __init__(self, function = None):
+        """
+        Parameters:
+        function (callable): Optional function without parameters, that
+        returns the current value.
+        """
+
+        self.__lock = threading.Lock()
+        self.__value = 0
+        self.__function = function
+
+    def set(self, value):
+        with self.__lock:
+            self.__value = value
+
+    def inc(self, amount = 1):
+        with self.__lock:
+            self.__value += amount
+
+    def dec(self, amount = 1):
+        with self.__lock:
+            self.__value -= amount
+
+    def value(self):
+        if self.__function is not None:
+            return self.__function()
+        return self.__value
+
+class Histogram:
+    """
+    Distribution of observed values, counted in fixed buckets. Observing a
+    value costs a binary search and a locked increment. Thread safe.
+    """
+
+    # Default upper bounds of the buckets in seconds, from 100 us to 1 min.
+    DEFAULT_BUCKETS = (
+        0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+        0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+    def __init__(self, buckets = DEFAULT_BUCKETS):
+        """
+        Parameters:
+        buckets (list<float>): The ascending upper bounds of the buckets. A 
+        bucket for values above the last bound is added.
+        """
+
+        self.__lock = threading.Lock()
+        self.__bounds = tuple(sorted(float(bound) for bound in buckets))
+        self.__counts = [0] * (len(self.__bounds) + 1)
+        self.__sum = 0.0
+        self.__count = 0
+        self.__max = None
+
+    def observe(self, value):
+        """
+        Adds a value to the distribution.
+        """
+
+        index = bisect.bisect_left(self.__bounds, value)
+        with self.__lock:
+            self.__counts[index] += 1
+            self.__sum += value
+            self.__count += 1
+            if self.__max is None or value > self.__max:
+                self.__max = value
+
+    def value(self):
+        """
+        Returns the distribution as dict with the keys "buckets" (list of 
+        (upper bound, cumulative count) tuples, the last bound is infinity),
+        "sum", "count" and "max".
+        """
+
+        with self.__lock:
+            counts = list(self.__counts)
+            result = {
+                "sum" : self.__sum, 
+                "count" : self.__count, 
+                "max" : self.__max }
+        cumulative = 0
+        buckets = []
+        for bound, count in zip(self.__bounds + (float("inf"),), counts):
+            cumulative += count
+            buckets.append((bound, cumulative))
+        result["buckets"] = buckets
+        return result
+
+    def quantile(self, q):
+        """
+        Estimates a quantile by linear interpolation within its bucket.
+
+        Parameters:
+        q (float): The quantile between 0 and 1.
+
+        Returns:
+        The estimated value, or None if nothing has been observed.
+        """
+
+        distribution = self.value()
+        if distribution["count"] == 0:
+            return None
+        rank = q * distribution["count"]
+        lowerBound = 0.0
+        lowerCount = 0
+        for bound, count in distribution["buckets"]:
+            if count >= rank and count > lowerCount:
+                if bound == float("inf"):
+                    return distribution["max"]
+                return min(
+                    lowerBound + (bound - lowerBound) * 
+                    (rank - lowerCount) / (count - lowerCount),
+                    distribution["max"])
+            lowerBound = bound
+            lowerCount = count
+        return distribution["max"]
+
+    def summary(self):
+        """
+        Returns a one line summary of the distribution.
+        """
+
+        distribution = self.value()
+        if distribution["count"] == 0:
+            return "count 0"
+        return "count " + str(distribution["count"]) + \
+            ", mean " + Histogram.__format(
+                distribution["sum"] / distribution["count"]) + \
+            ", p50 " + Histogram.__format(self.quantile(0.5)) + \
+            ", p90 " + Histogram.__format(self.quantile(0.9)) + \
+            ", p99 " + Histogram.__format(self.quantile(0.99)) + \
+            ", max " + Histogram.__format(distribution["max"])
+
+    @staticmethod
+    def __format(seconds):
+        return str(round(seconds * 1000.0, 3)) + " ms"
+
+class MetricsRegistry:
+    """
+    Collection of the metrics of the sentinel. A metric is identified by its
+    name and an optional set of labels.
+    """
+
+    TYPE_COUNTER = "counter"
+    TYPE_GAUGE = "gauge"
+    TYPE_HISTOGRAM = "histogram"
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+
+        # Maps from metric name to (type, help, dict<labels, metric>). The
+        # labels are stored as sorted tuple of (name, value) tuples.
+        self.__metrics = {}
+
+    def counter(self, name, help, labels = None):
+        """
+        Returns the counter with the given name and labels. It is created, if
+        it does not exist yet.
+
+        Parameters:
+        name (string): The name of the metric. Should end with "_total".
+
+        help (string): Description of the metric.
+
+        labels (dict<string,string>): Optional labels of the metric.
+
+        Throws:
+        ValueError: If the name is already registered with another type.
+        """
+
+        return self.__register(
+            MetricsRegistry.TYPE_COUNTER, name, help, labels, Counter)
+
+    def gauge(self, name, help, labels = None, function = None):
+        """
+        Returns the gauge with the given name and labels. It is created, if it
+        does not exist yet.
+
+        Parameters:
+        name (string): The name of the metric.
+
+        help (string): Description of the metric.
+
+        labels (dict<string,string>): Optional labels of the metric.
+
+        function (callable): Optional function, that returns the current value
+        of the gauge. Only used, if the gauge is created.
+
+        Throws:
+        ValueError: If the name is already registered with another type.
+        """
+
+        return self.__register(
+            MetricsRegistry.TYPE_GAUGE, name, help, labels,
+            lambda: Gauge(function))
+
+    def histogram(
+        self, 
+        name, 
+        help, 
+        labels = None, 
+        buckets = Histogram.DEFAULT_BUCKETS):
+        """
+        Returns the histogram with the given name and labels. It is created, if
+        it does not exist yet.
+
+        Parameters:
+        name (string): The name of the metric.
+
+        help (string): Description of the metric.
+
+        labels (dict<string,string>): Optional labels of the metric.
+
+        buckets (list<float>): Upper bounds of the buckets. Only used, if the
+        histogram is created.
+
+        Throws:
+        ValueError: If the name is already registered with another type.
+        """
+
+        return self.__register(
+            MetricsRegistry.TYPE_HISTOGRAM, name, help, labels,
+            lambda: Histogram(buckets))
+
+    def series(self, name):
+        """
+        Returns the metrics registered with a name.
+
+        Returns:
+        A list of (labels, metric) tuples. The labels are given as dict.
+        """
+
+        with self.__lock:
+            entry = self.__metrics.get(name)
+            if entry is None:
+                return []
+            return [
+                (dict(labels), metric) 
+                for labels, metric in entry[2].items()]
+
+    def value(self, name, labels = None):
+        """
+        Returns the current value of a metric, or None if it does not exist.
+        """
+
+        with self.__lock:
+            entry = self.__metrics.get(name)
+            if entry is None:
+                return None
+            metric = entry[2].get(MetricsRegistry.__labelKey(labels))
+        if metric is None:
+            return None
+        return metric.value()
+
+    def collect(self):
+        """
+        Reads the current values of all metrics. Gauges, whose function fails,
+        are left out.
+
+        Returns:
+        A list of (name, type, help, list<(labels, value)>) tuples, ordered by
+        name.
+        """
+
+        with self.__lock:
+            entries = [
+                (name, metricType, help, list(series.items()))
+                for name, (metricType, help, series)
+                in sorted(self.__metrics.items())]
+
+        result = []
+        for name, metricType, help, series in entries:
+            values = []
+            for labels, metric in series:
+                try:
+                    values.append((labels, metric.value()))
+                except Exception:
+                    continue
+            result.append((name, metricType, help, values))
+        return result
+
+    def prometheusText(self):
+        """
+        Returns the current values of all metrics in the Prometheus text
+        exposition format.
+        """
+
+        lines = []
+        for name, metricType, help, series in self.collect():
+            lines.append("# HELP " + name + " " + MetricsRegistry.__escape(help))
+            lines.append("# TYPE " + name + " " + metricType)
+            for labels, value in series:
+                if metricType != MetricsRegistry.TYPE_HISTOGRAM:
+                    lines.append(
+                        name + MetricsRegistry.__formatLabels(labels) + " " +
+                        repr(float(value)))
+                    continue
+                for bound, count in value["buckets"]:
+                    bucketLabels = labels + (
+                        ("le", "+Inf" if bound == float("inf") 
+                        else repr(bound)),)
+                    lines.append(
+                        name + "_bucket" + 
+                        MetricsRegistry.__formatLabels(bucketLabels) + " " +
+                        str(count))
+                formattedLabels = MetricsRegistry.__formatLabels(labels)
+                lines.append(
+                    name + "_sum" + formattedLabels + " " + 
+                    repr(float(value["sum"])))
+                lines.append(
+                    name + "_count" + formattedLabels + " " + 
+                    str(value["count"]))
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self):
+        """
+        Returns the current values of all metrics as dict, that maps from the
+        name of the metric including its labels to its value. Histograms are 
+        given as dict, see Histogram.value(), with the infinite upper bound
+        replaced by "+Inf", so the snapshot can be written as JSON.
+        """
+
+        result = {}
+        for name, metricType, help, series in self.collect():
+            for labels, value in series:
+                if metricType == MetricsRegistry.TYPE_HISTOGRAM:
+                    value = dict(value)
+                    value["buckets"] = [
+                        ("+Inf" if bound == float("inf") else bound, count)
+                        for bound, count in value["buckets"]]
+                result[name + MetricsRegistry.__formatLabels(labels)] = value
+        return result
+
+    def __register(self, metricType, name, help, labels, factory):
+        """
+        Returns the metric with the given name and labels, or creates it.
+        """
+
+        labelKey = MetricsRegistry.__labelKey(labels)
+        with self.__lock:
+            entry = self.__metrics.get(name)
+            if entry is None:
+                entry = (metricType, help, {})
+                self.__metrics[name] = entry
+            elif entry[0] != metricType:
+                raise ValueError(
+                    "Metric " + name + " is already registered as " +
+                    entry[0] + ".")
+            metric = entry[2].get(labelKey)
+            if metric is None:
+                metric = factory()
+                entry[2][labelKey] = metric
+            return metric
+
+    @staticmethod
+    def __labelKey(labels):
+        if not labels:
+            return ()
+        return tuple(sorted((str(k), str(v)) for k, v in labels.items()))
+
+    @staticmethod
+    def __formatLabels(labels):
+        if not labels:
+            return ""
+        return "{" + ",".join(
+            name + "=\"" + MetricsRegistry.__escape(value) + "\""
+            for name, value in labels) + "}"
+
+    @staticmethod
+    def __escape(text):
+        return str(text).replace("\\", "\\\\").replace("\"", "\\\"") \
+            .replace("\n", "\\n")
+
+class MetricsExporter:
+    """
+    Serves the metrics of a registry via HTTP, and writes JSON snapshots of
+    them.
+    """
+
+    # The path the metrics are served at.
+    METRICS_PATH = "/metrics"
+
+    # Default address of the HTTP endpoint. Only reachable from the local
+    # machine.
+    DEFAULT_ADDRESS = "127.0.0.1"
+
+    # Default intervall of the JSON snapshots in seconds.
+    DEFAULT_SNAPSHOT_INTERVALL = 10.0
+
+    def __init__(
+        self,
+        registry,
+        port = None,
+        address = DEFAULT_ADDRESS,
+        snapshotFile = None,
+        snapshotIntervall = DEFAULT_SNAPSHOT_INTERVALL):
+        """
+        Parameters:
+        registry (MetricsRegistry): The exported registry.
+
+        port (int): Port of the HTTP endpoint. None disables it. 0 selects a
+        free port.
+
+        address (string): Address the HTTP endpoint is bound to.
+
+        snapshotFile (string): Path of the JSON snapshot file. None disables
+        the snapshots.
+
+        snapshotIntervall (float): Intervall of the snapshots in seconds.
+        """
+
+        self.__registry = registry
+        self.__port = port
+        self.__address = address
+        self.__snapshotFile = snapshotFile
+        self.__snapshotIntervall = float(snapshotIntervall)
+
+        self.__server = None
+        self.__serverThread = None
+        self.__snapshotThread = None
+        self.__stopEvent = threading.Event()
+
+    def start(self):
+        """
+        Starts the HTTP endpoint and the snapshot thread.
+
+        Returns:
+        True if started successfully. False otherwise.
+        """
+
+        if self.__port is not None:
+            registry = self.__registry
+
+            class Handler(BaseHTTPRequestHandler):
+                def do_GET(self):
+                    if self.path.split("?")[0] != \
+                        MetricsExporter.METRICS_PATH:
+                        self.send_error(404)
+                        return
+                    body = registry.prometheusText().encode("utf-8")
+                    self.send_response(200)
+                    self.send_header(
+                        "Content-Type",
+                        "text/plain; version=0.0.4; charset=utf-8")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+
+                def log_message(self, format, *args):
+                    # Requests are not logged to the console.
+                    pass
+
+            try:
+                self.__server = ThreadingHTTPServer(
+                    (self.__address, int(self.__port)), Handler)
+            except OSError as e:
+                print("Could not start metrics endpoint: " + str(e))
+                return False
+            self.__server.daemon_threads = True
+            self.__serverThread = threading.Thread(
+                target = self.__server.serve_forever,
+                name = "MetricsServer",
+                daemon = True)
+            self.__serverThread.start()
+            print(
+                "Metrics are served at http://" + self.__address + ":" +
+                str(self.port()) + MetricsExporter.METRICS_PATH)
+
+        if self.__snapshotFile is not None:
+            if self.__snapshotIntervall <= 0:
+                print(
+                    "Invalid snapshot intervall " +
+                    str(self.__snapshotIntervall) + ".")
+                self.stop()
+                return False
+            self.__snapshotThread = threading.Thread(
+                target = self.__snapshotFunction,
+                name = "MetricsSnapshot",
+                daemon = True)
+            self.__snapshotThread.start()
+        return True
+
+    def stop(self):
+        """
+        Stops the HTTP endpoint and the snapshot thread. A last snapshot is
+        written.
+        """
+
+        self.__stopEvent.set()
+        if self.__snapshotThread is not None:
+            self.__snapshotThread.join()
+            self.__snapshotThread = None
+        if self.__server is not None:
+            self.__server.shutdown()
+            self.__server.server_close()
+            self.__serverThread.join()
+            self.__server = None
+
+    def port(self):
+        """
+        Returns the port of the HTTP endpoint, or None if it is not running.
+        """
+
+        if self.__server is None:
+            return None
+        return self.__server.server_address[1]
+
+    def writeSnapshot(self):
+        """
+        Writes the current values of all metrics to the snapshot file. The
+        file is replaced atomically, so readers never see a partial file.
+        """
+
+        temporaryFile = self.__snapshotFile + ".tmp"
+        with open(temporaryFile, "w") as snapshotFilePtr:
+            json.dump({
+                "timestamp" : time.time(),
+                "metrics" : self.__registry.snapshot() },
+                snapshotFilePtr,
+                indent = 4)
+        os.replace(temporaryFile, self.__snapshotFile)
+
+    def __snapshotFunction(self):
+        """
+        Worker function of the snapshot thread.
+        """
+
+        while not self.__stopEvent.wait(self.__snapshotIntervall):
+            self.__writeSafely()
+        self.__writeSafely()
+
+    def __writeSafely(self):
+        try:
+            self.writeSnapshot()
+        except OSError as e:
+            print("Could not write metrics snapshot: " + str(e))
@@ -0,0 +1,174 @@
+"""
+This program has been created as part of the "Mikrosystemtechnik Labor" lecture
+at the "Institut für Sensor und Aktuator Systeme" TU Wien.
+This class implements a ring buffer of samples in shared memory. The
+acquisition thread writes the raw samples of each block into the ring buffer.
+The processing workers attach to the same shared memory and read the blocks
+without copying them, so only the offset, the size and the sequence number of
+a block have to be passed to them. Blocks are always stored contiguously. If a
+block does not fit at the end of the buffer, it is written to the beginning.
+A block stays reserved, until it has been released by the writer. This is done,
+when the processing of the block has finished.
+
+Author: David FREISMUTH
+Date: DEC 2019
+License:
+"""
+
+# Python imports
+from collections import deque
+from multiprocessing import shared_memory
+import threading
+
+# Third party imports
+import numpy as np
+
+class SampleRingBuffer:
+    """
+    Ring buffer of float64 samples in shared memory.
+    """
+
+    # The data type of the samples in the buffer.
+    DTYPE = np.float64
+
+    def __init__(self, capacity, name = None):
+        """
+        Creates a new ring buffer, or attaches to an existing one.
+
+        Parameters:
+        capacity (int): The count of samples the buffer can hold.
+
+        name (string): The name of the shared memory of an existing ring
+        buffer. If None, a new shared memory block is created. Only the
+        creator of the ring buffer may write to it.
+        """
+
+        self.capacity = int(capacity)
+        itemSize = np.dtype(SampleRingBuffer.DTYPE).itemsize
+        if name is None:
+            self.__sharedMemory = shared_memory.SharedMemory(
+                create = True,
+                size = self.capacity * itemSize)
+            self.__owner = True
+        else:
+            self.__sharedMemory = shared_memory.SharedMemory(name = name)
+            self.__owner = False
+        self.name = self.__sharedMemory.name
+
+        self.__buffer = np.ndarray(
+            (self.capacity,),
+            dtype = SampleRingBuffer.DTYPE,
+            buffer = self.__sharedMemory.buf)
+
+        # Bookkeeping of the writer. The deque contains a [sequence number,
+        # offset, count, released] list for every reserved block, ordered from
+        # oldest to newest.
+        self.__lock = threading.Lock()
+        self.__reservedBlocks = deque()
+        self.__writeOffset = 0
+        self.__nextSequenceNumber = 0
+
+    def write(self, samples):
+        """
+        Copies samples into the ring buffer and reserves the occupied region.
+
+        Parameters:
+        samples (ndarray): The samples to write.
+
+        Returns:
+        A (sequenceNumber, offset, count) tuple, that identifies the block, or
+        None if there is not enough free space in the buffer.
+        """
+
+        count = samples.size
+        with self.__lock:
+            offset = self.__findFreeRegion(count)
+            if offset is None:
+                return None
+
+            self.__buffer[offset:offset + count] = samples.reshape(-1)
+            self.__writeOffset = offset + count
+
+            sequenceNumber = self.__nextSequenceNumber
+            self.__nextSequenceNumber += 1
+            self.__reservedBlocks.append([sequenceNumber, offset, count, False])
+            return (sequenceNumber, offset, count)
+
+    def release(self, sequenceNumber):
+        """
+        Releases the block with the given sequence number, so its region can be
+        overwritten. Blocks may be released in any order. Their regions are
+        freed in the order they have been written.
+
+        Parameters:
+        sequenceNumber (int): The sequence number returned by write().
+        """
+
+        with self.__lock:
+            for block in self.__reservedBlocks:
+                if block[0] == sequenceNumber:
+                    block[3] = True
+                    break
+            while self.__reservedBlocks and self.__reservedBlocks[0][3]:
+                self.__reservedBlocks.popleft()
+
+    def reservedBlockCount(self):
+        """
+        Returns the count of blocks, that have been written but not released.
+        """
+
+        with self.__lock:
+            return len(self.__reservedBlocks)
+
+    def view(self, offset, count):
+        """
+        Returns a view of a block in the buffer. The view is only valid until
+        the block is released.
+
+        Parameters:
+        offset (int): Offset of the block in samples.
+
+        count (int): Size of the block in samples.
+        """
+
+        return self.__buffer[offset:offset + count]
+
+    def close(self):
+        """
+        Detaches from the shared memory. The creator of the ring buffer also
+        frees the shared memory.
+        """
+
+        self.__buffer = None
+        self.__sharedMemory.close()
+        if self.__owner:
+            self.__sharedMemory.unlink()
+
+    def __findFreeRegion(self, count):
+        """
+        Returns the offset of a free contiguous region of count samples, or
+        None if there is none. Has to be called with the lock held.
+        """
+
+        if count > self.capacity:
+            return None
+
+        if not self.__reservedBlocks:
+            # Buffer is empty. Start at the beginning.
+            return 0
+
+        headOffset = self.__reservedBlocks[0][1]
+        if self.__writeOffset > headOffset:
+            # Reserved region does not wrap. Free space is behind the newest
+            # block and in front of the oldest block.
+            if self.__writeOffset + count <= self.capacity:
+                return self.__writeOffset
+            if count <= headOffset:
+                return 0
+            return None
+        else:
+            # Reserved region wraps. Free space is between newest and oldest
+            # block.
+            if self.__writeOffset + count <= headOffset:
+                return self.__writeOffset
+            return None
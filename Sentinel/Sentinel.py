@@ -13,9 +13,13 @@ from SentinelConfig import SentinelConfig
 from DatabaseInterface import DatabaseInterface
 from DataAquisition import DataAquisition
 from GpioHandler import GpioHandler
+from MeasurementTransport import MeasurementTransport
+from Metrics import MetricsRegistry, MetricsExporter
+from AsyncRuntime import AsyncRuntime
 
 # Python imports
-from multiprocessing import Manager, queues
+from multiprocessing import Manager
+import argparse
 import signal
 
 class Sentinel:
@@ -23,20 +27,27 @@ class Sentinel:
     # The name of the config file, that gets read in at start up.
     CONFIG_FILE_NAME = "sentinelConfig.json"
 
-    def __init__(self, configFile):
+    def __init__(self, configFile, runtime = None):
         """
         Initializes the object. The object has then to be started with main().
 
         Paramterers:
         configFile (string): Path to the XML config file.
+
+        runtime (string): One of SentinelConfig.RUNTIMES. Overrides the 
+        runtime of the configuration file, if not None.
         """
 
         # Declare project object.
         self.configFile = configFile
+        self.runtime = runtime
+        self.asyncRuntime = None
         self.configObject = None
         self.databaseInterface = None
         self.dataAquisition = None
         self.gpioHandler = None
+        self.metrics = None
+        self.metricsExporter = None
 
         # Declare additional objects.
         self.manager = None
@@ -47,73 +58,166 @@ class Sentinel:
     def main(self):
         """
         Main method of the class. Starts the sentinel and all of its sub
-        modules.
+        modules and stops them again on STRG + C.
+        """
+
+        if not self.start():
+            return
+
+        # The asyncio runtime runs, until it has been stopped.
+        if self.asyncRuntime is not None:
+            self.asyncRuntime.run()
+            self.stop()
+            return
+
+        # Waiting for STRG + C.
+        print("Sentinel started. Press STRG + C to stop.")
+        try:
+            input()
+        except KeyboardInterrupt:
+            print("Sentinel stop issued.")
+
+        self.stop()
+
+    def start(self):
+        """
+        Starts all sub modules of the sentinel.
+
+        Returns:
+        True if all modules have been started. False otherwise.
         """
 
         # Deactivate signal handler, so spawned processes dont inherit it. 
         # This is necessary, to be able to shutdown gracefully on a SIGINT.
         original_sigint_handler = signal.signal(signal.SIGINT, signal.SIG_IGN)
 
+        # Parse XML configuration file into a DataAquisitionConfig object.
+        self.configObject = SentinelConfig(self.configFile)
+        if(not self.configObject.isValid()):
+            print("Could not read configuration file. Aborting.")
+            signal.signal(signal.SIGINT, original_sigint_handler)
+            return False
+        if self.runtime is None:
+            self.runtime = self.configObject.getConfig(
+                SentinelConfig.JSON_RUNTIME)
+
+        # Init the metrics registry, that is shared by all modules, and export
+        # it as configured.
+        self.metrics = MetricsRegistry()
+        metricsConfig = self.configObject.getConfig(
+            SentinelConfig.JSON_METRICS_CONFIG)
+        self.metricsExporter = MetricsExporter(
+            self.metrics,
+            port = metricsConfig.port,
+            address = metricsConfig.address,
+            snapshotFile = metricsConfig.snapshotFile,
+            snapshotIntervall = metricsConfig.snapshotIntervall)
+        if(not self.metricsExporter.start()):
+            print("Could not start metrics export. Aborting.")
+            signal.signal(signal.SIGINT, original_sigint_handler)
+            return False
+
+        # The asyncio runtime starts the modules in its event loop.
+        if self.runtime == SentinelConfig.RUNTIME_ASYNCIO:
+            self.asyncRuntime = AsyncRuntime(self.configObject, self.metrics)
+            signal.signal(signal.SIGINT, original_sigint_handler)
+            return True
+
         # Init sync manager for managed queue.
         self.manager = Manager()
 
-        # Init queue for communication between DataAcquisition and 
+        # Init transport for communication between DataAcquisition and 
         # DatabaseInterface module.
-        self.dbIfQueue = self.manager.Queue()
+        self.dbIfQueue = MeasurementTransport()
 
         # Init queue for communication between DataAcquisition and 
         # GpioHandler module.
         self.gpioQueue = self.manager.Queue()
 
-        # Parse XML configuration file into a DataAquisitionConfig object.
-        self.configObject = SentinelConfig(self.configFile)
-        if(not self.configObject.isValid()):
-            print("Could not read configuration file. Aborting.")
-            return
-
         # Start database interface
         self.databaseInterface = DatabaseInterface(
             self.configObject,
-            self.dbIfQueue)
+            self.dbIfQueue,
+            self.metrics)
 
         if(not self.databaseInterface.start()):
             print("Could not start database interface. Aborting.")
-            return
+            signal.signal(signal.SIGINT, original_sigint_handler)
+            return False
 
         # Start GPIO handler.
         self.gpioHandler = GpioHandler(
             self.configObject,
-            self.gpioQueue)
+            self.gpioQueue,
+            self.metrics)
         if(not self.gpioHandler.start()):
             print(
                 "Could not start GpioHandler. Probably configuration specified "
                 "in the configuration file is invalid. Aborting.")
-            return
+            signal.signal(signal.SIGINT, original_sigint_handler)
+            return False
 
         # Start data aquisition thread.
         self.dataAquisition = DataAquisition(
             self.configObject,
             self.dbIfQueue,
-            self.gpioQueue)
+            self.gpioQueue,
+            self.metrics)
         self.dataAquisition.start()
 
         # Reactivate signal handler for SIGINT
         signal.signal(signal.SIGINT, original_sigint_handler)
+        return True
 
-        # Waiting for STRG + C.
-        print("Sentinel started. Press STRG + C to stop.")
-        try:
-            input()
-        except KeyboardInterrupt:
-            print("Sentinel stop issued.")
+    def stop(self):
+        """
+        Stops all sub modules of the sentinel.
+        """
 
-        # Stop all modules.
-        self.dataAquisition.stop()
-        self.databaseInterface.stop()
-        self.manager.shutdown()
-        self.gpioHandler.stop()
+        # Stop all modules. The asyncio runtime has stopped its modules 
+        # already.
+        if self.asyncRuntime is None:
+            self.dataAquisition.stop()
+            self.databaseInterface.stop()
+            self.manager.shutdown()
+            self.gpioHandler.stop()
+        self.metricsExporter.stop()
+        self.printLatencies()
         print("Sentinel has stopped.")
 
+    def printLatencies(self):
+        """
+        Prints a summary of the latency histograms of the pipeline.
+        """
+
+        print("Stage latencies:")
+        for labels, histogram in \
+            self.metrics.series("sentinel_stage_latency_seconds"):
+            print("  " + labels["stage"].ljust(10) + histogram.summary())
+        for labels, histogram in \
+            self.metrics.series("sentinel_writeback_seconds"):
+            print("  " + "commit".ljust(10) + histogram.summary())
+
 if __name__ == '__main__':
-    mainClass = Sentinel(Sentinel.CONFIG_FILE_NAME)
+    # Set up argparse.
+    parser = argparse.ArgumentParser(
+        description="Acquires measurement data and stores it to database.")
+    parser.add_argument(
+        '--config', '-c',
+        dest='configFile',
+        action='store',
+        default=Sentinel.CONFIG_FILE_NAME,
+        help='Path to the JSON configuration file.')
+    parser.add_argument(
+        '--runtime', '-r',
+        dest='runtime',
+        action='store',
+        type=str.capitalize,
+        choices=SentinelConfig.RUNTIMES,
+        default=None,
+        help='Runtime of the sentinel. Overrides the configuration file.')
+    args = parser.parse_args()
+
+    mainClass = Sentinel(args.configFile, args.runtime)
     mainClass.main()
+
@@ -11,7 +11,15 @@ License:
 # Python imports
 import json
 import os
-import copy
+
+# Project imports
+from ConfigModel import ConfigError, ConfigField, ConfigSection, boolean, \
+    integer, listOf, mappingOf, number, oneOf, string
+from DaqBackend import DaqBackend, SimulatedMcc118
+from ExecutionPlan import ExecutionPlan
+from Metrics import MetricsExporter
+from StreamReduction import FirDecimator, StreamReducer
+from TriggeredCapture import CaptureGate
 
 class SentinelConfig:
     """
@@ -30,8 +38,50 @@ class SentinelConfig:
     # The Intervall in write cycles, until the database file gets changed.
     JSON_DATABASE_CHANGE_INT = "ChangeIntervall"
 
-    # The size of the acquisition buffer.
-    JSON_ACQUISITION_BUFFER = "AcquisitionBufferSize"
+    # Optional SQLite journal mode of the database files, i.e. "WAL". WAL 
+    # allows reading a database file, while it is written.
+    JSON_DATABASE_JOURNAL_MODE = "JournalMode"
+
+    # Optional SQLite synchronous level, i.e. "NORMAL" or "FULL".
+    JSON_DATABASE_SYNCHRONOUS = "Synchronous"
+
+    # Optional SQLite page size of new database files in bytes.
+    JSON_DATABASE_PAGE_SIZE = "PageSize"
+
+    # Optional SQLite cache size. Positive values are pages, negative values
+    # are KiB.
+    JSON_DATABASE_CACHE_SIZE = "CacheSize"
+
+    # Optional layout of the measurement tables. "Rows" (default) stores one
+    # (timestamp, value) row per sample. "Blocks" stores one row per processed
+    # block, with the samples packed into a binary blob.
+    JSON_DATABASE_STORAGE_LAYOUT = "StorageLayout"
+
+    # Optional time index of the measurement tables. "None" (default) creates
+    # no index. "Clustered" stores the tables ordered by time. "OnRotation"
+    # creates a time index, when a database file is closed.
+    JSON_DATABASE_TIME_INDEX = "TimeIndex"
+
+    # Optional list of bucket sizes in seconds, for which rollup tables with 
+    # minimum, maximum, mean and count of the values are maintained.
+    JSON_DATABASE_ROLLUPS = "Rollups"
+
+    # Optional memory ceiling of the value cache of the database interface in
+    # MiB.
+    JSON_DATABASE_CACHE_LIMIT = "CacheMemoryLimit"
+
+    # Optional behaviour, when the value cache is full. "Backpressure" 
+    # (default) forces an early writeback and blocks the reception of values
+    # until there is space again. "DropNewest" drops the values, that do not
+    # fit anymore.
+    JSON_DATABASE_CACHE_FULL_POLICY = "CacheFullPolicy"
+
+    # Optional size of the write-ahead spool in MiB. If set, every processed
+    # block is appended to the spool file, before it is written to database.
+    JSON_DATABASE_SPOOL_SIZE = "SpoolSize"
+
+    # Optional flag, wether every append to the spool is flushed to disk.
+    JSON_DATABASE_SPOOL_SYNC = "SpoolSync"
 
     # How often the value cache is written back to database. Value is in 
     # milli seconds.
@@ -41,13 +91,23 @@ class SentinelConfig:
     # dictionraries, containing measurement configurations.
     JSON_MEASUREMENT_CONFIG = "MeasurmentConfig"
 
+    # Correctly spelled alternative of JSON_MEASUREMENT_CONFIG, that is 
+    # accepted as well.
+    JSON_MEASUREMENT_CONFIG_ALIAS = "MeasurementConfig"
+
     # The name of the measurment configuration.
     JSON_MEASUREMENT_NAME = "ConfigName"
 
     # The channels of the DAQ hardware, that shall be used. returns a 
-    # dictionary, that maps from channel number to channel tag.
+    # dictionary, that maps from channel number to channel tag. The channels
+    # belong to the first board of JSON_DAQ_BOARDS.
     JSON_MEASUREMENT_CHANNELS = "Channels"
 
+    # Alternative to JSON_MEASUREMENT_CHANNELS for stacked DAQ boards. Maps 
+    # from board address to a dictionary, that maps from channel number to 
+    # channel tag.
+    JSON_MEASUREMENT_BOARD_CHANNELS = "BoardChannels"
+
     # The rate with which the values shall be sampled.
     JSON_MEASUREMENT_SCANRATE = "ScanRate"
 
@@ -66,6 +126,16 @@ class SentinelConfig:
     # JSON_MEASUREMENT_CHANNELS configuration.
     JSON_MEASUREMENTS = "Measurements" 
 
+    # Optional dictionary, that maps from the name of a measurement to a
+    # reduction of its sample rate, that is applied before the values are 
+    # stored. See StreamReducer for the keys of a reduction.
+    JSON_MEASUREMENT_REDUCTIONS = "Reductions"
+
+    # Optional trigger. If given, only the values around trigger events are
+    # stored, instead of all values. See CaptureGate for the keys of a
+    # trigger.
+    JSON_MEASUREMENT_TRIGGER = "Trigger"
+
     # Dictionary that contains information on how the measurement shall be
     # controlled.    
     JSON_MEAS_CONTROL = "MeasurementControl"
@@ -82,29 +152,197 @@ class SentinelConfig:
     # configuration is changed. Intepreted as in seconds.
     JSON_MEAS_CONTROL_SWITCH_INT = "MeasConfSwitchTimer"
 
+    # Optional dictionary, that specifies the DAQ backend. If omitted, the 
+    # MCC118 hardware is used.
+    JSON_DAQ_CONFIG = "DaqConfig"
+
+    # The DAQ backend to use. Either "MCC118" or "Simulated".
+    JSON_DAQ_BACKEND = "Backend"
+
+    # Optional address of the DAQ HAT. If omitted for the MCC118 backend, the
+    # address is selected interactively, if more than one HAT is found.
+    JSON_DAQ_ADDRESS = "Address"
+
+    # Dictionary that maps from channel number to a waveform description. Only
+    # used by the simulated backend.
+    JSON_DAQ_WAVEFORMS = "Waveforms"
+
+    # Optional list of stacked DAQ boards, that are scanned in parallel. Each
+    # entry contains the JSON_DAQ_ADDRESS and optionally the 
+    # JSON_DAQ_WAVEFORMS of a board. Replaces JSON_DAQ_ADDRESS and 
+    # JSON_DAQ_WAVEFORMS of the DAQ configuration.
+    JSON_DAQ_BOARDS = "Boards"
+
+    # Optional size of the scan buffer of the DAQ card, in seconds of samples
+    # per channel. Defaults to DEFAULT_ACQUISITION_BUFFER.
+    JSON_ACQUISITION_BUFFER = "AcquisitionBufferSize"
+
+    # Optional target latency of the reads from the scan buffer in seconds.
+    # Defaults to DEFAULT_READ_LATENCY.
+    JSON_DAQ_READ_LATENCY = "ReadLatency"
+
+    # Optional fill level of the scan buffer as fraction of its size, at which
+    # it is read at the latest. Defaults to DEFAULT_READ_FILL_FRACTION.
+    JSON_DAQ_READ_FILL_FRACTION = "ReadFillFraction"
+
+    # Count of the analog input channels of the DAQ card.
+    CHANNEL_COUNT = 8
+
+    # Count of the addresses of stacked DAQ HATs.
+    BOARD_COUNT = 8
+
+    # Defaults of the optional acquisition timing configuration.
+    DEFAULT_ACQUISITION_BUFFER = 1.0
+    DEFAULT_READ_LATENCY = 0.25
+    DEFAULT_READ_FILL_FRACTION = 0.5
+
+    # Optional dictionary, that configures the export of the runtime metrics.
+    JSON_METRICS_CONFIG = "Metrics"
+
+    # Optional port of the HTTP endpoint, that serves the metrics in the 
+    # Prometheus text format.
+    JSON_METRICS_PORT = "Port"
+
+    # Optional address, the HTTP endpoint is bound to. Defaults to localhost.
+    JSON_METRICS_ADDRESS = "Address"
+
+    # Optional path of a JSON file, the metrics are written to periodically.
+    JSON_METRICS_SNAPSHOT_FILE = "SnapshotFile"
+
+    # Optional intervall of the JSON snapshots in seconds.
+    JSON_METRICS_SNAPSHOT_INTERVALL = "SnapshotIntervall"
+
+    # Optional runtime of the sentinel. One of RUNTIMES. With RUNTIME_THREADS,
+    # every module runs its own threads. With RUNTIME_ASYNCIO, acquisition 
+    # reads, configuration switches, the hand over to the database interface 
+    # and the writeback timer are coroutines of one event loop, and the 
+    # processing and the database writes run in executors.
+    JSON_RUNTIME = "Runtime"
+    RUNTIME_THREADS = "Threads"
+    RUNTIME_ASYNCIO = "Asyncio"
+    RUNTIMES = (RUNTIME_THREADS, RUNTIME_ASYNCIO)
+
     def __init__(self, configFileName):
         """
-        Reads in the JSON file given with configFileName, and constructs the 
-        SentinelConfig object accordingly.
+        Reads in the JSON file given with configFileName, validates it and 
+        constructs the SentinelConfig object accordingly. All problems of the
+        configuration are printed, with the path of the offending key.
 
         Parameters:
         configFileName (string): Path to the JSON file, containing initial 
         config for the sentinel.
         """
 
+        self.__valid = False
+
         # Check if file exists.
         if not os.path.isfile(configFileName):
-            self.__valid = False
+            print("Configuration file " + str(configFileName) + 
+                " does not exist.")
             return
 
         # Read the JSON file into a dict.
-        jsonFilePtr = open(configFileName, 'r')
-        self.__configDict = json.load(jsonFilePtr)
+        try:
+            with open(configFileName, 'r') as jsonFilePtr:
+                configDict = json.load(jsonFilePtr)
+        except (OSError, ValueError) as e:
+            print("Could not read configuration file: " + str(e))
+            return
 
-        if self.__configDict != None:
-            self.__valid = True
-        else:
-            self.__valid = False
+        # Build the configuration model and compile the measurement 
+        # configurations into execution plans. Both happens only once.
+        try:
+            rootConfig = RootConfig(configDict)
+            executionPlans = SentinelConfig.__compile(
+                rootConfig.measurementConfigs,
+                rootConfig.daqConfig.boards)
+        except ConfigError as error:
+            print("Invalid configuration file " + str(configFileName) + ":")
+            for path, message in error.problems:
+                print("  " + path + ": " + message)
+            return
+
+        self.__databaseConfig = rootConfig.databaseConfig
+        self.__measurementControl = rootConfig.measurementControl
+        self.__daqConfig = rootConfig.daqConfig
+        self.__metricsConfig = rootConfig.metricsConfig
+        self.__runtime = rootConfig.runtime
+        self.__executionPlans = executionPlans
+        self.__valid = True
+
+    @staticmethod
+    def __compile(measurementConfigs, boards):
+        """
+        Compiles the measurement configurations into execution plans.
+
+        Parameters:
+        measurementConfigs (tuple<MeasurementConfig>): The validated 
+        measurement configurations.
+
+        boards (tuple<BoardConfig>): The configured DAQ boards.
+
+        Returns:
+        A tuple of ExecutionPlan objects.
+
+        Throws:
+        ConfigError: When a measurement expression is invalid, a board is not
+        configured, or two measurements are written to the same table.
+        """
+
+        boardIndices = {board.address : index 
+            for index, board in enumerate(boards)}
+        executionPlans = []
+        problems = []
+        tableNames = set()
+        for index, measConfig in enumerate(measurementConfigs):
+            path = SentinelConfig.JSON_MEASUREMENT_CONFIG + \
+                "[" + str(index) + "]"
+
+            # Channels refer to the first board. Board channels are resolved
+            # from board address to the index of the board.
+            if measConfig.boardChannels is None:
+                boardChannels = {0 : dict(measConfig.channels)}
+            else:
+                boardChannels = {}
+                for address, channels in measConfig.boardChannels:
+                    if address not in boardIndices:
+                        problems.append((
+                            path + "." + 
+                            SentinelConfig.JSON_MEASUREMENT_BOARD_CHANNELS + 
+                            "." + str(address),
+                            "No board with this address is configured in " +
+                            SentinelConfig.JSON_DAQ_CONFIG + "." +
+                            SentinelConfig.JSON_DAQ_BOARDS + "."))
+                    else:
+                        boardChannels[boardIndices[address]] = dict(channels)
+                if len(boardChannels) != len(measConfig.boardChannels):
+                    continue
+
+            try:
+                plan = ExecutionPlan(
+                    index,
+                    measConfig.name,
+                    measConfig.scanRate,
+                    boardChannels,
+                    dict(measConfig.measurements),
+                    measConfig.outputState,
+                    dict(measConfig.reductions),
+                    measConfig.trigger)
+            except ConfigError as error:
+                problems.extend(error.prefixed(path).problems)
+                continue
+            for tableName in plan.tableNames:
+                if tableName in tableNames:
+                    problems.append((
+                        path + "." + SentinelConfig.JSON_MEASUREMENTS,
+                        "Table " + tableName + " is already used by " + 
+                        "another measurement."))
+                tableNames.add(tableName)
+            executionPlans.append(plan)
+
+        if problems:
+            raise ConfigError(problems)
+        return tuple(executionPlans)
 
     def isValid(self):
         """
@@ -123,16 +361,24 @@ class SentinelConfig:
         Parameters:
         configDomain (string): Specifies of what configuration domain the data
         shall be retrieved. Can be one of the following: 
-            JSON_DATABASE_CONFIG: A dict containing the database 
-            configuration will be returned.
+            JSON_DATABASE_CONFIG: A DatabaseConfig object.
+
+            JSON_MEASUREMENT_CONFIG: A tuple of ExecutionPlan objects, one per
+            measurement configuration.
+
+            JSON_MEAS_CONTROL: A MeasurementControlConfig object.
 
-            JSON_MEASUREMENT_CONFIG: A list containing dicts with Measurement
-            configuration will be returned
+            JSON_DAQ_CONFIG: A DaqConfig object. If it is not configured, all
+            its values are the defaults.
 
-            JSON_MEAS_CONTRO: A dictionary of measurement control information.
+            JSON_METRICS_CONFIG: A MetricsConfig object. If it is not 
+            configured, all its values are the defaults.
+
+            JSON_RUNTIME: One of RUNTIMES. Defaults to RUNTIME_THREADS.
 
         Returns:
-        A deep copy of the configuration object.
+        The configuration object. Configuration objects are immutable and 
+        therefore shared and not copied.
 
         Throws:
         Exception: When this object has not initialized correctly.
@@ -143,13 +389,441 @@ class SentinelConfig:
         if not self.__valid:
             raise Exception("Config object does not contain valid values.")
 
-
         if configDomain == SentinelConfig.JSON_DATABASE_CONFIG:
-            return copy.deepcopy(self.__configDict[configDomain])
+            return self.__databaseConfig
         elif configDomain == SentinelConfig.JSON_MEASUREMENT_CONFIG:
-            return copy.deepcopy(self.__configDict[configDomain])
+            return self.__executionPlans
         elif configDomain == SentinelConfig.JSON_MEAS_CONTROL:
-            return copy.deepcopy(self.__configDict[configDomain])
+            return self.__measurementControl
+        elif configDomain == SentinelConfig.JSON_DAQ_CONFIG:
+            return self.__daqConfig
+        elif configDomain == SentinelConfig.JSON_METRICS_CONFIG:
+            return self.__metricsConfig
+        elif configDomain == SentinelConfig.JSON_RUNTIME:
+            return self.__runtime
         else:
             # Invalid config key has been passed. Raise ValueError.
-            raise ValueError("Invalid configuration key.")
\ No newline at end of file
+            raise ValueError("Invalid configuration key.")
+
+    def getExecutionPlans(self):
+        """
+        Returns the compiled measurement configurations.
+
+        Returns:
+        A list of ExecutionPlan objects, ordered like the 
+        JSON_MEASUREMENT_CONFIG list. ExecutionPlan objects are immutable and
+        therefore not copied.
+
+        Throws:
+        Exception: When this object has not initialized correctly.
+        """
+
+        if not self.__valid:
+            raise Exception("Config object does not contain valid values.")
+
+        return list(self.__executionPlans)
+
+# The sections of the configuration model. Every section corresponds to a JSON
+# object of the configuration file, and is validated, when it is constructed.
+
+def channelNumber(value):
+    """
+    Parses a channel number of the DAQ card. In JSON objects, channel numbers
+    are given as strings.
+    """
+
+    try:
+        channel = int(value)
+    except (TypeError, ValueError):
+        channel = None
+    if isinstance(value, bool) or channel is None or \
+        channel < 0 or channel >= SentinelConfig.CHANNEL_COUNT:
+        raise ValueError(
+            "Expected a channel number between 0 and " + 
+            str(SentinelConfig.CHANNEL_COUNT - 1) + ", got " + repr(value) + 
+            ".")
+    return channel
+
+def boardAddress(value):
+    """
+    Parses the address of a DAQ board. In JSON objects, addresses are given as
+    strings.
+    """
+
+    try:
+        address = int(value)
+    except (TypeError, ValueError):
+        address = None
+    if isinstance(value, bool) or address is None or \
+        address < 0 or address >= SentinelConfig.BOARD_COUNT:
+        raise ValueError(
+            "Expected a board address between 0 and " + 
+            str(SentinelConfig.BOARD_COUNT - 1) + ", got " + repr(value) + 
+            ".")
+    return address
+
+class DatabaseConfig(ConfigSection):
+    """
+    The JSON_DATABASE_CONFIG section.
+    """
+
+    # Valid values of the JSON_DATABASE_STORAGE_LAYOUT configuration.
+    STORAGE_LAYOUT_ROWS = "Rows"
+    STORAGE_LAYOUT_BLOCKS = "Blocks"
+
+    # Valid values of the JSON_DATABASE_TIME_INDEX configuration.
+    TIME_INDEX_NONE = "None"
+    TIME_INDEX_CLUSTERED = "Clustered"
+    TIME_INDEX_ON_ROTATION = "OnRotation"
+
+    # Valid values of the JSON_DATABASE_JOURNAL_MODE configuration.
+    JOURNAL_MODES = ("DELETE", "TRUNCATE", "PERSIST", "MEMORY", "WAL", "OFF")
+
+    # Valid values of the JSON_DATABASE_SYNCHRONOUS configuration.
+    SYNCHRONOUS_LEVELS = ("OFF", "NORMAL", "FULL", "EXTRA")
+
+    # Valid values of the JSON_DATABASE_CACHE_FULL_POLICY configuration.
+    CACHE_FULL_BACKPRESSURE = "Backpressure"
+    CACHE_FULL_DROP_NEWEST = "DropNewest"
+
+    # Default memory ceiling of the value cache in MiB.
+    DEFAULT_CACHE_LIMIT = 64
+
+    FIELDS = (
+        ConfigField(SentinelConfig.JSON_DATABASE_NAME, "databaseName",
+            string, required = True),
+        ConfigField(SentinelConfig.JSON_DATABASE_CHANGE_INT, "changeIntervall",
+            integer(minimum = 0), required = True),
+        ConfigField(SentinelConfig.JSON_WRITE_INTERVALL, "writeIntervall",
+            integer(minimum = 1), required = True),
+        ConfigField(SentinelConfig.JSON_DATABASE_JOURNAL_MODE, "journalMode",
+            oneOf(*JOURNAL_MODES, ignoreCase = True)),
+        ConfigField(SentinelConfig.JSON_DATABASE_SYNCHRONOUS, "synchronous",
+            oneOf(*SYNCHRONOUS_LEVELS, ignoreCase = True)),
+        ConfigField(SentinelConfig.JSON_DATABASE_PAGE_SIZE, "pageSize",
+            integer(minimum = 512, maximum = 65536)),
+        ConfigField(SentinelConfig.JSON_DATABASE_CACHE_SIZE, "cacheSize",
+            integer()),
+        ConfigField(SentinelConfig.JSON_DATABASE_STORAGE_LAYOUT,
+            "storageLayout",
+            oneOf(STORAGE_LAYOUT_ROWS, STORAGE_LAYOUT_BLOCKS),
+            default = STORAGE_LAYOUT_ROWS),
+        ConfigField(SentinelConfig.JSON_DATABASE_TIME_INDEX, "timeIndex",
+            oneOf(TIME_INDEX_NONE, TIME_INDEX_CLUSTERED, 
+                TIME_INDEX_ON_ROTATION),
+            default = TIME_INDEX_NONE),
+        ConfigField(SentinelConfig.JSON_DATABASE_ROLLUPS, "rollups",
+            listOf(integer(minimum = 1), unique = True), default = ()),
+        ConfigField(SentinelConfig.JSON_DATABASE_CACHE_LIMIT, "cacheLimit",
+            number(minimum = 0, exclusiveMinimum = True),
+            default = DEFAULT_CACHE_LIMIT),
+        ConfigField(SentinelConfig.JSON_DATABASE_CACHE_FULL_POLICY, 
+            "cacheFullPolicy",
+            oneOf(CACHE_FULL_BACKPRESSURE, CACHE_FULL_DROP_NEWEST),
+            default = CACHE_FULL_BACKPRESSURE),
+        ConfigField(SentinelConfig.JSON_DATABASE_SPOOL_SIZE, "spoolSize",
+            number(minimum = 0, exclusiveMinimum = True)),
+        ConfigField(SentinelConfig.JSON_DATABASE_SPOOL_SYNC, "spoolSync",
+            boolean, default = False))
+    __slots__ = tuple(field.attribute for field in FIELDS)
+
+    def _check(self):
+        if self.pageSize is not None and self.pageSize & (self.pageSize - 1):
+            return [(SentinelConfig.JSON_DATABASE_PAGE_SIZE, 
+                "Expected a power of two, got " + str(self.pageSize) + ".")]
+        return []
+
+class WaveformConfig(ConfigSection):
+    """
+    A waveform of the simulated DAQ backend.
+    """
+
+    FIELDS = (
+        ConfigField(SimulatedMcc118.WAVEFORM_TYPE, "type",
+            oneOf(*SimulatedMcc118.WAVEFORM_TYPES),
+            default = SimulatedMcc118.WAVEFORM_SINE),
+        ConfigField(SimulatedMcc118.WAVEFORM_AMPLITUDE, "amplitude",
+            number(), default = 1.0),
+        ConfigField(SimulatedMcc118.WAVEFORM_FREQUENCY, "frequency",
+            number(minimum = 0), default = 1.0),
+        ConfigField(SimulatedMcc118.WAVEFORM_OFFSET, "offset",
+            number(), default = 0.0),
+        ConfigField(SimulatedMcc118.WAVEFORM_NOISE, "noise",
+            number(minimum = 0), default = 0.0))
+    __slots__ = tuple(field.attribute for field in FIELDS)
+
+class BoardConfig(ConfigSection):
+    """
+    An entry of the JSON_DAQ_BOARDS list.
+    """
+
+    FIELDS = (
+        ConfigField(SentinelConfig.JSON_DAQ_ADDRESS, "address",
+            boardAddress),
+        ConfigField(SentinelConfig.JSON_DAQ_WAVEFORMS, "waveforms",
+            mappingOf(channelNumber, WaveformConfig), default = ()))
+    __slots__ = tuple(field.attribute for field in FIELDS)
+
+class DaqConfig(ConfigSection):
+    """
+    The JSON_DAQ_CONFIG section. If JSON_DAQ_BOARDS is not given, boards holds
+    a single board with the JSON_DAQ_ADDRESS and JSON_DAQ_WAVEFORMS of this 
+    section.
+    """
+
+    FIELDS = (
+        ConfigField(SentinelConfig.JSON_DAQ_BACKEND, "backend",
+            oneOf(DaqBackend.BACKEND_MCC118, DaqBackend.BACKEND_SIMULATED),
+            default = DaqBackend.BACKEND_MCC118),
+        ConfigField(SentinelConfig.JSON_DAQ_ADDRESS, "address",
+            boardAddress),
+        ConfigField(SentinelConfig.JSON_DAQ_WAVEFORMS, "waveforms",
+            mappingOf(channelNumber, WaveformConfig), default = ()),
+        ConfigField(SentinelConfig.JSON_DAQ_BOARDS, "boards",
+            listOf(BoardConfig, minimumLength = 1)),
+        ConfigField(SentinelConfig.JSON_ACQUISITION_BUFFER, "bufferTime",
+            number(minimum = 0, exclusiveMinimum = True),
+            default = SentinelConfig.DEFAULT_ACQUISITION_BUFFER),
+        ConfigField(SentinelConfig.JSON_DAQ_READ_LATENCY, "readLatency",
+            number(minimum = 0, exclusiveMinimum = True),
+            default = SentinelConfig.DEFAULT_READ_LATENCY),
+        ConfigField(SentinelConfig.JSON_DAQ_READ_FILL_FRACTION, 
+            "readFillFraction",
+            number(minimum = 0, maximum = 1, exclusiveMinimum = True),
+            default = SentinelConfig.DEFAULT_READ_FILL_FRACTION))
+    __slots__ = tuple(field.attribute for field in FIELDS)
+
+    def __init__(self, values):
+        super().__init__(values)
+        if self.boards is None:
+            object.__setattr__(self, "boards", (BoardConfig({
+                key : value for key, value in values.items() 
+                if key in (
+                    SentinelConfig.JSON_DAQ_ADDRESS,
+                    SentinelConfig.JSON_DAQ_WAVEFORMS)}),))
+
+    def _check(self):
+        if self.boards is None:
+            return []
+        problems = []
+        if self.address is not None or self.waveforms:
+            problems.append((SentinelConfig.JSON_DAQ_BOARDS,
+                "Can not be combined with " + 
+                SentinelConfig.JSON_DAQ_ADDRESS + " and " +
+                SentinelConfig.JSON_DAQ_WAVEFORMS + 
+                ". Configure them per board."))
+        addresses = [board.address for board in self.boards]
+        if len(self.boards) > 1 and None in addresses:
+            problems.append((SentinelConfig.JSON_DAQ_BOARDS,
+                "Every board needs an " + SentinelConfig.JSON_DAQ_ADDRESS +
+                ", if more than one board is configured."))
+        elif len(set(addresses)) != len(addresses):
+            problems.append((SentinelConfig.JSON_DAQ_BOARDS,
+                "Board addresses have to be unique."))
+        return problems
+
+class ReductionConfig(ConfigSection):
+    """
+    A reduction of the JSON_MEASUREMENT_REDUCTIONS dictionary. The parameters,
+    that do not apply to the type of the reduction, are None.
+    """
+
+    FIELDS = (
+        ConfigField(StreamReducer.REDUCTION_TYPE, "type",
+            oneOf(*StreamReducer.TYPES), required = True),
+        ConfigField(StreamReducer.REDUCTION_FACTOR, "factor",
+            integer(minimum = 2), required = True),
+        ConfigField(StreamReducer.REDUCTION_TAPS, "taps",
+            integer(minimum = 1)),
+        ConfigField(StreamReducer.REDUCTION_CUTOFF, "cutoff",
+            number(minimum = 0, maximum = 1, exclusiveMinimum = True)),
+        ConfigField(StreamReducer.REDUCTION_WINDOW, "window",
+            oneOf(*FirDecimator.WINDOWS)),
+        ConfigField(StreamReducer.REDUCTION_STAGES, "stages",
+            integer(minimum = 1, maximum = 8)))
+    __slots__ = tuple(field.attribute for field in FIELDS)
+
+    def __init__(self, values):
+        super().__init__(values)
+
+        # Fill in the defaults of the parameters of the type.
+        if self.type == StreamReducer.TYPE_FIR:
+            if self.taps is None:
+                object.__setattr__(self, "taps", 
+                    StreamReducer.TAPS_PER_FACTOR * self.factor + 1)
+            if self.cutoff is None:
+                object.__setattr__(self, "cutoff", 
+                    StreamReducer.DEFAULT_CUTOFF)
+            if self.window is None:
+                object.__setattr__(self, "window", 
+                    StreamReducer.DEFAULT_WINDOW)
+        elif self.type == StreamReducer.TYPE_CIC and self.stages is None:
+            object.__setattr__(self, "stages", StreamReducer.DEFAULT_STAGES)
+
+    def _check(self):
+        applicable = {
+            StreamReducer.TYPE_FIR : (StreamReducer.REDUCTION_TAPS, 
+                StreamReducer.REDUCTION_CUTOFF, 
+                StreamReducer.REDUCTION_WINDOW),
+            StreamReducer.TYPE_CIC : (StreamReducer.REDUCTION_STAGES,) 
+            }.get(self.type, ())
+        return [(field.key, "Not applicable to reductions of type " + 
+                self.type + ".")
+            for field in self.FIELDS[2:]
+            if getattr(self, field.attribute) is not None and
+            field.key not in applicable]
+
+class TriggerConfig(ConfigSection):
+    """
+    The JSON_MEASUREMENT_TRIGGER object of a measurement configuration. The
+    pre- and post-trigger times are given in seconds.
+    """
+
+    FIELDS = (
+        ConfigField(CaptureGate.TRIGGER_SOURCE, "source",
+            string, required = True),
+        ConfigField(CaptureGate.TRIGGER_CONDITION, "condition",
+            oneOf(*CaptureGate.CONDITIONS), required = True),
+        ConfigField(CaptureGate.TRIGGER_THRESHOLD, "threshold",
+            number(), required = True),
+        ConfigField(CaptureGate.TRIGGER_PRE, "preTrigger",
+            number(minimum = 0), default = CaptureGate.DEFAULT_PRE),
+        ConfigField(CaptureGate.TRIGGER_POST, "postTrigger",
+            number(minimum = 0), default = CaptureGate.DEFAULT_POST))
+    __slots__ = tuple(field.attribute for field in FIELDS)
+
+    def _check(self):
+        if self.condition == CaptureGate.CONDITION_SLOPE and \
+            self.threshold == 0:
+            return [(CaptureGate.TRIGGER_THRESHOLD,
+                "Has to be nonzero for triggers of type " +
+                CaptureGate.CONDITION_SLOPE + ".")]
+        return []
+
+class MeasurementConfig(ConfigSection):
+    """
+    An entry of the JSON_MEASUREMENT_CONFIG list. The validated entries are
+    compiled into ExecutionPlan objects.
+    """
+
+    FIELDS = (
+        ConfigField(SentinelConfig.JSON_MEASUREMENT_NAME, "name",
+            string, required = True),
+        ConfigField(SentinelConfig.JSON_MEASUREMENT_CHANNELS, "channels",
+            mappingOf(channelNumber, string, minimumLength = 1)),
+        ConfigField(SentinelConfig.JSON_MEASUREMENT_BOARD_CHANNELS, 
+            "boardChannels",
+            mappingOf(
+                boardAddress, 
+                mappingOf(channelNumber, string, minimumLength = 1),
+                minimumLength = 1)),
+        ConfigField(SentinelConfig.JSON_MEASUREMENT_SCANRATE, "scanRate",
+            number(minimum = 0, exclusiveMinimum = True), required = True),
+        ConfigField(SentinelConfig.JSON_MEASUREMENTS, "measurements",
+            mappingOf(string, string, minimumLength = 1), required = True),
+        ConfigField(SentinelConfig.JSON_MEASUREMENT_REDUCTIONS, "reductions",
+            mappingOf(string, ReductionConfig), default = ()),
+        ConfigField(SentinelConfig.JSON_MEASUREMENT_TRIGGER, "trigger",
+            TriggerConfig),
+        ConfigField(SentinelConfig.JSON_MEASUREMENT_OUT_STATE, "outputState",
+            boolean, default = False))
+    __slots__ = tuple(field.attribute for field in FIELDS)
+
+    def _check(self):
+        if (self.channels is None) == (self.boardChannels is None):
+            return [(SentinelConfig.JSON_MEASUREMENT_CHANNELS,
+                "Exactly one of " + SentinelConfig.JSON_MEASUREMENT_CHANNELS + 
+                " and " + SentinelConfig.JSON_MEASUREMENT_BOARD_CHANNELS + 
+                " has to be given.")]
+        if self.channels is not None:
+            key = SentinelConfig.JSON_MEASUREMENT_CHANNELS
+            tags = [tag for channel, tag in self.channels]
+        else:
+            key = SentinelConfig.JSON_MEASUREMENT_BOARD_CHANNELS
+            tags = [tag for address, channels in self.boardChannels 
+                for channel, tag in channels]
+        duplicates = sorted(set(tag for tag in tags if tags.count(tag) > 1))
+        if duplicates:
+            return [(key,
+                "Channel tags have to be unique, got " + 
+                ", ".join(duplicates) + " more than once.")]
+        return []
+
+class MeasurementControlConfig(ConfigSection):
+    """
+    The JSON_MEAS_CONTROL section.
+    """
+
+    # The GPIO pins are given in board numbering.
+    GPIO_PIN = integer(minimum = 1, maximum = 40)
+
+    # Count of the outputs, that drive the H-bridge.
+    OUTPUT_COUNT = 4
+
+    FIELDS = (
+        ConfigField(SentinelConfig.JSON_MEAS_CONTROL_SWITCH_INT, 
+            "switchIntervall",
+            number(minimum = 0, exclusiveMinimum = True), required = True),
+        ConfigField(SentinelConfig.JSON_MEAS_CONTROL_OUTPUT, "outputGpios",
+            listOf(GPIO_PIN, length = OUTPUT_COUNT, unique = True),
+            required = True),
+        ConfigField(SentinelConfig.JSON_MEAS_CONTROL_SEL, "selectionGpios",
+            listOf(GPIO_PIN, unique = True), default = ()))
+    __slots__ = tuple(field.attribute for field in FIELDS)
+
+class MetricsConfig(ConfigSection):
+    """
+    The JSON_METRICS_CONFIG section.
+    """
+
+    FIELDS = (
+        ConfigField(SentinelConfig.JSON_METRICS_PORT, "port",
+            integer(minimum = 0, maximum = 65535)),
+        ConfigField(SentinelConfig.JSON_METRICS_ADDRESS, "address",
+            string, default = MetricsExporter.DEFAULT_ADDRESS),
+        ConfigField(SentinelConfig.JSON_METRICS_SNAPSHOT_FILE, "snapshotFile",
+            string),
+        ConfigField(SentinelConfig.JSON_METRICS_SNAPSHOT_INTERVALL,
+            "snapshotIntervall",
+            number(minimum = 0, exclusiveMinimum = True),
+            default = MetricsExporter.DEFAULT_SNAPSHOT_INTERVALL))
+    __slots__ = tuple(field.attribute for field in FIELDS)
+
+class RootConfig(ConfigSection):
+    """
+    The root object of the configuration file.
+    """
+
+    FIELDS = (
+        ConfigField(SentinelConfig.JSON_DATABASE_CONFIG, "databaseConfig",
+            DatabaseConfig, required = True),
+        ConfigField(SentinelConfig.JSON_MEASUREMENT_CONFIG, 
+            "measurementConfigs",
+            listOf(MeasurementConfig, minimumLength = 1), required = True),
+        ConfigField(SentinelConfig.JSON_MEAS_CONTROL, "measurementControl",
+            MeasurementControlConfig, required = True),
+        ConfigField(SentinelConfig.JSON_DAQ_CONFIG, "daqConfig",
+            DaqConfig, default = DaqConfig({})),
+        ConfigField(SentinelConfig.JSON_METRICS_CONFIG, "metricsConfig",
+            MetricsConfig, default = MetricsConfig({})),
+        ConfigField(SentinelConfig.JSON_RUNTIME, "runtime",
+            oneOf(*SentinelConfig.RUNTIMES, ignoreCase = True),
+            default = SentinelConfig.RUNTIME_THREADS))
+    __slots__ = tuple(field.attribute for field in FIELDS)
+
+    ALIASES = {
+        SentinelConfig.JSON_MEASUREMENT_CONFIG_ALIAS :
+            SentinelConfig.JSON_MEASUREMENT_CONFIG }
+
+    def _check(self):
+        problems = []
+        names = set()
+        for index, measConfig in enumerate(self.measurementConfigs):
+            if measConfig.name in names:
+                problems.append((
+                    "[" + str(index) + "]." + 
+                    SentinelConfig.JSON_MEASUREMENT_NAME,
+                    "Duplicate configuration name " + measConfig.name + "."))
+            names.add(measConfig.name)
+        return [(SentinelConfig.JSON_MEASUREMENT_CONFIG + path, message)
+            for path, message in problems]
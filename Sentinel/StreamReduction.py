@@ -0,0 +1,349 @@
+"""
+This program has been created as part of the "Mikrosystemtechnik Labor" lecture
+at the "Institut für Sensor und Aktuator Systeme" TU Wien.
+This module reduces the sample rate of measurements before they are stored. The
+blocks of a measurement are put back into the order of the scan by a
+BlockSequencer, as the processing workers finish them in any order, and are
+then decimated as one continuous stream: The state of the filters is carried
+from block to block, so the result does not depend on the size of the blocks.
+Block average, windowed sinc FIR and CIC decimation are computed as FIR filter,
+that is evaluated only at the retained samples. The min/max envelope keeps the
+minimum and the maximum of every window.
+
+Author: David FREISMUTH
+Date: DEC 2019
+License:
+"""
+
+# Third party imports
+import numpy as np
+from numpy.lib.stride_tricks import as_strided
+
+# Project imports
+from BlockSequencer import BlockSequencer
+from MeasurementTransport import MeasurementBlock
+
+def averageKernel(factor):
+    """
+    Returns the taps of a block average over factor samples.
+    """
+
+    return np.full(factor, 1.0 / factor)
+
+def cicKernel(factor, stages):
+    """
+    Returns the taps of a CIC decimator with differential delay 1. The impulse
+    response of stages cascaded integrator and comb sections is the boxcar of
+    length factor, convolved stages times with itself. It is normalized to a
+    gain of 1. Evaluating it as FIR filter avoids the unbounded growth of the
+    integrators, which would cost precision with floating point values.
+    """
+
+    kernel = np.ones(1)
+    for stage in range(stages):
+        kernel = np.convolve(kernel, np.ones(factor))
+    return kernel / kernel.sum()
+
+def windowedSincKernel(factor, taps, cutoff, window):
+    """
+    Returns the taps of a windowed sinc low pass for decimation by factor.
+
+    Parameters:
+    factor (int): The decimation factor.
+
+    taps (int): The length of the filter.
+
+    cutoff (float): The cutoff frequency as fraction of the Nyquist frequency
+    after decimation.
+
+    window (string): One of FirDecimator.WINDOWS.
+    """
+
+    # Cutoff frequency in cycles per input sample.
+    frequency = cutoff * 0.5 / factor
+    n = np.arange(taps) - (taps - 1) / 2.0
+    kernel = 2.0 * frequency * np.sinc(2.0 * frequency * n) * \
+        FirDecimator.WINDOWS[window](taps)
+    return kernel / kernel.sum()
+
+class FirDecimator:
+    """
+    Filters a stream of values with an FIR filter and keeps every factor-th
+    output. Output k is computed from the input values k * factor up to
+    k * factor + taps - 1, counted from the start of the stream.
+    """
+
+    # Window functions of the windowed sinc filters.
+    WINDOWS = {
+        "Hamming" : np.hamming,
+        "Hann" : np.hanning,
+        "Blackman" : np.blackman }
+
+    def __init__(self, kernel, factor):
+        """
+        Parameters:
+        kernel (ndarray): The taps of the filter.
+
+        factor (int): The decimation factor.
+        """
+
+        # The taps are reversed, so the filter is a dot product with the
+        # window of input values.
+        self.__taps = np.ascontiguousarray(kernel[::-1], dtype = np.float64)
+        self.factor = int(factor)
+
+        # Output k belongs to the center of its input window. Offset of the
+        # center of the first window from the start of the stream, in input
+        # samples.
+        self.delay = (len(kernel) - 1) / 2.0
+
+        # Count of output values per factor input values.
+        self.outputsPerFactor = 1
+
+        # Input values, that are needed for the next outputs.
+        self.__buffer = np.empty(0)
+
+    def reset(self):
+        """
+        Discards the state, so the next value starts a new stream.
+        """
+
+        self.__buffer = np.empty(0)
+
+    def process(self, values):
+        """
+        Appends values to the stream.
+
+        Returns:
+        The outputs, whose input windows are complete.
+        """
+
+        buffer = np.concatenate((self.__buffer, values)) \
+            if len(self.__buffer) else np.asarray(values, dtype = np.float64)
+        tapCount = len(self.__taps)
+        if len(buffer) < tapCount:
+            self.__buffer = buffer.copy()
+            return np.empty(0)
+
+        # A (outputs x taps) view of the input windows, without copying.
+        buffer = np.ascontiguousarray(buffer)
+        count = (len(buffer) - tapCount) // self.factor + 1
+        windows = as_strided(
+            buffer,
+            shape = (count, tapCount),
+            strides = (self.factor * buffer.strides[0], buffer.strides[0]),
+            writeable = False)
+        outputs = windows @ self.__taps
+        self.__buffer = buffer[count * self.factor:].copy()
+        return outputs
+
+class MinMaxDecimator:
+    """
+    Keeps the minimum and the maximum of every window of factor values, in the
+    order they have been acquired. The envelope of the stream is preserved,
+    with two values per window.
+    """
+
+    def __init__(self, factor):
+        """
+        Parameters:
+        factor (int): The count of values per window.
+        """
+
+        self.factor = int(factor)
+
+        # The values of window k are stored at the start and the middle of
+        # the window.
+        self.delay = 0.0
+        self.outputsPerFactor = 2
+
+        # Values of the incomplete window.
+        self.__buffer = np.empty(0)
+
+    def reset(self):
+        """
+        Discards the state, so the next value starts a new stream.
+        """
+
+        self.__buffer = np.empty(0)
+
+    def process(self, values):
+        """
+        Appends values to the stream.
+
+        Returns:
+        Minimum and maximum of every completed window.
+        """
+
+        buffer = np.concatenate((self.__buffer, values)) \
+            if len(self.__buffer) else np.asarray(values, dtype = np.float64)
+        count = len(buffer) // self.factor
+        self.__buffer = buffer[count * self.factor:].copy()
+        if count == 0:
+            return np.empty(0)
+
+        windows = buffer[:count * self.factor].reshape(count, self.factor)
+        minimumIndex = windows.argmin(axis = 1)
+        maximumIndex = windows.argmax(axis = 1)
+        rows = np.arange(count)
+        minimum = windows[rows, minimumIndex]
+        maximum = windows[rows, maximumIndex]
+        minimumFirst = minimumIndex <= maximumIndex
+        outputs = np.empty((count, 2))
+        outputs[:, 0] = np.where(minimumFirst, minimum, maximum)
+        outputs[:, 1] = np.where(minimumFirst, maximum, minimum)
+        return outputs.reshape(-1)
+
+class StreamReducer:
+    """
+    Reduces the blocks of one measurement. Blocks of the same scan are put
+    into the order of their first index and decimated as one stream. Blocks of
+    a new scan start a new stream.
+    """
+
+    # Keys of a reduction in the JSON_MEASUREMENT_REDUCTIONS configuration.
+    REDUCTION_TYPE = "Type"
+    REDUCTION_FACTOR = "Factor"
+    REDUCTION_TAPS = "Taps"
+    REDUCTION_CUTOFF = "Cutoff"
+    REDUCTION_WINDOW = "Window"
+    REDUCTION_STAGES = "Stages"
+
+    # Valid values of REDUCTION_TYPE.
+    TYPE_AVERAGE = "Average"
+    TYPE_FIR = "Fir"
+    TYPE_CIC = "Cic"
+    TYPE_MIN_MAX = "MinMax"
+    TYPES = (TYPE_AVERAGE, TYPE_FIR, TYPE_CIC, TYPE_MIN_MAX)
+
+    # Defaults of the FIR and CIC parameters. The default length of the FIR
+    # filter is TAPS_PER_FACTOR * factor + 1.
+    TAPS_PER_FACTOR = 16
+    DEFAULT_CUTOFF = 0.8
+    DEFAULT_WINDOW = "Hamming"
+    DEFAULT_STAGES = 3
+
+    def __init__(self, createDecimator, gapCounter = None, lateCounter = None):
+        """
+        Parameters:
+        createDecimator (function): Returns a new FirDecimator or
+        MinMaxDecimator. Called once per scan.
+
+        gapCounter (Counter): Optional counter of skipped gaps.
+
+        lateCounter (Counter): Optional counter of dropped blocks, that
+        arrived after their stream has moved on.
+        """
+
+        self.__sequencer = BlockSequencer(
+            lambda block: _ReductionStream(
+                block.name,
+                block.scanStartTime,
+                block.rate,
+                createDecimator()),
+            gapCounter,
+            lateCounter)
+
+    @staticmethod
+    def decimatorFactory(reduction):
+        """
+        Returns a function, that creates a decimator for a reduction. The
+        taps of the filter are computed once.
+
+        Parameters:
+        reduction (ReductionConfig): The validated reduction.
+        """
+
+        factor = reduction.factor
+        if reduction.type == StreamReducer.TYPE_MIN_MAX:
+            return lambda: MinMaxDecimator(factor)
+        if reduction.type == StreamReducer.TYPE_AVERAGE:
+            kernel = averageKernel(factor)
+        elif reduction.type == StreamReducer.TYPE_CIC:
+            kernel = cicKernel(factor, reduction.stages)
+        else:
+            kernel = windowedSincKernel(
+                factor,
+                reduction.taps,
+                reduction.cutoff,
+                reduction.window)
+        return lambda: FirDecimator(kernel, factor)
+
+    def push(self, block, ordered = False):
+        """
+        Adds a block.
+
+        Parameters:
+        block (MeasurementBlock): The block.
+
+        ordered (bool): If True, the blocks of the measurement are pushed in
+        order, and gaps between them are intended, i.e. by a trigger.
+
+        Returns:
+        A list of reduced MeasurementBlock objects. May be empty.
+        """
+
+        return self.__sequencer.push(
+            block.scanStartTime,
+            block.firstIndex,
+            len(block),
+            block,
+            ordered)
+
+    def flush(self):
+        """
+        Reduces the blocks, that are held back, as if the missing blocks have
+        been lost, and ends all streams. Values of incomplete windows are
+        discarded.
+
+        Returns:
+        A list of reduced MeasurementBlock objects.
+        """
+
+        return self.__sequencer.flush()
+
+class _ReductionStream:
+    """
+    The state of the reduction of one scan of a measurement.
+    """
+
+    def __init__(self, name, scanStartTime, rate, decimator):
+        self.name = name
+        self.scanStartTime = scanStartTime
+        self.rate = rate
+        self.decimator = decimator
+        self.outputRate = rate * decimator.outputsPerFactor / decimator.factor
+        self.restart(0)
+
+    def restart(self, index):
+        """
+        Starts the stream at the input index index. The filter state is
+        discarded. The first output of the stream belongs to the center of
+        its input window.
+        """
+
+        self.decimator.reset()
+        self.outputStartTime = self.scanStartTime + \
+            (index + self.decimator.delay) / self.rate
+        self.outputIndex = 0
+
+    def process(self, block):
+        """
+        Decimates the next block of the stream.
+
+        Returns:
+        A list with the reduced block, or an empty list.
+        """
+
+        values = self.decimator.process(block.values)
+        if len(values) == 0:
+            return []
+        reduced = MeasurementBlock(
+            self.name,
+            self.outputStartTime,
+            self.outputRate,
+            self.outputIndex,
+            values,
+            block.trace)
+        self.outputIndex += len(values)
+        return [reduced]
@@ -0,0 +1,278 @@
+"""
+This program has been created as part of the "Mikrosystemtechnik Labor" lecture
+at the "Institut für Sensor und Aktuator Systeme" TU Wien.
+This module stores the values of a measurement configuration only around
+trigger events. A trigger condition is evaluated on one measurement of the
+configuration, vectorized over whole blocks. The blocks are kept in a pre-
+trigger ring, that holds the values of the last pre-trigger time, until they
+are either captured or dropped. Every event captures the values of all
+measurements of the configuration from the pre-trigger time before to the
+post-trigger time after the triggering sample. Overlapping event windows are
+merged, so every value is stored at most once.
+
+Author: David FREISMUTH
+Date: DEC 2019
+License:
+"""
+
+# Python imports
+from collections import deque
+
+# Third party imports
+import numpy as np
+
+# Project imports
+from BlockSequencer import BlockSequencer
+from MeasurementTransport import MeasurementBlock
+
+class CaptureGate:
+    """
+    Passes the values of one measurement configuration, that lie within the
+    event windows of its trigger. The batches of a scan are put into the
+    order of their first index, as the trigger keeps state from block to
+    block. Batches of a new scan start with an empty pre-trigger ring.
+    """
+
+    # Keys of a trigger in the JSON_MEASUREMENT_TRIGGER configuration.
+    TRIGGER_SOURCE = "Source"
+    TRIGGER_CONDITION = "Condition"
+    TRIGGER_THRESHOLD = "Threshold"
+    TRIGGER_PRE = "PreTrigger"
+    TRIGGER_POST = "PostTrigger"
+
+    # Valid values of TRIGGER_CONDITION. Level triggers on every value at or
+    # above the threshold. The edges trigger, when the value crosses the
+    # threshold. Slope triggers, when the change of the value per second
+    # reaches the threshold. A negative threshold triggers on falling slopes.
+    CONDITION_LEVEL = "Level"
+    CONDITION_RISING_EDGE = "RisingEdge"
+    CONDITION_FALLING_EDGE = "FallingEdge"
+    CONDITION_SLOPE = "Slope"
+    CONDITIONS = (
+        CONDITION_LEVEL,
+        CONDITION_RISING_EDGE,
+        CONDITION_FALLING_EDGE,
+        CONDITION_SLOPE)
+
+    # Defaults of the pre- and post-trigger time in seconds.
+    DEFAULT_PRE = 0.1
+    DEFAULT_POST = 0.1
+
+    def __init__(
+        self,
+        sourceName,
+        trigger,
+        eventCounter = None,
+        capturedCounter = None,
+        gapCounter = None,
+        lateCounter = None):
+        """
+        Parameters:
+        sourceName (string): The table name of the measurement, the trigger
+        condition is evaluated on.
+
+        trigger (TriggerConfig): The validated trigger.
+
+        eventCounter (Counter): Optional counter of trigger events, that
+        opened a new event window.
+
+        capturedCounter (Counter): Optional counter of captured values.
+
+        gapCounter (Counter): Optional counter of skipped gaps.
+
+        lateCounter (Counter): Optional counter of dropped batches, that
+        arrived after their stream has moved on.
+        """
+
+        self.__sequencer = BlockSequencer(
+            lambda blocks: _CaptureStream(
+                sourceName,
+                trigger,
+                blocks[0].rate,
+                eventCounter,
+                capturedCounter),
+            gapCounter,
+            lateCounter)
+
+    def push(self, blocks):
+        """
+        Adds a batch, that holds a MeasurementBlock per measurement of the
+        configuration for the same acquired block.
+
+        Returns:
+        A list of the captured MeasurementBlock objects. May be empty. The
+        blocks of every measurement are in the order of the scan.
+        """
+
+        if not blocks:
+            return []
+        first = blocks[0]
+        return self.__sequencer.push(
+            first.scanStartTime,
+            first.firstIndex,
+            len(first),
+            blocks)
+
+    def flush(self):
+        """
+        Evaluates the batches, that are held back, as if the missing batches
+        have been lost, and ends all streams. Open event windows end with the
+        last received value.
+
+        Returns:
+        A list of the captured MeasurementBlock objects.
+        """
+
+        return self.__sequencer.flush()
+
+class _CaptureStream:
+    """
+    The trigger state of one scan of a measurement configuration. Indices are
+    counted from the start of the scan.
+    """
+
+    def __init__(self, sourceName, trigger, rate, eventCounter,
+        capturedCounter):
+        self.sourceName = sourceName
+        self.condition = trigger.condition
+        self.threshold = trigger.threshold
+        self.rate = rate
+        self.preCount = int(round(trigger.preTrigger * rate))
+        self.postCount = int(round(trigger.postTrigger * rate))
+        self.eventCounter = eventCounter
+        self.capturedCounter = capturedCounter
+        self.restart(0)
+
+    def restart(self, index):
+        """
+        Starts the stream at index. The pre-trigger ring and an open event
+        window are discarded.
+        """
+
+        # Batches with values, that have not been captured yet, but may
+        # still be needed as pre-trigger values, as (firstIndex, blocks)
+        # tuples.
+        self.ring = deque()
+
+        # The value of the source before the next batch, for edges and
+        # slopes. NaN never triggers.
+        self.lastValue = np.nan
+
+        # End of the last event window, exclusive, or None, if there has not
+        # been an event yet. The values up to capturedUntil have been captured
+        # or dropped.
+        self.captureEnd = None
+        self.capturedUntil = index
+
+    def process(self, blocks):
+        """
+        Evaluates the trigger on the next batch of the stream.
+
+        Returns:
+        The list of captured blocks.
+        """
+
+        firstIndex = blocks[0].firstIndex
+        endIndex = firstIndex + len(blocks[0])
+        self.ring.append((firstIndex, blocks))
+
+        windows = []
+        if self.captureEnd is not None and \
+            self.captureEnd > self.capturedUntil:
+            windows.append([self.capturedUntil, self.captureEnd])
+        for start, end in self.__eventWindows(blocks, firstIndex):
+            start = max(start, self.capturedUntil)
+            if windows and start <= windows[-1][1]:
+                windows[-1][1] = max(windows[-1][1], end)
+            else:
+                windows.append([start, end])
+            self.captureEnd = end
+
+        captured = []
+        for start, end in windows:
+            end = min(end, endIndex)
+            if start < end:
+                captured.extend(self.__capture(start, end))
+                self.capturedUntil = end
+
+        # Keep only the batches, that may still provide values for the
+        # pre-trigger time of later events.
+        keepFrom = max(self.capturedUntil, endIndex - self.preCount)
+        while self.ring and \
+            self.ring[0][0] + len(self.ring[0][1][0]) <= keepFrom:
+            self.ring.popleft()
+        return captured
+
+    def __eventWindows(self, blocks, firstIndex):
+        """
+        Returns the event windows of the batch as list of (start, end) tuples
+        in ascending order. Overlapping windows are merged.
+        """
+
+        source = next(
+            (block for block in blocks if block.name == self.sourceName),
+            None)
+        if source is None or len(source) == 0:
+            return []
+        values = source.values
+        previous = np.concatenate(([self.lastValue], values[:-1]))
+        self.lastValue = values[-1]
+
+        # Comparisons with NaN are False, so the first value of a stream does
+        # not trigger on edges and slopes.
+        with np.errstate(invalid = "ignore"):
+            if self.condition == CaptureGate.CONDITION_LEVEL:
+                fired = values >= self.threshold
+            elif self.condition == CaptureGate.CONDITION_RISING_EDGE:
+                fired = (previous < self.threshold) & \
+                    (values >= self.threshold)
+            elif self.condition == CaptureGate.CONDITION_FALLING_EDGE:
+                fired = (previous > self.threshold) & \
+                    (values <= self.threshold)
+            elif self.threshold > 0:
+                fired = (values - previous) * self.rate >= self.threshold
+            else:
+                fired = (values - previous) * self.rate <= self.threshold
+        indices = np.flatnonzero(fired) + firstIndex
+        if len(indices) == 0:
+            return []
+
+        # A trigger opens a new window, if its pre-trigger time starts after
+        # the end of the previous window. Otherwise it extends the window.
+        starts = indices - self.preCount
+        ends = indices + self.postCount + 1
+        previousEnd = starts[0] - 1 if self.captureEnd is None \
+            else self.captureEnd
+        previousEnds = np.concatenate(([previousEnd], ends[:-1]))
+        opening = np.flatnonzero(starts > previousEnds)
+        if self.eventCounter is not None and len(opening):
+            self.eventCounter.inc(len(opening))
+        if len(opening) == 0 or opening[0] != 0:
+            opening = np.concatenate(([0], opening))
+        closing = np.concatenate((opening[1:] - 1, [len(indices) - 1]))
+        return list(zip(starts[opening].tolist(), ends[closing].tolist()))
+
+    def __capture(self, start, end):
+        """
+        Returns the values between the indices start and end from the
+        pre-trigger ring, as one block per measurement and batch.
+        """
+
+        captured = []
+        for firstIndex, blocks in self.ring:
+            blockStart = max(start, firstIndex)
+            blockEnd = min(end, firstIndex + len(blocks[0]))
+            if blockStart >= blockEnd:
+                continue
+            for block in blocks:
+                captured.append(MeasurementBlock(
+                    block.name,
+                    block.scanStartTime,
+                    block.rate,
+                    blockStart,
+                    block.values[
+                        blockStart - firstIndex : blockEnd - firstIndex],
+                    block.trace))
+            if self.capturedCounter is not None:
+                self.capturedCounter.inc(blockEnd - blockStart)
+        return captured
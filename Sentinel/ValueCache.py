@@ -0,0 +1,177 @@
+"""
+This program has been created as part of the "Mikrosystemtechnik Labor" lecture
+at the "Institut für Sensor und Aktuator Systeme" TU Wien.
+This class implements the value cache of the database interface. The values
+of each measurement are appended to a numpy buffer, that is preallocated when
+the cache is constructed. Only the sample clock of each block is kept besides
+the values. So the memory used by the cache is fixed, and does not grow when
+the database can not keep up. If a block does not fit into the buffer of its
+measurement anymore, it is rejected, and the caller has to decide what to do.
+
+Author: David FREISMUTH
+Date: DEC 2019
+License:
+"""
+
+# Third party imports
+import numpy as np
+
+# Project imports
+from MeasurementTransport import MeasurementBlock
+
+class ValueCache:
+    """
+    Preallocated append buffers for the values of a set of measurements.
+    """
+
+    # The data type of the buffered values.
+    DTYPE = np.float64
+
+    def __init__(self, names, capacity):
+        """
+        Allocates the buffers.
+
+        Parameters:
+        names (list<string>): The names of the measurements.
+
+        capacity (int): The count of values, that can be buffered per
+        measurement.
+        """
+
+        self.capacity = int(capacity)
+        self.__buffers = {
+            name : np.empty(self.capacity, dtype = ValueCache.DTYPE)
+            for name in names }
+
+        # The count of values in each buffer.
+        self.__fillLevels = {name : 0 for name in names}
+
+        # The blocks in each buffer as (scanStartTime, rate, firstIndex,
+        # offset, count) tuples, in the order they have been appended.
+        self.__blocks = {name : [] for name in names}
+
+    def fits(self, blocks):
+        """
+        Checks, if all blocks of a batch fit into the cache.
+
+        Parameters:
+        blocks (list<MeasurementBlock>): The blocks.
+
+        Returns:
+        True if all blocks can be appended. False otherwise.
+
+        Throws:
+        KeyError: If a block belongs to an unknown measurement.
+        """
+
+        for name, count in ValueCache.__requiredCounts(blocks).items():
+            if self.__fillLevels[name] + count > self.capacity:
+                return False
+        return True
+
+    def exceedsCapacity(self, blocks):
+        """
+        Checks, if a batch of blocks is too large to ever fit into the cache,
+        even if it is empty.
+
+        Parameters:
+        blocks (list<MeasurementBlock>): The blocks.
+        """
+
+        return any(
+            count > self.capacity
+            for count in ValueCache.__requiredCounts(blocks).values())
+
+    def append(self, block):
+        """
+        Copies the values of a block into the buffer of its measurement.
+
+        Parameters:
+        block (MeasurementBlock): The block.
+
+        Returns:
+        True if the block has been appended. False if it does not fit into
+        the buffer.
+
+        Throws:
+        KeyError: If the block belongs to an unknown measurement.
+        """
+
+        count = len(block)
+        offset = self.__fillLevels[block.name]
+        if offset + count > self.capacity:
+            return False
+        self.__buffers[block.name][offset:offset + count] = block.values
+        self.__fillLevels[block.name] = offset + count
+        self.__blocks[block.name].append(
+            (block.scanStartTime, block.rate, block.firstIndex, offset, count))
+        return True
+
+    def blocks(self):
+        """
+        Returns the buffered blocks. The values of the returned blocks are
+        views into the buffers, and only valid until clear() is called.
+
+        Returns:
+        A dict, that maps from the measurement name to a list of
+        MeasurementBlock objects in the order they have been appended.
+        Measurements without values are left out.
+        """
+
+        result = {}
+        for name, blockList in self.__blocks.items():
+            if not blockList:
+                continue
+            buffer = self.__buffers[name]
+            result[name] = [
+                MeasurementBlock(
+                    name,
+                    scanStartTime,
+                    rate,
+                    firstIndex,
+                    buffer[offset:offset + count])
+                for scanStartTime, rate, firstIndex, offset, count
+                in blockList]
+        return result
+
+    def clear(self):
+        """
+        Removes all values from the cache. The buffers are kept.
+        """
+
+        for name in self.__fillLevels:
+            self.__fillLevels[name] = 0
+            self.__blocks[name] = []
+
+    def sampleCount(self):
+        """
+        Returns the count of buffered values of all measurements.
+        """
+
+        return sum(self.__fillLevels.values())
+
+    def isEmpty(self):
+        """
+        Returns wether the cache contains no values.
+        """
+
+        return self.sampleCount() == 0
+
+    @staticmethod
+    def __requiredCounts(blocks):
+        """
+        Returns a dict, that maps from measurement name to the count of values
+        of the blocks of the measurement.
+        """
+
+        required = {}
+        for block in blocks:
+            required[block.name] = required.get(block.name, 0) + len(block)
+        return required
+
+    def nbytes(self):
+        """
+        Returns the memory allocated by the buffers in bytes.
+        """
+
+        return sum(buffer.nbytes for buffer in self.__buffers.values())
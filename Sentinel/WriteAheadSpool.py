@@ -0,0 +1,384 @@
+"""
+This program has been created as part of the "Mikrosystemtechnik Labor" lecture
+at the "Institut für Sensor und Aktuator Systeme" TU Wien.
+This class implements a write-ahead spool for processed blocks. Every block is
+appended to a memory-mapped log file, before it is cached for the writeback to
+SQLite. Once a writeback has been committed, the spooled blocks up to it are
+marked as committed, and their space is reused. After a crash, the blocks that
+have not been committed are read from the spool and written to SQLite again.
+
+The log file consists of a header and a ring of records. Each record carries a
+sequence number and a CRC32 checksum, so records that have been written only
+partially, or that are left over from an earlier lap of the ring, are detected.
+The header holds the sequence number of the last committed record and the
+offset of the first uncommitted record. It is updated after the SQLite commit.
+So blocks, that have been committed to SQLite right before a crash, are still
+pending after a restart. The database interface records the sequence number of
+its commits in the segment catalog, and skips them.
+
+Author: David FREISMUTH
+Date: DEC 2019
+License:
+"""
+
+# Python imports
+from collections import deque
+import mmap
+import os
+import struct
+import zlib
+
+# Third party imports
+import numpy as np
+
+# Project imports
+from MeasurementTransport import MeasurementBlock
+
+class WriteAheadSpool:
+    """
+    Memory-mapped, checksummed ring log of MeasurementBlock objects. Not thread
+    safe. The caller has to serialize append() and commit().
+    """
+
+    # Header: magic, version, capacity, committed sequence, head offset.
+    HEADER_FORMAT = "<8sIxxxxQQQ"
+    HEADER_SIZE = 64
+    MAGIC = b"SNTLSPL1"
+    VERSION = 1
+
+    # Record header: magic, payload length, sequence, checksum. The checksum
+    # covers the sequence number and the payload.
+    RECORD_FORMAT = "<IIQIxxxx"
+    RECORD_HEADER_SIZE = struct.calcsize(RECORD_FORMAT)
+    RECORD_MAGIC = 0x53524543
+
+    # Written, when the next record did not fit at the end of the ring. The
+    # reader continues at the beginning of the ring.
+    WRAP_MAGIC = 0x57524150
+
+    # Payload: t0, rate, first index, count, length of the name. Followed by
+    # the name and the values.
+    PAYLOAD_FORMAT = "<ddqIH"
+    PAYLOAD_HEADER_SIZE = struct.calcsize(PAYLOAD_FORMAT)
+
+    # Data type of the spooled values.
+    SAMPLE_DTYPE = "<f8"
+
+    # Records are aligned to this count of bytes.
+    ALIGNMENT = 8
+
+    def __init__(self, fileName, capacity, sync = False):
+        """
+        Opens the spool file, or creates it. The uncommitted records of an
+        existing spool file are kept, and can be read with pending().
+
+        Parameters:
+        fileName (string): Path of the spool file.
+
+        capacity (int): Size of the spool file in bytes. An existing spool
+        file keeps its size.
+
+        sync (bool): If True, every append and commit is flushed to disk.
+        Otherwise the spooled blocks survive a crash of the process, but not
+        a power failure.
+        """
+
+        self.__sync = sync
+        exists = os.path.isfile(fileName) and \
+            os.path.getsize(fileName) > WriteAheadSpool.HEADER_SIZE
+        self.__file = open(fileName, "r+b" if exists else "w+b")
+        if not exists:
+            self.__file.truncate(WriteAheadSpool.__align(int(capacity)))
+        self.__map = mmap.mmap(self.__file.fileno(), 0)
+        self.capacity = len(self.__map)
+
+        committedSequence = 0
+        headOffset = WriteAheadSpool.HEADER_SIZE
+        if exists:
+            magic, version, capacity, committedSequence, headOffset = \
+                struct.unpack_from(WriteAheadSpool.HEADER_FORMAT, self.__map)
+            if magic != WriteAheadSpool.MAGIC or \
+                version != WriteAheadSpool.VERSION or \
+                capacity != self.capacity or \
+                headOffset < WriteAheadSpool.HEADER_SIZE or \
+                headOffset >= self.capacity:
+                print(
+                    "Spool file " + fileName + " is invalid. Its content is " +
+                    "discarded.")
+                self.__map[:] = bytes(self.capacity)
+                committedSequence = 0
+                headOffset = WriteAheadSpool.HEADER_SIZE
+        self.committedSequence = committedSequence
+
+        # Uncommitted records as [sequence number, offset, size] lists,
+        # ordered from oldest to newest.
+        self.__records = deque()
+        self.__writeOffset = headOffset
+        self.__pendingBlocks = []
+        self.__recover(headOffset)
+        self.nextSequence = self.committedSequence + \
+            len(self.__pendingBlocks) + 1
+        self.__writeHeader()
+
+    def pending(self):
+        """
+        Returns the blocks, that have been spooled but not committed before
+        the spool has been opened, as a list of (sequenceNumber, block) tuples
+        in the order they have been spooled.
+        """
+
+        return list(self.__pendingBlocks)
+
+    def fits(self, blocks):
+        """
+        Checks, if a batch of blocks can be appended.
+
+        Parameters:
+        blocks (list<MeasurementBlock>): The blocks.
+        """
+
+        records = list(self.__records)
+        writeOffset = self.__writeOffset
+        for block in blocks:
+            size = WriteAheadSpool.__recordSize(block)
+            offset = self.__findFreeRegion(size, records, writeOffset)
+            if offset is None:
+                return False
+            records.append([None, offset, size])
+            writeOffset = offset + size
+        return True
+
+    def append(self, block):
+        """
+        Appends a block to the spool.
+
+        Parameters:
+        block (MeasurementBlock): The block.
+
+        Returns:
+        The sequence number of the block, or None if the spool is full.
+        """
+
+        name = block.name.encode("utf-8")
+        values = np.ascontiguousarray(
+            block.values, dtype = WriteAheadSpool.SAMPLE_DTYPE)
+        size = WriteAheadSpool.__recordSize(block)
+        offset = self.__findFreeRegion(size, self.__records, self.__writeOffset)
+        if offset is None:
+            return None
+
+        # Mark the end of the ring, if the record is continued at the start.
+        if offset < self.__writeOffset and \
+            self.__writeOffset + 4 <= self.capacity:
+            struct.pack_into(
+                "<I", self.__map, self.__writeOffset,
+                WriteAheadSpool.WRAP_MAGIC)
+
+        sequence = self.nextSequence
+        payloadHeader = struct.pack(
+            WriteAheadSpool.PAYLOAD_FORMAT,
+            block.scanStartTime, block.rate, block.firstIndex, len(values),
+            len(name)) + name
+        payloadOffset = offset + WriteAheadSpool.RECORD_HEADER_SIZE
+        valueOffset = payloadOffset + len(payloadHeader)
+        self.__map[payloadOffset:valueOffset] = payloadHeader
+        self.__map[valueOffset:valueOffset + values.nbytes] = \
+            values.view(np.uint8)
+
+        # The checksum is calculated from the source data, to avoid copying
+        # the record out of the map again.
+        checksum = zlib.crc32(struct.pack("<Q", sequence))
+        checksum = zlib.crc32(payloadHeader, checksum)
+        checksum = zlib.crc32(values, checksum)
+        struct.pack_into(
+            WriteAheadSpool.RECORD_FORMAT, self.__map, offset,
+            WriteAheadSpool.RECORD_MAGIC, len(payloadHeader) + values.nbytes,
+            sequence, checksum)
+
+        if self.__sync:
+            self.__flush(offset, size)
+        self.__records.append([sequence, offset, size])
+        self.__writeOffset = offset + size
+        self.nextSequence += 1
+        return sequence
+
+    def commit(self, sequence):
+        """
+        Marks all records up to a sequence number as committed, so their space
+        can be reused. Has to be called after the blocks have been committed
+        to SQLite.
+
+        Parameters:
+        sequence (int): The sequence number of the last committed block. If
+        it is beyond the last appended block, the next block continues after
+        it.
+        """
+
+        if sequence <= self.committedSequence:
+            return
+        while self.__records and self.__records[0][0] <= sequence:
+            self.__records.popleft()
+        self.committedSequence = sequence
+        self.nextSequence = max(self.nextSequence, sequence + 1)
+        self.__writeHeader()
+
+    def pendingCount(self):
+        """
+        Returns the count of records, that have not been committed.
+        """
+
+        return len(self.__records)
+
+    def close(self):
+        """
+        Flushes and closes the spool file.
+        """
+
+        self.__map.flush()
+        self.__map.close()
+        self.__file.close()
+
+    def __recover(self, headOffset):
+        """
+        Reads the uncommitted records, starting at the head offset. Stops at
+        the first record, that is invalid or does not continue the sequence.
+        """
+
+        offset = headOffset
+        expectedSequence = self.committedSequence + 1
+        wrapped = False
+        while True:
+            if offset + 4 > self.capacity or \
+                struct.unpack_from("<I", self.__map, offset)[0] == \
+                WriteAheadSpool.WRAP_MAGIC:
+                if wrapped:
+                    break
+                offset = WriteAheadSpool.HEADER_SIZE
+                wrapped = True
+                continue
+            if wrapped and offset >= headOffset:
+                break
+
+            record = self.__readRecord(offset, expectedSequence)
+            if record is None:
+                break
+            block, size = record
+            self.__records.append([expectedSequence, offset, size])
+            self.__pendingBlocks.append((expectedSequence, block))
+            expectedSequence += 1
+            offset += size
+        self.__writeOffset = offset
+
+    def __readRecord(self, offset, expectedSequence):
+        """
+        Reads the record at offset. Returns a (block, size) tuple, or None if
+        there is no valid record with the expected sequence number.
+        """
+
+        if offset + WriteAheadSpool.RECORD_HEADER_SIZE > self.capacity:
+            return None
+        magic, payloadLength, sequence, checksum = struct.unpack_from(
+            WriteAheadSpool.RECORD_FORMAT, self.__map, offset)
+        payloadOffset = offset + WriteAheadSpool.RECORD_HEADER_SIZE
+        if magic != WriteAheadSpool.RECORD_MAGIC or \
+            sequence != expectedSequence or \
+            payloadLength < WriteAheadSpool.PAYLOAD_HEADER_SIZE or \
+            payloadOffset + payloadLength > self.capacity:
+            return None
+        payload = self.__map[payloadOffset:payloadOffset + payloadLength]
+        if zlib.crc32(payload, zlib.crc32(struct.pack("<Q", sequence))) != \
+            checksum:
+            return None
+
+        scanStartTime, rate, firstIndex, count, nameLength = \
+            struct.unpack_from(WriteAheadSpool.PAYLOAD_FORMAT, payload)
+        nameEnd = WriteAheadSpool.PAYLOAD_HEADER_SIZE + nameLength
+        if nameEnd + count * 8 != payloadLength:
+            return None
+        block = MeasurementBlock(
+            payload[WriteAheadSpool.PAYLOAD_HEADER_SIZE:nameEnd].decode(
+                "utf-8"),
+            scanStartTime,
+            rate,
+            firstIndex,
+            np.frombuffer(
+                payload, dtype = WriteAheadSpool.SAMPLE_DTYPE, offset = nameEnd
+                ).astype(np.float64))
+        size = WriteAheadSpool.__align(
+            WriteAheadSpool.RECORD_HEADER_SIZE + payloadLength)
+        return (block, size)
+
+    def __findFreeRegion(self, size, records, writeOffset):
+        """
+        Returns the offset of a free contiguous region of size bytes, or None
+        if there is none.
+        """
+
+        start = WriteAheadSpool.HEADER_SIZE
+        if size > self.capacity - start:
+            return None
+        if not records:
+            # Spool is empty. Continue behind the last record, or start at
+            # the beginning.
+            if writeOffset + size <= self.capacity:
+                return writeOffset
+            return start
+
+        headOffset = records[0][1]
+        if writeOffset > headOffset:
+            # Uncommitted region does not wrap.
+            if writeOffset + size <= self.capacity:
+                return writeOffset
+            if start + size <= headOffset:
+                return start
+            return None
+        else:
+            # Uncommitted region wraps.
+            if writeOffset + size <= headOffset:
+                return writeOffset
+            return None
+
+    def __writeHeader(self):
+        """
+        Writes the committed sequence number and the offset of the first
+        uncommitted record to the header.
+        """
+
+        if self.__records:
+            headOffset = self.__records[0][1]
+        else:
+            headOffset = self.__writeOffset
+        if headOffset >= self.capacity:
+            headOffset = WriteAheadSpool.HEADER_SIZE
+        struct.pack_into(
+            WriteAheadSpool.HEADER_FORMAT, self.__map, 0,
+            WriteAheadSpool.MAGIC, WriteAheadSpool.VERSION, self.capacity,
+            self.committedSequence, headOffset)
+        if self.__sync:
+            self.__flush(0, WriteAheadSpool.HEADER_SIZE)
+
+    def __flush(self, offset, size):
+        """
+        Flushes a region of the map to disk. The region is extended to whole
+        pages, as required by mmap.
+        """
+
+        start = offset - offset % mmap.ALLOCATIONGRANULARITY
+        self.__map.flush(start, offset + size - start)
+
+    @staticmethod
+    def __recordSize(block):
+        """
+        Returns the size of the record of a block in bytes.
+        """
+
+        return WriteAheadSpool.__align(
+            WriteAheadSpool.RECORD_HEADER_SIZE +
+            WriteAheadSpool.PAYLOAD_HEADER_SIZE +
+            len(block.name.encode("utf-8")) +
+            len(block.values) * 8)
+
+    @staticmethod
+    def __align(size):
+        return (size + WriteAheadSpool.ALIGNMENT - 1) // \
+            WriteAheadSpool.ALIGNMENT * WriteAheadSpool.ALIGNMENT
@@ -2,7 +2,6 @@
     This file contains helper functions for the MCC DAQ HAT Python examples.
 """
 from __future__ import print_function
-from daqhats import hat_list, HatError
 
 
 def select_hat_device(filter_by_id):
@@ -26,6 +25,10 @@ def select_hat_device(filter_by_id):
         Exception: No HAT devices are found or an invalid address was selected.
 
     """
+    # Imported here, so the helpers below can be used without the daqhats
+    # library being installed.
+    from daqhats import hat_list, HatError
+
     selected_hat_address = None
 
     # Get descriptors for all of the available HAT devices.